@@ -0,0 +1,146 @@
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+
+import balance_columns
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import shutil
+import tempfile
+import unittest
+
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+
+
+def micros(dt):
+    return int(dt.timestamp() * 1000000)
+
+
+def balances_event(timestamp, account_id, *balances):
+    return {
+        "result": {
+            "timestamp": timestamp,
+            "balances": {account_id: {"balances": list(balances)}},
+        }
+    }
+
+
+class BalanceColumnsTest(unittest.TestCase):
+    def test_events_are_split_into_columns(self):
+        columns = balance_columns.BalanceColumns.from_events([
+            balances_event(
+                "2019-01-01T00:00:00Z",
+                "main_account",
+                {"account_address": "DEFAULT", "amount": "100"},
+                {"account_address": "ACCRUED_INTEREST", "amount": "0.12345",
+                 "value_time": "2019-01-02T00:00:00Z"},
+            ),
+            balances_event(
+                "2019-01-03T00:00:00Z",
+                "main_account",
+                {"account_address": "DEFAULT", "amount": "-5",
+                 "phase": "POSTING_PHASE_PENDING_OUTGOING"},
+            ),
+            {"result": {"timestamp": "2019-01-04T00:00:00Z", "logs": ["no balances"]}},
+        ])
+        self.assertEqual(columns.keys(), [
+            ("main_account", "ACCRUED_INTEREST", balance_columns.COMMITTED),
+            ("main_account", "DEFAULT", balance_columns.COMMITTED),
+            ("main_account", "DEFAULT", "POSTING_PHASE_PENDING_OUTGOING"),
+        ])
+        series = columns.series("main_account", "ACCRUED_INTEREST")
+        # An entry's own value_time takes precedence over the event timestamp.
+        self.assertEqual(list(series.timestamps), [micros(START + timedelta(days=1))])
+        self.assertEqual(list(series.amounts), [12345])
+        self.assertEqual(
+            columns.at("main_account", "DEFAULT", START + timedelta(days=5),
+                       phase="POSTING_PHASE_PENDING_OUTGOING"),
+            Decimal("-5"),
+        )
+
+    def test_appends_are_merged_in_time_order(self):
+        columns = balance_columns.BalanceColumns()
+        key = balance_columns.BalanceKey("main_account", "DEFAULT", balance_columns.COMMITTED)
+        columns.append(key, micros(START + timedelta(days=2)), "20")
+        columns.append(key, micros(START), "0")
+        self.assertEqual(columns.at("main_account", "DEFAULT", START + timedelta(days=1)), 0)
+        # Appending after a lookup merges with the columns already built.
+        columns.append(key, micros(START + timedelta(days=1)), "10")
+        columns.append(key, micros(START + timedelta(days=2)), "25")
+        series = columns.series("main_account", "DEFAULT")
+        self.assertEqual(
+            list(series.timestamps),
+            [micros(START + timedelta(days=day)) for day in [0, 1, 2, 2]],
+        )
+        # The amount reported last for a repeated timestamp stays last.
+        self.assertEqual(list(series.amounts), [0, 1000000, 2000000, 2500000])
+        self.assertEqual(columns.final("main_account"), {"DEFAULT": Decimal("25")})
+
+    def test_amounts_are_rounded_to_the_fixed_point_scale(self):
+        columns = balance_columns.BalanceColumns(decimal_places=2)
+        key = balance_columns.BalanceKey("main_account", "DEFAULT", balance_columns.COMMITTED)
+        columns.append(key, micros(START), "1.005")
+        columns.append(key, micros(START + timedelta(days=1)), "1.015")
+        self.assertEqual(list(columns.series("main_account", "DEFAULT").amounts), [100, 102])
+        self.assertEqual(
+            columns.at("main_account", "DEFAULT", START + timedelta(days=1)), Decimal("1.02"))
+
+    def test_lookup(self):
+        columns = balance_columns.BalanceColumns.from_events([
+            balances_event(
+                "2019-01-02T00:00:00Z", "main_account",
+                {"account_address": "DEFAULT", "amount": "10"}),
+            balances_event(
+                "2019-01-04T00:00:00Z", "main_account",
+                {"account_address": "DEFAULT", "amount": "40"}),
+        ])
+        for timestamp, expected in [
+            (START + timedelta(days=1), Decimal("10")),
+            ("2019-01-03T12:00:00Z", Decimal("10")),
+            (START + timedelta(days=3), Decimal("40")),
+            (START + timedelta(days=30), Decimal("40")),
+        ]:
+            self.assertEqual(columns.at("main_account", "DEFAULT", timestamp), expected, timestamp)
+        self.assertEqual(
+            list(columns.at_many("main_account", "DEFAULT", [
+                micros(START + timedelta(days=day)) for day in range(5)])),
+            [0, 1000000, 1000000, 4000000, 4000000],
+        )
+        with self.assertRaises(ValueError):
+            columns.at("main_account", "DEFAULT", datetime(2019, 1, 2))
+
+    def test_zero_before_the_first_change_and_for_unknown_balances(self):
+        columns = balance_columns.BalanceColumns.from_events([
+            balances_event(
+                "2019-01-02T00:00:00Z", "main_account",
+                {"account_address": "DEFAULT", "amount": "10"}),
+        ])
+        self.assertEqual(columns.at("main_account", "DEFAULT", START), Decimal(0))
+        self.assertEqual(columns.at("main_account", "PENALTIES", START), Decimal(0))
+        self.assertEqual(columns.at("other_account", "DEFAULT", START), Decimal(0))
+        self.assertEqual(
+            list(columns.at_many("other_account", "DEFAULT", [0, micros(START)])), [0, 0])
+        self.assertEqual(len(columns.series("other_account", "DEFAULT").timestamps), 0)
+        self.assertEqual(columns.final("other_account"), {})
+        self.assertEqual(balance_columns.BalanceColumns().keys(), [])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "balances.npz")
+        columns = balance_columns.BalanceColumns.from_events([
+            balances_event(
+                "2019-01-02T00:00:00Z", "main_account",
+                {"account_address": "DEFAULT", "amount": "10.5"},
+                {"account_address": "DUE", "amount": "3"}),
+        ], decimal_places=3)
+        columns.save(path)
+        loaded = balance_columns.BalanceColumns.load(path)
+        self.assertEqual(loaded.decimal_places, 3)
+        self.assertEqual(loaded.keys(), columns.keys())
+        self.assertEqual(
+            loaded.final("main_account"), {"DEFAULT": Decimal("10.5"), "DUE": Decimal("3")})
+
+
+if __name__ == "__main__":
+    unittest.main()
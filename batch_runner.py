@@ -0,0 +1,279 @@
+"""
+Runs many contract simulations against the core API on a worker pool.
+
+Results come back in the order the simulations were given, and every job is isolated: a job
+that raises or runs past its timeout is reported in its own BatchResult without affecting the
+others.
+
+Each simulation is sent as its own simulate request: the runner overlaps requests, it does not
+merge them. The core API fails a simulation as a whole, so folding several specs into one
+request would let one bad contract or instruction fail the others, and every spec's instructions
+address its own "main_account".
+
+The module can also be used from the command line with a JSON manifest:
+
+    python3 batch_runner.py manifest.json --output-dir results --workers 8
+
+    {
+        "core_api_url": "https://core-api...",
+        "auth_token": "...",
+        "simulations": [
+            {
+                "name": "loan_3000_2y",
+                "contract_file": "personal_loan/advanced_tutorial_contract.py",
+                "start": "2019-01-01T00:00:00+00:00",
+                "end": "2019-03-01T00:00:00+00:00",
+                "template_params": {...},
+                "instance_params": {...},
+                "internal_accounts": ["1", "12345"],
+                "instructions": [{"time": "2019-01-06T00:00:00+00:00", "instruction": {...}}]
+            }
+        ]
+    }
+
+core_api_url and auth_token can also be passed with --core-api-url / --auth-token or the
+VAULT_CORE_API_URL / VAULT_AUTH_TOKEN environment variables. Contract paths are relative to
+the manifest.
+"""
+import argparse
+import json
+import os
+import pickle
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import vault_caller
+
+DEFAULT_WORKERS = 4
+MAIN_ACCOUNT_ID = "main_account"
+
+SimulationSpec = namedtuple(
+    "SimulationSpec",
+    [
+        "name",
+        "contract_file",
+        "start",
+        "end",
+        "template_params",
+        "instance_params",
+        "instructions",
+        "internal_accounts",
+    ],
+    defaults=({}, {}, (), ("1",)),
+)
+
+BatchResult = namedtuple("BatchResult", ["name", "result", "error", "elapsed_seconds"])
+
+
+class SimulationTimeout(Exception):
+    pass
+
+
+def build_simulation(spec, contract_code):
+    """
+    Lays out the simulation the same way the product test suites do: the contract under test as
+    product version 1 with a "main_account" instance, plus one empty contract per internal account.
+    """
+    smart_contracts = [
+        {
+            "smart_contract_version_id": "1",
+            "code": contract_code,
+            "smart_contract_param_vals": spec.template_params,
+        }
+    ]
+    instructions = [
+        vault_caller.SimulationInstruction(
+            spec.start,
+            {
+                "create_account": {
+                    "id": MAIN_ACCOUNT_ID,
+                    "product_version_id": "1",
+                    "instance_param_vals": spec.instance_params,
+                }
+            },
+        )
+    ]
+    for i, account_id in enumerate(spec.internal_accounts, start=2):
+        smart_contracts.append({"smart_contract_version_id": str(i), "code": "api = '3.6.0'"})
+        instructions.append(
+            vault_caller.SimulationInstruction(
+                spec.start,
+                {"create_account": {"id": account_id, "product_version_id": str(i)}},
+            )
+        )
+    return {
+        "smart_contracts": smart_contracts,
+        "start_timestamp": spec.start,
+        "end_timestamp": spec.end,
+        "instructions": instructions + list(spec.instructions),
+    }
+
+
+def _run_job(client, spec, timeout):
+    started = time.monotonic()
+    try:
+        with open(spec.contract_file) as contract_file:
+            simulation = build_simulation(spec, contract_file.read())
+        if timeout is not None:
+            # Ask the server to give up at the same point the client will.
+            simulation["timeout"] = "%dS" % max(1, int(timeout))
+        result = []
+        for event in client.iter_simulate_contracts(**simulation):
+            result.append(event)
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise SimulationTimeout(
+                    "Simulation %s exceeded its %ss timeout" % (spec.name, timeout))
+        return BatchResult(spec.name, result, None, time.monotonic() - started)
+    except Exception as e:
+        return BatchResult(spec.name, None, e, time.monotonic() - started)
+
+
+# Each worker process builds its own client (and connection pool) in the pool initializer.
+_process_client = None
+
+
+def _init_process(client_kwargs):
+    global _process_client
+    _process_client = vault_caller.Client(**client_kwargs)
+
+
+def _run_process_job(spec, timeout):
+    result = _run_job(_process_client, spec, timeout)
+    if result.error is not None:
+        # Exceptions whose constructor needs more than their args can't be rebuilt in the parent
+        # process; send a description of those instead.
+        try:
+            pickle.loads(pickle.dumps(result.error))
+        except Exception:
+            result = result._replace(
+                error=RuntimeError("%s: %s" % (type(result.error).__name__, result.error)))
+    return result
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        *,
+        core_api_url,
+        auth_token,
+        workers=DEFAULT_WORKERS,
+        use_processes=False,
+        timeout=None,
+        **client_kwargs,
+    ):
+        self._client_kwargs = dict(
+            core_api_url=core_api_url, auth_token=auth_token, **client_kwargs)
+        self._workers = workers
+        self._use_processes = use_processes
+        self._timeout = timeout
+
+    def run(self, specs):
+        """
+        Runs every SimulationSpec and returns a list of BatchResult in the same order as specs.
+        """
+        specs = list(specs)
+        if self._use_processes:
+            with ProcessPoolExecutor(
+                max_workers=self._workers,
+                initializer=_init_process,
+                initargs=(self._client_kwargs,),
+            ) as executor:
+                futures = [executor.submit(_run_process_job, spec, self._timeout) for spec in specs]
+                return [future.result() for future in futures]
+
+        with vault_caller.Client(pool_size=self._workers, **self._client_kwargs) as client:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                futures = [
+                    executor.submit(_run_job, client, spec, self._timeout) for spec in specs
+                ]
+                return [future.result() for future in futures]
+
+
+def load_manifest(path):
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    specs = []
+    for simulation in manifest["simulations"]:
+        specs.append(
+            SimulationSpec(
+                name=simulation["name"],
+                contract_file=os.path.join(base_dir, simulation["contract_file"]),
+                start=datetime.fromisoformat(simulation["start"]),
+                end=datetime.fromisoformat(simulation["end"]),
+                template_params=simulation.get("template_params", {}),
+                instance_params=simulation.get("instance_params", {}),
+                instructions=[
+                    vault_caller.SimulationInstruction(
+                        datetime.fromisoformat(instruction["time"]), instruction["instruction"]
+                    )
+                    for instruction in simulation.get("instructions", [])
+                ],
+                internal_accounts=simulation.get("internal_accounts", ["1"]),
+            )
+        )
+    return manifest, specs
+
+
+def write_results(output_dir, results):
+    os.makedirs(output_dir, exist_ok=True)
+    summary = []
+    for i, result in enumerate(results):
+        file_name = "%04d_%s.json" % (i, re.sub(r"[^\w.-]", "_", result.name))
+        entry = {
+            "name": result.name,
+            "file": file_name,
+            "elapsed_seconds": round(result.elapsed_seconds, 3),
+            "error": None if result.error is None else "%s: %s" % (
+                type(result.error).__name__, result.error),
+        }
+        with open(os.path.join(output_dir, file_name), "w") as result_file:
+            json.dump({**entry, "result": result.result}, result_file, indent=2)
+        summary.append(entry)
+    with open(os.path.join(output_dir, "summary.json"), "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the simulations listed in a JSON manifest on a worker pool."
+    )
+    parser.add_argument("manifest")
+    parser.add_argument("--output-dir", default="simulation_results")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--timeout", type=float, help="per-simulation timeout in seconds")
+    parser.add_argument("--core-api-url")
+    parser.add_argument("--auth-token")
+    args = parser.parse_args(argv)
+
+    manifest, specs = load_manifest(args.manifest)
+    core_api_url = (
+        args.core_api_url or manifest.get("core_api_url") or os.environ.get("VAULT_CORE_API_URL"))
+    auth_token = (
+        args.auth_token or manifest.get("auth_token") or os.environ.get("VAULT_AUTH_TOKEN"))
+    if not core_api_url or not auth_token:
+        parser.error("a core API URL and auth token are required")
+
+    runner = BatchRunner(
+        core_api_url=core_api_url,
+        auth_token=auth_token,
+        workers=args.workers,
+        use_processes=args.processes,
+        timeout=args.timeout,
+    )
+    summary = write_results(args.output_dir, runner.run(specs))
+    failed = [entry for entry in summary if entry["error"]]
+    print(
+        "%d simulations, %d failed, results in %s" % (len(summary), len(failed), args.output_dir))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+
+import batch_runner
+import vault_caller
+from datetime import datetime, timezone
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+END = datetime(year=2019, month=1, day=2, tzinfo=timezone.utc)
+
+
+class FakeResponse:
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.status_code = 200
+        self.ok = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self._chunks:
+            if callable(chunk):
+                chunk()
+                continue
+            yield chunk
+
+
+class ScriptedTransport:
+    """
+    Answers each request with the chunks respond(contract code) returns, or raises the exception
+    it returns, and remembers every request sent.
+    """
+
+    def __init__(self, respond):
+        self._respond = respond
+        self._lock = threading.Lock()
+        self.requests = []
+
+    def close(self):
+        pass
+
+    def open(self, request):
+        with self._lock:
+            self.requests.append(request)
+        chunks = self._respond(json.loads(request.body)["smart_contracts"][0]["code"])
+        if isinstance(chunks, Exception):
+            raise chunks
+        return FakeResponse(chunks)
+
+
+class UnpicklableError(Exception):
+    def __init__(self, *, detail):
+        super().__init__()
+        self.detail = detail
+
+    def __str__(self):
+        return self.detail
+
+
+def ndjson(*events):
+    return b"".join(json.dumps(event).encode() + b"\n" for event in events)
+
+
+def echo_code(code):
+    # Numbered contracts answer sooner the higher their number, so jobs finish out of order.
+    digits = "".join(character for character in code if character.isdigit())
+    delay = 0.01 * (9 - int(digits)) if digits else 0
+    return [lambda: time.sleep(delay), ndjson({"result": {"code": code}})]
+
+
+class BatchRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def contract(self, name, code=None):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as contract_file:
+            contract_file.write(name if code is None else code)
+        return path
+
+    def spec(self, name, **kwargs):
+        return batch_runner.SimulationSpec(
+            name=name, contract_file=self.contract(name), start=START, end=END, **kwargs)
+
+    def run_specs(self, specs, respond, **kwargs):
+        transport = ScriptedTransport(respond)
+        runner = batch_runner.BatchRunner(
+            core_api_url="http://vault", auth_token="token", transport=transport, **kwargs)
+        return runner.run(specs), transport
+
+    def test_build_simulation(self):
+        spec = batch_runner.SimulationSpec(
+            name="loan",
+            contract_file="unused",
+            start=START,
+            end=END,
+            template_params={"denomination": "GBP"},
+            instance_params={"loan_amount": "3000"},
+            instructions=[vault_caller.SimulationInstruction(END, {"a": 1})],
+            internal_accounts=["1", "12345"],
+        )
+        simulation = batch_runner.build_simulation(spec, "api = '3.6.0'")
+        self.assertEqual(
+            [contract["smart_contract_version_id"] for contract in simulation["smart_contracts"]],
+            ["1", "2", "3"],
+        )
+        self.assertEqual(
+            simulation["smart_contracts"][0]["smart_contract_param_vals"], {"denomination": "GBP"})
+        self.assertEqual(
+            [instruction.instruction["create_account"]["id"]
+             for instruction in simulation["instructions"][:3]],
+            [batch_runner.MAIN_ACCOUNT_ID, "1", "12345"],
+        )
+        self.assertEqual(
+            simulation["instructions"][0].instruction["create_account"]["instance_param_vals"],
+            {"loan_amount": "3000"},
+        )
+        self.assertEqual(simulation["instructions"][3], spec.instructions[0])
+
+    def test_results_keep_input_order_with_one_request_per_spec(self):
+        specs = [self.spec("contract_%d.py" % i) for i in range(6)]
+        results, transport = self.run_specs(specs, echo_code, workers=3)
+        self.assertEqual([result.name for result in results], [spec.name for spec in specs])
+        self.assertEqual(
+            [result.result for result in results],
+            [[{"result": {"code": spec.name}}] for spec in specs],
+        )
+        self.assertEqual(len(transport.requests), len(specs))
+
+    def test_errors_are_isolated(self):
+        def respond(code):
+            if code == "bad.py":
+                return [ndjson({"vault_error_code": 3, "message": "bad contract"})]
+            return echo_code(code)
+
+        missing = self.spec("missing.py")
+        os.remove(missing.contract_file)
+        specs = [self.spec("good_1.py"), missing, self.spec("bad.py"), self.spec("good_2.py")]
+        results, transport = self.run_specs(specs, respond, workers=2)
+
+        self.assertIsInstance(results[1].error, FileNotFoundError)
+        self.assertIsInstance(results[2].error, vault_caller.VaultException)
+        for result in [results[0], results[3]]:
+            self.assertIsNone(result.error)
+            self.assertEqual(len(result.result), 1)
+        # The missing contract never reaches the core API.
+        self.assertEqual(len(transport.requests), 3)
+
+    def test_timeout(self):
+        def respond(code):
+            return [ndjson({"result": {}}), lambda: time.sleep(0.3), ndjson({"result": {}})]
+
+        results, transport = self.run_specs([self.spec("slow.py")], respond, timeout=0.1)
+        self.assertIsInstance(results[0].error, batch_runner.SimulationTimeout)
+        self.assertIsNone(results[0].result)
+        # The server is asked to give up at the same point.
+        self.assertEqual(transport.requests[0].headers["grpc-timeout"], "1S")
+
+    def test_process_job_errors_can_be_sent_back(self):
+        batch_runner._init_process(dict(
+            core_api_url="http://vault",
+            auth_token="token",
+            transport=ScriptedTransport(
+                lambda code: [ndjson({"vault_error_code": 3, "message": "bad contract"})]
+                if code == "bad.py" else UnpicklableError(detail="connection lost")),
+        ))
+        self.addCleanup(setattr, batch_runner, "_process_client", None)
+        result = batch_runner._run_process_job(self.spec("bad.py"), None)
+        self.assertIsInstance(result.error, vault_caller.VaultException)
+        result = batch_runner._run_process_job(self.spec("lost.py"), None)
+        self.assertIsInstance(result.error, RuntimeError)
+        self.assertEqual(str(result.error), "UnpicklableError: connection lost")
+
+    def test_manifest_and_results(self):
+        self.contract("loan.py")
+        manifest_path = os.path.join(self.directory, "manifest.json")
+        with open(manifest_path, "w") as manifest_file:
+            json.dump(
+                {
+                    "simulations": [
+                        {
+                            "name": "loan/3000",
+                            "contract_file": "loan.py",
+                            "start": START.isoformat(),
+                            "end": END.isoformat(),
+                            "instructions": [{"time": END.isoformat(), "instruction": {"a": 1}}],
+                        }
+                    ]
+                },
+                manifest_file,
+            )
+        _, specs = batch_runner.load_manifest(manifest_path)
+        self.assertEqual(specs[0].contract_file, os.path.join(self.directory, "loan.py"))
+        self.assertEqual((specs[0].start, specs[0].end), (START, END))
+        self.assertEqual(specs[0].instructions, [vault_caller.SimulationInstruction(END, {"a": 1})])
+        self.assertEqual(specs[0].internal_accounts, ["1"])
+
+        output_dir = os.path.join(self.directory, "results")
+        results = [
+            batch_runner.BatchResult("loan/3000", [{"result": {}}], None, 1.0),
+            batch_runner.BatchResult("broken", None, ValueError("no"), 0.5),
+        ]
+        summary = batch_runner.write_results(output_dir, results)
+        self.assertEqual(
+            [entry["file"] for entry in summary], ["0000_loan_3000.json", "0001_broken.json"])
+        self.assertEqual(summary[1]["error"], "ValueError: no")
+        with open(os.path.join(output_dir, "summary.json")) as summary_file:
+            self.assertEqual(json.load(summary_file), summary)
+        with open(os.path.join(output_dir, "0000_loan_3000.json")) as result_file:
+            self.assertEqual(json.load(result_file)["result"], [{"result": {}}])
+
+
+if __name__ == "__main__":
+    unittest.main()
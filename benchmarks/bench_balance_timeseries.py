@@ -0,0 +1,171 @@
+"""
+Compares local_simulator.BalanceTimeseries, which stores one column per balance coordinate, with
+the dict-per-commit layout it replaced. The old layout copied every coordinate's Balance into a
+new BalanceDefaultDict on each commit. Reports memory held after the commits, commit time, and
+at()/before() lookup latency. Also compares summing PostingInstruction.balances() the way
+total_balances does.
+
+    python3 benchmarks/bench_balance_timeseries.py --commits 100000 --coordinates 20
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import local_simulator  # noqa: E402
+from local_simulator import BalanceDefaultDict, Posting, PostingInstruction  # noqa: E402
+
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+
+
+class DictTimeseries:
+    """The previous layout: a full BalanceDefaultDict snapshot per commit."""
+    def __init__(self):
+        self._timestamps = []
+        self._snapshots = []
+        self._latest = BalanceDefaultDict()
+
+    def latest(self):
+        return self._latest
+
+    def at(self, timestamp):
+        index = bisect_right(self._timestamps, timestamp)
+        return self._snapshots[index - 1] if index else BalanceDefaultDict()
+
+    def before(self, timestamp):
+        index = bisect_left(self._timestamps, timestamp)
+        return self._snapshots[index - 1] if index else BalanceDefaultDict()
+
+    def append(self, timestamp, postings, tside):
+        balances = self._latest.copy()
+        for posting in postings:
+            local_simulator._add_posting(balances, posting, tside)
+        self._timestamps.append(timestamp)
+        self._snapshots.append(balances)
+        self._latest = balances
+
+
+def make_commits(commits, coordinates, seed=1):
+    rng = random.Random(seed)
+    addresses = ["ADDRESS_%d" % i for i in range(coordinates)]
+    step = timedelta(minutes=1)
+    result = []
+    for i in range(commits):
+        # Most commits touch one or two addresses, as a posting and its accrual or fee do.
+        postings = [
+            Posting(
+                rng.random() < 0.5,
+                Decimal(rng.randint(1, 100000)).scaleb(-2),
+                "GBP",
+                "main_account",
+                rng.choice(addresses),
+                local_simulator.DEFAULT_ASSET,
+                local_simulator.Phase.COMMITTED,
+            )
+            for _ in range(rng.randint(1, 2))
+        ]
+        result.append((START + step * i, postings))
+    return result, addresses
+
+
+def build(factory, commits):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    timeseries = factory()
+    for timestamp, postings in commits:
+        timeseries.append(timestamp, postings, local_simulator.Tside.LIABILITY)
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timeseries, elapsed, memory
+
+
+def lookups(timeseries, commits, addresses, count, seed=2):
+    rng = random.Random(seed)
+    queries = [
+        (
+            commits[rng.randrange(len(commits))][0],
+            (rng.choice(addresses), local_simulator.DEFAULT_ASSET, "GBP",
+             local_simulator.Phase.COMMITTED),
+        )
+        for _ in range(count)
+    ]
+    started = time.perf_counter()
+    for timestamp, key in queries:
+        timeseries.at(timestamp)[key]
+        timeseries.before(timestamp)[key]
+    return (time.perf_counter() - started) / (2 * count)
+
+
+def sum_dicts(instructions):
+    # What total_balances cost when balances() built a BalanceDefaultDict per instruction.
+    total = BalanceDefaultDict()
+    for instruction in instructions:
+        balances = BalanceDefaultDict()
+        for posting in instruction.postings:
+            if posting.account_id == "main_account":
+                local_simulator._add_posting(balances, posting, instruction.tside)
+        total += balances
+    return total
+
+
+def sum_instructions(instructions):
+    total = BalanceDefaultDict()
+    for instruction in instructions:
+        total += instruction.balances()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--commits", type=int, default=100000)
+    parser.add_argument("--coordinates", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    commits, addresses = make_commits(args.commits, args.coordinates)
+    print("%d commits over %d coordinates" % (args.commits, args.coordinates))
+    for name, factory in [
+        ("dict per commit", DictTimeseries),
+        ("columns", local_simulator.BalanceTimeseries),
+    ]:
+        timeseries, elapsed, memory = build(factory, commits)
+        latency = lookups(timeseries, commits, addresses, args.lookups)
+        print(
+            "%-16s %8.1f MB  %6.3fs commits  %6.2f us/lookup"
+            % (name, memory / 1e6, elapsed, latency * 1e6)
+        )
+        del timeseries
+
+    instructions = [
+        PostingInstruction(
+            local_simulator.PostingInstructionType.HARD_SETTLEMENT,
+            postings + [posting._replace(account_id="1", credit=not posting.credit)
+                        for posting in postings],
+        )
+        for _, postings in commits
+    ]
+    for name, total in [
+        ("dict per instruction", sum_dicts),
+        ("instruction legs", sum_instructions),
+    ]:
+        started = time.perf_counter()
+        total(instructions)
+        elapsed = time.perf_counter() - started
+        print(
+            "%-20s %6.3fs  %6.2f us/instruction"
+            % (name, elapsed, elapsed / len(instructions) * 1e6)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares a bare requests.post per simulation (the previous Client behaviour) with the pooled
+keep-alive session owned by vault_caller.Client, against the local stub server.
+
+    python3 benchmarks/bench_connection_pool.py --calls 2000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import vault_caller  # noqa: E402
+from stub_server import SIMULATE_PATH, StubServer  # noqa: E402
+
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+END = datetime(year=2019, month=1, day=2, tzinfo=timezone.utc)
+
+
+def bare_requests(url, calls):
+    for _ in range(calls):
+        response = requests.post(
+            url + SIMULATE_PATH,
+            headers={"Content-Type": "application/json", "grpc-timeout": "10S"},
+            json={"smart_contracts": [], "instructions": []},
+            stream=True,
+        )
+        for _line in response.iter_lines():
+            pass
+
+
+def pooled_client(url, calls):
+    with vault_caller.Client(core_api_url=url, auth_token="stub") as client:
+        for _ in range(calls):
+            client.simulate_contracts(
+                smart_contracts=[], start_timestamp=START, end_timestamp=END, instructions=[]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--events", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, run in (("requests.post", bare_requests), ("Client", pooled_client)):
+        with StubServer(events=args.events) as server:
+            started = time.perf_counter()
+            run(server.url, args.calls)
+            elapsed = time.perf_counter() - started
+            print(
+                "%-14s %6d calls  %8.3fs  %8.1f calls/s  %5d connections"
+                % (name, args.calls, elapsed, args.calls / elapsed, server.connections)
+            )
+
+
+if __name__ == "__main__":
+    main()
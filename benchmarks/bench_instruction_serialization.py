@@ -0,0 +1,86 @@
+"""
+Compares the per-instruction dict path (_instruction_to_json for every instruction, then one
+json.dumps of the whole payload) with the bulk serializer used by Client.simulate_contracts, for a
+soak-test sized list of deposits and withdrawals.
+
+    python3 benchmarks/bench_instruction_serialization.py --instructions 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "personal_loan"))
+
+import products_test_utils  # noqa: E402
+import vault_caller  # noqa: E402
+
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+
+
+def make_instructions(count):
+    instructions = []
+    for i in range(count):
+        # A handful of postings per simulated hour, so timestamps repeat as they do in soak runs.
+        time_ = START + timedelta(minutes=15 * (i // 4))
+        make = (
+            products_test_utils.create_deposit_instruction
+            if i % 2
+            else products_test_utils.create_withdrawal_instruction
+        )
+        instructions.append(
+            vault_caller.SimulationInstruction(
+                time_,
+                make(amount="10", timestamp=time_.isoformat(), client_transaction_id=str(i)),
+            )
+        )
+    return instructions
+
+
+def dict_path(instructions, end):
+    return json.dumps(
+        vault_caller._simulate_payload([], START, end, instructions)).encode()
+
+
+def bulk_path(instructions, end):
+    return vault_caller._serialize_simulate_payload([], START, end, instructions)
+
+
+def measure(run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    body = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return body, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instructions", type=int, default=100000)
+    args = parser.parse_args()
+
+    instructions = make_instructions(args.instructions)
+    end = instructions[-1].time + timedelta(days=1)
+    bodies = []
+    for name, run in (("dict + json.dumps", dict_path), ("bulk serializer", bulk_path)):
+        # tracemalloc slows both paths down equally; time them separately as well.
+        started = time.perf_counter()
+        run(instructions, end)
+        elapsed = time.perf_counter() - started
+        body, _, peak = measure(lambda: run(instructions, end))
+        bodies.append(body)
+        print(
+            "%-18s %8d instructions  %7.3fs  %6.1f MB body  %7.1f MB peak allocated"
+            % (name, len(instructions), elapsed, len(body) / 1e6, peak / 1e6)
+        )
+    assert bodies[0] == bodies[1], "serializers disagree"
+
+
+if __name__ == "__main__":
+    main()
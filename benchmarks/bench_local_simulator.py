@@ -0,0 +1,67 @@
+"""
+Measures how many postings a minute the local simulator pushes through the current account
+contract, with pre_posting_code, post_posting_code and the daily accrual schedule all running.
+With --fast-forward, accruals between postings are applied in closed form instead of daily.
+
+    python3 benchmarks/bench_local_simulator.py --postings 200000 --days 365
+    python3 benchmarks/bench_local_simulator.py --postings 5 --days 3650 --fast-forward
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import local_simulator  # noqa: E402
+
+CONTRACT_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "current_account", "tutorial_contract.py")
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+TEMPLATE_PARAMS = {
+    "denomination": "GBP",
+    "overdraft_limit": "100",
+    "overdraft_fee": "20",
+    "gross_interest_rate": "0.08",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--postings", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--fast-forward", action="store_true")
+    args = parser.parse_args()
+
+    sim = local_simulator.LocalSimulator.from_file(
+        CONTRACT_FILE,
+        start=START,
+        template_params=TEMPLATE_PARAMS,
+        instance_params={"interest_payment_day": "5"},
+        fast_forward_events=("ACCRUE_INTEREST",) if args.fast_forward else (),
+    )
+    step = timedelta(days=args.days) / args.postings
+    started = time.perf_counter()
+    for i in range(args.postings):
+        # Mostly deposits, so the balance stays positive and accrues interest every day.
+        if i % 3:
+            sim.inbound_hard_settlement("10", START + step * (i + 1))
+        else:
+            sim.outbound_hard_settlement("15", START + step * (i + 1))
+    queued = time.perf_counter()
+    sim.run_until(START + timedelta(days=args.days))
+    elapsed = time.perf_counter() - started
+
+    print(
+        "%d postings over %d days, %d batches committed, %d rejected"
+        % (args.postings, args.days, len(sim.committed_batches), len(sim.rejections))
+    )
+    print(
+        "%.3fs (%.3fs queueing)  %.0f postings/minute"
+        % (elapsed, queued - started, args.postings / elapsed * 60)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Replays a recorded simulation stream through the previous decoding path (requests' iter_lines
+with its 512 byte default chunks and json.loads per line) and through vault_caller.NdjsonDecoder,
+reporting bytes/s and events/s for each.
+
+    python3 benchmarks/bench_ndjson_decode.py --stream recorded_simulation.ndjson
+    python3 benchmarks/bench_ndjson_decode.py --events 20000   # synthetic stream
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import vault_caller  # noqa: E402
+from stub_server import make_stream  # noqa: E402
+
+
+def _replayed_response(data):
+    response = requests.models.Response()
+    response.raw = io.BytesIO(data)
+    response.status_code = 200
+    return response
+
+
+def iter_lines_path(data):
+    events = 0
+    for line in _replayed_response(data).iter_lines():
+        json.loads(line)
+        events += 1
+    return events
+
+
+def decoder_path(data, chunk_size, loads=None):
+    decoder = vault_caller.NdjsonDecoder(chunk_size, loads=loads)
+    response = _replayed_response(data)
+    events = sum(1 for _ in decoder.iter_events(response.iter_content(chunk_size=chunk_size)))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stream", help="NDJSON file recorded from a simulate call")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=vault_caller.DEFAULT_DECODE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.stream:
+        with open(args.stream, "rb") as stream_file:
+            data = stream_file.read()
+    else:
+        data = make_stream(args.events)
+
+    runs = [
+        ("iter_lines + json", lambda: iter_lines_path(data)),
+        ("NdjsonDecoder json", lambda: decoder_path(data, args.chunk_size, loads=json.loads)),
+    ]
+    if vault_caller.orjson is not None:
+        runs.append(("NdjsonDecoder orjson", lambda: decoder_path(data, args.chunk_size)))
+
+    print("stream: %.1f MB" % (len(data) / 1e6))
+    for name, run in runs:
+        started = time.perf_counter()
+        events = run()
+        elapsed = time.perf_counter() - started
+        print(
+            "%-22s %8d events  %7.3fs  %8.1f MB/s  %10.0f events/s"
+            % (name, events, elapsed, len(data) / elapsed / 1e6, events / elapsed)
+        )
+
+
+if __name__ == "__main__":
+    main()
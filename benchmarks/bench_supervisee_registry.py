@@ -0,0 +1,77 @@
+"""
+Times how the deposit supervisor orders its supervisees at 10, 100 and 1000 supervisees.
+- supervisor: _get_supervisees_for_alias, filtering by alias then sorting twice (by id, then by
+  creation date)
+- registry: indexing every alias at once with a single sort on (creation date, id)
+Supervisees are timed both in creation order and shuffled. Also checks that both produce the
+same order.
+
+Each hook reads one alias once, so a registry is never reused within an execution, and the
+single tuple-key sort is slower than the two scalar sorts at 10 and 100 supervisees. The
+supervisor keeps the per-alias lookup for that reason.
+
+    python3 benchmarks/bench_supervisee_registry.py --sizes 10 100 1000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(__file__))
+
+import supervisor_stub  # noqa: E402
+
+
+def get_supervisee_registry(vault):
+    registry = {}
+    for supervisee in sorted(
+        vault.supervisees.values(),
+        key=lambda supervisee: (supervisee.get_account_creation_date(), supervisee.account_id),
+    ):
+        registry.setdefault(supervisee.get_alias(), []).append(supervisee)
+    return registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        for shuffled in [False, True]:
+            plan = supervisor_stub.make_plan(size)
+            if shuffled:
+                supervisees = list(plan.supervisees.items())
+                random.Random(size).shuffle(supervisees)
+                plan.supervisees = dict(supervisees)
+            supervisor = supervisor_stub.load_supervisor(plan)
+            get_supervisees_for_alias = supervisor["_get_supervisees_for_alias"]
+            if get_supervisee_registry(plan)["deposit"] != get_supervisees_for_alias(
+                plan, "deposit"
+            ):
+                raise AssertionError("The registry orders supervisees differently")
+
+            timings = []
+            for function in [
+                lambda: get_supervisees_for_alias(plan, "deposit"),
+                lambda: get_supervisee_registry(plan)["deposit"],
+            ]:
+                timer = timeit.Timer(function)
+                number, _ = timer.autorange()
+                timings.append(min(timer.repeat(5, number)) / number)
+            supervisor_seconds, registry_seconds = timings
+            print(
+                "%5d supervisees %-8s  supervisor %9.2f us  registry %9.2f us  %5.2fx"
+                % (
+                    size,
+                    "shuffled" if shuffled else "ordered",
+                    supervisor_seconds * 1e6,
+                    registry_seconds * 1e6,
+                    supervisor_seconds / registry_seconds,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Runs the deposit supervisor's pre_posting_code over the same credits, sent as single-instruction
+batches and as batches of 10, 100 and 1000 instructions, and reports hook executions and
+instructions per second for each batch size.
+
+    python3 benchmarks/bench_supervisor_batches.py --supervisees 100 --instructions 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+import supervisor_stub  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--supervisees", type=int, default=100)
+    parser.add_argument("--instructions", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    plan = supervisor_stub.make_plan(args.supervisees)
+    supervisor = supervisor_stub.load_supervisor(plan)
+    rng = random.Random(1)
+    account_ids = sorted(plan.supervisees)
+    instructions = [
+        supervisor_stub.credit(rng.choice(account_ids), "1.00") for _ in range(args.instructions)
+    ]
+
+    print("%d credits across %d supervisees" % (args.instructions, args.supervisees))
+    baseline = None
+    for batch_size in args.batch_sizes:
+        batches = [
+            supervisor_stub.batch(instructions[i:i + batch_size])
+            for i in range(0, len(instructions), batch_size)
+        ]
+        started = time.perf_counter()
+        for posting_instruction_batch in batches:
+            supervisor["pre_posting_code"](posting_instruction_batch, supervisor_stub.START)
+        elapsed = time.perf_counter() - started
+        throughput = len(instructions) / elapsed
+        baseline = baseline or throughput
+        print(
+            "batch size %5d  %6d executions  %8.0f executions/s  %9.0f instructions/s  %6.1fx"
+            % (batch_size, len(batches), len(batches) / elapsed, throughput, throughput / baseline)
+        )
+
+
+if __name__ == "__main__":
+    main()
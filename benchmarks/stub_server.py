@@ -0,0 +1,114 @@
+"""
+A local stand-in for the core API simulate endpoint.
+
+It streams NDJSON over a chunked HTTP/1.1 response the same way the real endpoint does and counts
+the TCP connections it accepts, so client-side changes (connection reuse, decoding, ...) can be
+measured without network access or a sandbox token.
+"""
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SIMULATE_PATH = "/v1/contracts:simulate"
+
+
+def make_event(index, account_id="main_account"):
+    return {
+        "result": {
+            "timestamp": "2019-01-01T00:00:00Z",
+            "logs": [],
+            "posting_instruction_batches": [],
+            "balances": {
+                account_id: {
+                    "balances": [
+                        {
+                            "id": "",
+                            "account_id": account_id,
+                            "account_address": "DEFAULT",
+                            "phase": "POSTING_PHASE_COMMITTED",
+                            "asset": "COMMERCIAL_BANK_MONEY",
+                            "denomination": "GBP",
+                            "amount": str(1000 + index),
+                            "value_time": "2019-01-01T00:00:00Z",
+                        }
+                    ]
+                }
+            },
+        }
+    }
+
+
+def make_stream(events):
+    return b"".join(json.dumps(make_event(i)).encode() + b"\n" for i in range(events))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        *,
+        body=None,
+        events=10,
+        chunk_size=16 * 1024,
+        chunk_delay=0,
+    ):
+        super().__init__(address, _SimulateHandler)
+        self.body = body if body is not None else make_stream(events)
+        self.chunk_size = chunk_size
+        # Seconds to wait before each chunk, to mimic a slow server-side simulation.
+        self.chunk_delay = chunk_delay
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+
+class _SimulateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Like any production HTTP server, don't let Nagle's algorithm hold back small writes.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.server.count("requests")
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != SIMULATE_PATH:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        body = self.server.body
+        for offset in range(0, len(body), self.server.chunk_size):
+            chunk = body[offset:offset + self.server.chunk_size]
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
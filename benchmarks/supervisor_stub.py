@@ -0,0 +1,182 @@
+"""
+Runs deposit_account/deposit_supervisor.py in-process, for the supervisor benchmarks and tests. The
+source is executed with local_simulator's stand-ins for the Vault globals, plus the supervisor-only
+ones, against a plan of in-memory deposit supervisees holding fixed balances, parameters, postings
+and hook directives. What the supervisor instructs is recorded on each supervisee rather than
+applied.
+"""
+import os
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import local_simulator  # noqa: E402
+from local_simulator import (  # noqa: E402
+    DEFAULT_ADDRESS,
+    DEFAULT_ASSET,
+    Balance,
+    BalanceDefaultDict,
+    ParameterTimeseries,
+    Phase,
+    Posting,
+    PostingInstruction,
+    PostingInstructionBatch,
+    PostingInstructionType,
+)
+
+SUPERVISOR_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "deposit_account", "deposit_supervisor.py")
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+DENOMINATION = "GBP"
+
+BalancesObservation = namedtuple("BalancesObservation", ["balances", "value_datetime"])
+
+
+class SupervisionExecutionMode:
+    OVERRIDE = "OVERRIDE"
+    INVOKED = "INVOKED"
+
+
+def supervisor_globals():
+    namespace = local_simulator.contract_globals()
+    namespace.update(
+        {
+            "BalancesObservationFetcher": SimpleNamespace,
+            "DefinedDateTime": SimpleNamespace(LIVE="LIVE"),
+            "EventType": SimpleNamespace,
+            "EventTypeSchedule": SimpleNamespace,
+            "SmartContractDescriptor": SimpleNamespace,
+            "SupervisedHooks": SimpleNamespace,
+            "SupervisionExecutionMode": SupervisionExecutionMode,
+        }
+    )
+    return namespace
+
+
+def load_supervisor(plan_vault):
+    with open(SUPERVISOR_FILE) as supervisor_file:
+        code = supervisor_file.read()
+    namespace = supervisor_globals()
+    exec(compile(code, SUPERVISOR_FILE, "exec"), namespace)
+    namespace["vault"] = plan_vault
+    return namespace
+
+
+def _key(address):
+    return (address, DEFAULT_ASSET, DENOMINATION, Phase.COMMITTED)
+
+
+class SuperviseeVault:
+    def __init__(self, account_id, creation_date, balance, maximum_balance_limit):
+        self.account_id = account_id
+        self._creation_date = creation_date
+        self._parameters = {
+            "denomination": ParameterTimeseries([(creation_date, DENOMINATION)]),
+            "maximum_balance_limit": ParameterTimeseries(
+                [(creation_date, Decimal(maximum_balance_limit))]),
+        }
+        self.balances = BalanceDefaultDict()
+        self.set_balance(DEFAULT_ADDRESS, balance)
+        self.postings = []
+        self.directed_posting_instructions = []
+        self.instructed = []
+
+    def set_balance(self, address, amount):
+        amount = Decimal(amount)
+        self.balances[_key(address)] = Balance(amount, Decimal(0), amount)
+
+    def set_parameter(self, name, value, at=START):
+        timeseries = self._parameters[name]
+        self._parameters[name] = ParameterTimeseries(
+            list(zip(timeseries._timestamps, timeseries._values)) + [(at, value)])
+
+    def get_alias(self):
+        return "deposit"
+
+    def get_account_creation_date(self):
+        return self._creation_date
+
+    def get_parameter_timeseries(self, name):
+        return self._parameters[name]
+
+    def get_balances_observation(self, fetcher_id):
+        return BalancesObservation(self.balances, None)
+
+    def get_postings(self):
+        return self.postings
+
+    def get_hook_directives(self):
+        # One batch directive per instruction the supervisee's own hook directed.
+        return SimpleNamespace(
+            posting_instruction_batch_directives=[
+                SimpleNamespace(posting_instruction_batch=[posting_instruction])
+                for posting_instruction in self.directed_posting_instructions
+            ]
+        )
+
+    def instruct_posting_batch(self, posting_instructions, effective_date, **options):
+        self.instructed.append((effective_date, list(posting_instructions)))
+
+
+class PlanVault:
+    def __init__(self, supervisees):
+        self.supervisees = {supervisee.account_id: supervisee for supervisee in supervisees}
+        self.schedules = {}
+
+    def get_plan_creation_date(self):
+        return START
+
+    def get_hook_execution_id(self):
+        return "benchmark"
+
+    def update_event_type(self, event_type, schedule):
+        self.schedules[event_type] = schedule
+
+
+def make_plan(size, balance="100", maximum_balance_limit="100000"):
+    """
+    A plan of `size` deposit supervisees, several opened on each day so the sort has ties to
+    break by account id.
+    """
+    supervisees = [
+        SuperviseeVault(
+            "deposit_%05d" % ((i * 7919) % size),
+            START + timedelta(days=i // 3),
+            balance,
+            maximum_balance_limit,
+        )
+        for i in range(size)
+    ]
+    return PlanVault(supervisees)
+
+
+def credit(account_id, amount, event_type=None):
+    """An inbound hard settlement to a supervisee, as the supervisor's pre_posting_code sees it."""
+    return _hard_settlement(account_id, amount, True, event_type)
+
+
+def debit(account_id, amount, event_type=None):
+    """An outbound hard settlement from a supervisee."""
+    return _hard_settlement(account_id, amount, False, event_type)
+
+
+def _hard_settlement(account_id, amount, credit, event_type):
+    amount = Decimal(amount)
+    return PostingInstruction(
+        PostingInstructionType.HARD_SETTLEMENT,
+        (
+            Posting(credit, amount, DENOMINATION, account_id, DEFAULT_ADDRESS, DEFAULT_ASSET,
+                    Phase.COMMITTED),
+            Posting(not credit, amount, DENOMINATION, "1", DEFAULT_ADDRESS, DEFAULT_ASSET,
+                    Phase.COMMITTED),
+        ),
+        instruction_details={"event_type": event_type} if event_type else {},
+    )
+
+
+def batch(posting_instructions):
+    return PostingInstructionBatch(posting_instructions, value_timestamp=START)
@@ -0,0 +1,200 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import local_simulator
+import vault_caller
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import unittest
+
+CONTRACT_FILE = os.path.join(os.path.dirname(__file__), "tutorial_contract.py")
+TEMPLATE_PARAMS = {
+    "denomination": "GBP",
+    "overdraft_limit": "100",
+    "overdraft_fee": "20",
+    "gross_interest_rate": "0.08",
+}
+DEFAULT = (
+    local_simulator.DEFAULT_ADDRESS,
+    local_simulator.DEFAULT_ASSET,
+    "GBP",
+    local_simulator.Phase.COMMITTED,
+)
+ACCRUED_INCOMING = (
+    "ACCRUED_INCOMING",
+    local_simulator.DEFAULT_ASSET,
+    "GBP",
+    local_simulator.Phase.COMMITTED,
+)
+
+
+# The same scenarios as simple_tutorial_tests, run against the local simulator instead of the
+# core API.
+class LocalSimulatorTest(unittest.TestCase):
+    def make_simulator(self, start, template_params=TEMPLATE_PARAMS, instance_params={}):
+        return local_simulator.LocalSimulator.from_file(
+            CONTRACT_FILE,
+            start=start,
+            template_params=template_params,
+            instance_params=instance_params,
+        )
+
+    def deposit_instruction(self, amount, denomination="GBP"):
+        return {
+            "create_posting_instruction_batch": {
+                "client_id": "Visa",
+                "client_batch_id": "123",
+                "posting_instructions": [
+                    {
+                        "inbound_hard_settlement": {
+                            "amount": amount,
+                            "denomination": denomination,
+                            "target_account": {
+                                "account_id": "main_account",
+                            },
+                            "internal_account_id": "1",
+                        },
+                        "client_transaction_id": "123456",
+                        "instruction_details": {"description": "test"},
+                    }
+                ],
+                "batch_details": {"description": "test"},
+                "value_timestamp": "2019-01-01T01:00:00+00:00",
+            }
+        }
+
+    def test_wrong_denomination_deposit(self):
+        start = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        sim = self.make_simulator(start)
+        sim.submit(vault_caller.SimulationInstruction(
+            start, self.deposit_instruction("1000", "EUR")))
+        sim.run_until(datetime(year=2019, month=1, day=2, tzinfo=timezone.utc))
+
+        self.assertEqual(len(sim.committed_batches), 0)
+        self.assertEqual(len(sim.rejections), 1)
+        self.assertIn(
+            "Cannot make transactions in given denomination; transactions must be in GBP",
+            sim.rejections[0].message,
+        )
+        self.assertEqual(
+            sim.rejections[0].reason_code, local_simulator.RejectedReason.WRONG_DENOMINATION)
+
+    def test_fee_applied_after_withdrawal(self):
+        start = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        sim = self.make_simulator(start)
+        sim.outbound_hard_settlement(
+            "110", datetime(year=2019, month=1, day=1, hour=1, tzinfo=timezone.utc))
+        sim.run_until(datetime(year=2019, month=1, day=1, hour=1, tzinfo=timezone.utc))
+        self.assertEqual(sim.balances()[DEFAULT].net, Decimal("-110"))
+
+        # The fee is charged a minute after the withdrawal.
+        sim.run_until(datetime(year=2019, month=1, day=1, hour=2, tzinfo=timezone.utc))
+        self.assertEqual(sim.balances()[DEFAULT].net, Decimal("-130"))
+        self.assertEqual(sim.balances("1")[DEFAULT].net, Decimal("130"))
+
+    def test_execution_schedule(self):
+        start = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        sim = self.make_simulator(start)
+        sim.submit(self.deposit_instruction("1000"))
+        sim.run_until(datetime(year=2019, month=1, day=2, tzinfo=timezone.utc))
+
+        self.assertEqual(len(sim.committed_batches), 2)
+        self.assertEqual(sim.balances()[ACCRUED_INCOMING].net, Decimal("0.21918"))
+
+    def test_improved_execution_schedule(self):
+        start = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        sim = self.make_simulator(start, instance_params={"interest_payment_day": "5"})
+        sim.submit(self.deposit_instruction("1000"))
+        sim.run_until(datetime(year=2019, month=1, day=5, hour=1, tzinfo=timezone.utc))
+
+        # Four days of accrual, then the interest payment.
+        payment = sim.committed_batches[-1]
+        self.assertEqual(len(payment), 2)
+        self.assertEqual(payment[0].amount, Decimal("0.88"))
+        self.assertEqual(sim.balances()[DEFAULT].net, Decimal("1000.88"))
+        self.assertEqual(
+            sim.balance_timeseries().before(payment.value_timestamp)[ACCRUED_INCOMING].net,
+            Decimal("0.87672"),
+        )
+
+    def test_fast_forward_matches_daily_accrual(self):
+        start = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        end = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+        simulators = []
+        for fast_forward_events in [(), ("ACCRUE_INTEREST",)]:
+            sim = local_simulator.LocalSimulator.from_file(
+                CONTRACT_FILE,
+                start=start,
+                template_params=TEMPLATE_PARAMS,
+                instance_params={"interest_payment_day": "5"},
+                fast_forward_events=fast_forward_events,
+            )
+            sim.submit(self.deposit_instruction("1000"))
+            # Into the overdraft, so the fee is charged, and back out again.
+            sim.outbound_hard_settlement(
+                "1150", datetime(year=2019, month=2, day=10, hour=3, tzinfo=timezone.utc))
+            sim.inbound_hard_settlement(
+                "5000", datetime(year=2019, month=7, day=20, tzinfo=timezone.utc))
+            sim.run_until(end)
+            simulators.append(sim)
+        daily, fast_forward = simulators
+
+        # Most of the year's accruals are replayed rather than run.
+        self.assertGreater(sum(run.count for run in fast_forward.fast_forwarded), 300)
+        timestamp = start
+        while timestamp <= end:
+            for account_id in ["main_account", "1"]:
+                self.assertEqual(
+                    daily.balance_timeseries(account_id).at(timestamp),
+                    fast_forward.balance_timeseries(account_id).at(timestamp),
+                )
+                self.assertEqual(
+                    daily.balance_timeseries(account_id).before(timestamp),
+                    fast_forward.balance_timeseries(account_id).before(timestamp),
+                )
+            timestamp += timedelta(hours=6)
+        self.assertEqual(daily.balances(), fast_forward.balances())
+
+    def test_posting_ledger_windows(self):
+        start = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+        simulators = []
+        for fast_forward_events in [(), ("ACCRUE_INTEREST",)]:
+            sim = local_simulator.LocalSimulator.from_file(
+                CONTRACT_FILE,
+                start=start,
+                template_params=TEMPLATE_PARAMS,
+                instance_params={"interest_payment_day": "5"},
+                fast_forward_events=fast_forward_events,
+            )
+            for day in range(0, 90, 7):
+                sim.inbound_hard_settlement(
+                    "100",
+                    start + timedelta(days=day, hours=9),
+                    instruction_details={"event_type": "APPLY_INTEREST" if day % 2 else "DEPOSIT"},
+                )
+                sim.outbound_hard_settlement("30", start + timedelta(days=day, hours=10))
+            sim.run_until(start + timedelta(days=90))
+            simulators.append(sim)
+        daily, fast_forward = simulators
+
+        for first_day, days in [(0, 90), (3, 28), (14, 31), (59, 1), (40, 0)]:
+            window_start = start + timedelta(days=first_day, hours=9)
+            window_end = window_start + timedelta(days=days)
+            self.assertEqual(
+                [
+                    (instruction.value_timestamp, instruction.instruction_details)
+                    for instruction in daily.postings.window(window_start, window_end)
+                ],
+                [
+                    (instruction.value_timestamp, instruction.instruction_details)
+                    for instruction in fast_forward.postings.window(window_start, window_end)
+                ],
+            )
+        self.assertEqual(len(daily.postings), len(fast_forward.postings))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# flake8: noqa
@@ -0,0 +1,184 @@
+"""
+Forecasts tutorial_contract interest for a whole portfolio at once with numpy, instead of running
+ACCRUE_INTEREST and APPLY_ACCRUED_INTEREST once per account per day.
+
+Every step reproduces the contract's scheduled code, with the arithmetic done on int64
+fixed-point amounts:
+  * ACCRUE_INTEREST at 00:00 accrues |DEFAULT| * gross_interest_rate / 365, rounded half up to
+    5 decimal places (_precision_accural), into ACCRUED_INCOMING.
+  * APPLY_ACCRUED_INTEREST at 00:01 on the payment day moves |ACCRUED_INCOMING| rounded half up to
+    2 decimal places (_precision_fulfillment) into DEFAULT, and reverses any positive remainder
+    to the internal account's ACCRUED_OUTGOING.
+An accrual that lands exactly on a rounding tie is recomputed with Decimal the way the contract
+does it, so results reconcile with the hooks to the last digit.
+
+    forecast = forecast_interest(
+        balances,            # (accounts, days) int64 DEFAULT balances in pence at 00:00 of each day,
+                             # from postings only: interest applied by the forecast is added on top
+        gross_interest_rate="0.08",
+        interest_payment_day=payment_days,
+        first_day=date(2019, 1, 2),
+    )
+    forecast.interest_applied.sum()  # pence paid out over the period
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+DAYS_IN_YEAR = 365
+# DEFAULT balances and applied interest are in pence, accruals in units of 10^-5 (see
+# _precision_accural in tutorial_contract.py).
+MONEY_DECIMAL_PLACES = 2
+ACCRUAL_DECIMAL_PLACES = 5
+_ACCRUAL_UNITS_PER_PENNY = 10 ** (ACCRUAL_DECIMAL_PLACES - MONEY_DECIMAL_PLACES)
+
+InterestForecast = namedtuple(
+    "InterestForecast",
+    [
+        # (accounts,) state after the last day: ACCRUED_INCOMING in 10^-5 units, DEFAULT in pence.
+        "accrued_incoming",
+        "default",
+        # (accounts,) totals over the period: interest applied in pence, remainders reversed to
+        # the internal account in 10^-5 units.
+        "interest_applied",
+        "remainder_reversed",
+        # (days,) portfolio totals per day, in the same units.
+        "daily_accrued",
+        "daily_applied",
+        # (accounts, days) ACCRUED_INCOMING and DEFAULT after each day's interest events, or None
+        # unless forecast_interest was called with per_account_days=True.
+        "daily_accrued_incoming",
+        "daily_default",
+    ],
+)
+
+
+def forecast_interest(
+    balances,
+    gross_interest_rate,
+    interest_payment_day,
+    first_day,
+    accrued_incoming=0,
+    per_account_days=False,
+):
+    """
+    Runs the contract's daily accrual and monthly application over len(balances[0]) consecutive
+    days starting at first_day.
+
+    :param balances: (accounts, days) int64, DEFAULT balance in pence at 00:00 of each day,
+        excluding interest applied during the forecast
+    :param gross_interest_rate: the gross_interest_rate parameter, as a str or Decimal, either
+        one for the whole portfolio or one per account
+    :param interest_payment_day: int or (accounts,) ints, the day of the month interest is applied
+    :param first_day: datetime.date of the first ACCRUE_INTEREST event
+    :param accrued_incoming: int or (accounts,) int64, opening ACCRUED_INCOMING in 10^-5 units
+    :param per_account_days: also return the (accounts, days) balances after every day
+    :return: InterestForecast
+    """
+    balances = np.asarray(balances, dtype=np.int64)
+    if balances.ndim != 2:
+        raise ValueError("balances must be an (accounts, days) array")
+    accounts, days = balances.shape
+    rates = _rates(gross_interest_rate, accounts)
+    numerator_factor, denominator = _daily_rate_fraction(rates)
+    if accounts and np.abs(balances).max() > (
+        np.iinfo(np.int64).max // max(int(numerator_factor.max()), 1)
+    ):
+        raise OverflowError("balances are too large for int64 accrual arithmetic")
+    payment_days = np.broadcast_to(np.asarray(interest_payment_day, dtype=np.int64), (accounts,))
+
+    incoming = np.array(np.broadcast_to(accrued_incoming, (accounts,)), dtype=np.int64)
+    applied = np.zeros(accounts, dtype=np.int64)
+    reversed_ = np.zeros(accounts, dtype=np.int64)
+    daily_accrued = np.zeros(days, dtype=np.int64)
+    daily_applied = np.zeros(days, dtype=np.int64)
+    daily_incoming = np.empty((accounts, days), dtype=np.int64) if per_account_days else None
+    daily_default = np.empty((accounts, days), dtype=np.int64) if per_account_days else None
+
+    for day in range(days):
+        default = balances[:, day] + applied
+        accrual = _accrue(default, numerator_factor, denominator, rates)
+        incoming += accrual
+        daily_accrued[day] = accrual.sum()
+
+        paying = payment_days == (first_day + timedelta(days=day)).day
+        if paying.any():
+            paid = np.where(paying, _to_pence(np.abs(incoming)), 0)
+            paid_units = paid * _ACCRUAL_UNITS_PER_PENNY
+            remainder = np.where(paid > 0, incoming - paid_units, 0)
+            remainder = np.maximum(remainder, 0)
+            incoming -= paid_units + remainder
+            applied += paid
+            reversed_ += remainder
+            daily_applied[day] = paid.sum()
+            default = default + paid
+
+        if per_account_days:
+            daily_incoming[:, day] = incoming
+            daily_default[:, day] = default
+
+    return InterestForecast(
+        incoming,
+        balances[:, -1] + applied if days else applied,
+        applied,
+        reversed_,
+        daily_accrued,
+        daily_applied,
+        daily_incoming,
+        daily_default,
+    )
+
+
+def to_decimal(amount, decimal_places):
+    """Converts one fixed-point amount from a forecast back to the Decimal the contract uses."""
+    return Decimal(int(amount)).scaleb(-decimal_places)
+
+
+def _rates(gross_interest_rate, accounts):
+    if isinstance(gross_interest_rate, (str, Decimal, int)):
+        return [Decimal(gross_interest_rate)] * accounts
+    rates = [Decimal(rate) for rate in gross_interest_rate]
+    if len(rates) != accounts:
+        raise ValueError(f"Expected {accounts} interest rates, got {len(rates)}")
+    return rates
+
+
+def _daily_rate_fraction(rates):
+    """
+    Returns (numerator_factor, denominator) such that an accrual in 10^-5 units is exactly
+    |balance in pence| * numerator_factor / denominator before rounding.
+    """
+    places = max((-rate.as_tuple().exponent for rate in rates), default=0)
+    places = max(places, 0)
+    numerators = np.array([int(rate.scaleb(places)) for rate in rates], dtype=np.int64)
+    numerator_factor = numerators * _ACCRUAL_UNITS_PER_PENNY
+    denominator = np.int64(DAYS_IN_YEAR * 10 ** places)
+    divisor = np.gcd(numerator_factor, denominator)
+    divisor[divisor == 0] = 1
+    return numerator_factor // divisor, denominator // divisor
+
+
+def _accrue(default, numerator_factor, denominator, rates):
+    numerator = np.abs(default) * numerator_factor
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice_remainder = 2 * remainder
+    accrual = quotient + (twice_remainder >= denominator)
+    # Decimal rounds rate / 365 to 28 significant digits before multiplying, so an exact tie can
+    # fall either side of it; redo those the contract's way.
+    for account in np.flatnonzero(twice_remainder == denominator):
+        accrual[account] = _contract_accrual(int(default[account]), rates[account])
+    return accrual
+
+
+def _contract_accrual(default_pence, rate):
+    effective_balance = Decimal(default_pence).scaleb(-MONEY_DECIMAL_PLACES)
+    amount = (effective_balance * (rate / DAYS_IN_YEAR)).copy_abs().quantize(
+        Decimal(".00001"), rounding=ROUND_HALF_UP)
+    return int(amount.scaleb(ACCRUAL_DECIMAL_PLACES))
+
+
+def _to_pence(accrual_units):
+    # Half up, as _precision_fulfillment; amounts are non-negative here.
+    return (accrual_units + _ACCRUAL_UNITS_PER_PENNY // 2) // _ACCRUAL_UNITS_PER_PENNY
@@ -0,0 +1,121 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.dirname(__file__))
+
+import local_simulator
+import portfolio_accrual
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import random
+import unittest
+
+import numpy as np
+
+CONTRACT_FILE = os.path.join(os.path.dirname(__file__), "tutorial_contract.py")
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+DAYS = 75
+
+
+def address(name, denomination="GBP"):
+    return (name, local_simulator.DEFAULT_ASSET, denomination, local_simulator.Phase.COMMITTED)
+
+
+class PortfolioAccrualTest(unittest.TestCase):
+    def run_contract(self, rate, payment_day, postings):
+        sim = local_simulator.LocalSimulator.from_file(
+            CONTRACT_FILE,
+            start=START,
+            template_params={
+                "denomination": "GBP",
+                # High enough that the overdraft fee never applies.
+                "overdraft_limit": "10000",
+                "overdraft_fee": "1",
+                "gross_interest_rate": rate,
+            },
+            instance_params={"interest_payment_day": str(payment_day)},
+        )
+        for timestamp, pence in postings:
+            amount = str(Decimal(abs(pence)).scaleb(-2))
+            if pence > 0:
+                sim.inbound_hard_settlement(amount, timestamp)
+            else:
+                sim.outbound_hard_settlement(amount, timestamp)
+        sim.run_until(START + timedelta(days=DAYS, minutes=1))
+        return sim
+
+    def test_reconciles_with_contract_hooks(self):
+        rng = random.Random(7)
+        # 0.0365 makes the daily rate exactly 0.0001, so odd balances in pence accrue on a tie.
+        rates = ["0.08", "0.0365", "0.01", "0.99", "0.0425", "0.08"]
+        payment_days = [5, 1, 28, 17, 1, 31]
+        accounts = []
+        for _ in rates:
+            postings = []
+            for day in range(DAYS):
+                for _ in range(rng.randint(0, 2)):
+                    # Some postings land exactly at midnight, when ACCRUE_INTEREST reads balances.
+                    hour = rng.choice([0, 9, 12, 23])
+                    postings.append((
+                        START + timedelta(days=day, hours=hour),
+                        rng.randint(-30000, 50000) if rng.random() < 0.9 else rng.randint(-9, 9),
+                    ))
+            accounts.append(postings)
+
+        balances = np.zeros((len(accounts), DAYS), dtype=np.int64)
+        first_day = (START + timedelta(days=1)).date()
+        for account, postings in enumerate(accounts):
+            for day in range(DAYS):
+                midnight = START + timedelta(days=day + 1)
+                balances[account, day] = sum(
+                    pence for timestamp, pence in postings if timestamp <= midnight)
+
+        forecast = portfolio_accrual.forecast_interest(
+            balances, rates, payment_days, first_day, per_account_days=True)
+
+        for account, (rate, payment_day, postings) in enumerate(
+            zip(rates, payment_days, accounts)
+        ):
+            sim = self.run_contract(rate, payment_day, postings)
+            timeseries = sim.balance_timeseries()
+            for day in range(DAYS):
+                after_interest = START + timedelta(days=day + 1, minutes=1)
+                balances_after = timeseries.at(after_interest)
+                self.assertEqual(
+                    balances_after[address("ACCRUED_INCOMING")].net,
+                    portfolio_accrual.to_decimal(
+                        forecast.daily_accrued_incoming[account, day], 5),
+                    f"account {account} day {day}",
+                )
+                self.assertEqual(
+                    balances_after[address("DEFAULT")].net,
+                    portfolio_accrual.to_decimal(forecast.daily_default[account, day], 2),
+                    f"account {account} day {day}",
+                )
+            internal = sim.balances("1")
+            self.assertEqual(
+                internal[address("DEFAULT")].net,
+                -Decimal(sum(pence for _, pence in postings)).scaleb(-2)
+                - portfolio_accrual.to_decimal(forecast.interest_applied[account], 2),
+            )
+            self.assertEqual(
+                internal[address("ACCRUED_OUTGOING")].net,
+                -portfolio_accrual.to_decimal(forecast.accrued_incoming[account], 5),
+            )
+
+        self.assertEqual(
+            forecast.daily_accrued.sum() - forecast.accrued_incoming.sum(),
+            forecast.interest_applied.sum() * 1000 + forecast.remainder_reversed.sum(),
+        )
+
+    def test_tie_rounds_half_up(self):
+        forecast = portfolio_accrual.forecast_interest(
+            [[5, -15]], "0.0365", 28, datetime(2019, 1, 2).date())
+        # 0.05 * 0.0001 = 0.000005 and |-0.15| * 0.0001 = 0.000015.
+        self.assertEqual(list(forecast.daily_accrued), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# flake8: noqa
@@ -10,6 +10,7 @@ import unittest
 core_api_url = "https://core-api.public-sandbox.partner.tmachine.io"
 auth_token = "A0003256414797670411991!FZ/D4LwwwqJMTyKW644WAqJkf/uXg7sC7LhWNtl7kL5dVCA7NDz6KQVLcMsei1O8eXBwxked7hNvZWQ9YXmrR8OPG+M="
 CONTRACT_FILE = "./tutorial_contract.py"
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
 
 
 class TutorialTest(unittest.TestCase):
@@ -24,7 +25,10 @@ class TutorialTest(unittest.TestCase):
         with open(contract) as smart_contract_file:
             self.smart_contract_contents = smart_contract_file.read()
         self.client = vault_caller.Client(
-            core_api_url=core_api_url, auth_token=auth_token)
+            core_api_url=core_api_url,
+            auth_token=auth_token,
+            transport=vault_caller.transport_from_environment(RECORDINGS_DIR),
+        )
 
     def make_simulate_contracts_call(
         self,
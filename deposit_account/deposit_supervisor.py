@@ -12,6 +12,17 @@ supervised_smart_contracts = [
    ),
 ]
 
+# instruction event types that do not count as deposits towards waiving the monthly fee
+IGNORED_DEPOSIT_EVENT_TYPES = [
+    "APPLY_INTEREST",
+    "MONTHLY_FEE",
+    "OPENING_BONUS",
+    "UPDATE_DEPOSIT_TRACKER",
+]
+# event types of the supervisees' MONTHLY_FEE instructions that clear their deposit trackers for
+# the next period, which are instructed whether or not the plan waives the fee
+DEPOSIT_TRACKER_EVENT_TYPES = ["UPDATE_DEPOSIT_TRACKER"]
+
 data_fetchers = [
     BalancesObservationFetcher(
         fetcher_id="live_balances",
@@ -33,6 +44,10 @@ def execution_schedules():
         ("MONTHLY_FEE", schedule_cron),
     ]
 
+# MONTHLY_FEE handles every supervisee in a single execution. Splitting it into slices across
+# follow-up executions would not bound their cost: data_scope="all" loads every supervisee (and
+# its month of postings) for each execution, and every supervisee's overridden MONTHLY_FEE hook
+# runs again for each one. Vault has no way to scope an execution to a subset of supervisees.
 @requires(
     event_type="MONTHLY_FEE",
     data_scope="all",
@@ -43,34 +58,14 @@ def execution_schedules():
 def scheduled_code(event_type, effective_date):
     if event_type == "MONTHLY_FEE":
         deposit_acct_vaults = _get_supervisees_for_alias(vault, "deposit")
-        ignored_types = [
-            "APPLY_INTEREST",
-            "MONTHLY_FEE",
-            "OPENING_BONUS",
-        ]
-        deposits = 0
-        for deposit_acct_vault in deposit_acct_vaults:
-            postings = deposit_acct_vault.get_postings()
-            for posting in postings:
-                if posting.instruction_details.get("event_type") not in ignored_types:
-                    deposits += 1
-        if deposits < len(deposit_acct_vaults):
-            for deposit_acct_vault in deposit_acct_vaults:
-                deposit_hook_directives = deposit_acct_vault.get_hook_directives()
-                deposit_pib_directives = deposit_hook_directives.posting_instruction_batch_directives
-                if not deposit_pib_directives:
-                    continue
-
-                posting_ins = []
-                for pib_directive in deposit_pib_directives:
-                    pib = pib_directive.posting_instruction_batch
-                    for posting in pib:
-                        posting_ins.append(posting)
-
-                if posting_ins:
-                    deposit_acct_vault.instruct_posting_batch(
-                        posting_instructions=posting_ins, effective_date=effective_date
-                    )
+        # The fee applies unless there was at least one deposit per supervisee
+        threshold = len(deposit_acct_vaults)
+        if _count_deposits(deposit_acct_vaults, threshold) < threshold:
+            _apply_monthly_fees(deposit_acct_vaults, effective_date)
+        else:
+            _apply_monthly_fees(
+                deposit_acct_vaults, effective_date, event_types=DEPOSIT_TRACKER_EVENT_TYPES
+            )
         new_schedule = _get_next_month_schedule(
             effective_date,
             timedelta(months=1),
@@ -104,29 +99,36 @@ def pre_posting_code(postings: PostingInstructionBatch, effective_date: datetime
     deposit_acct_vault = deposit_acct_vaults[0]
     denomination = deposit_acct_vault.get_parameter_timeseries(name="denomination").latest()
 
-    if len(postings) > 1:
-        raise Rejected(
-            "Currently we do not support more than one posting instruction per batch"
-        )
-    if postings[0].credit:
-        _validate_deposit_limits(deposit_acct_vaults, denomination, postings[0])
+    _validate_deposit_limits(deposit_acct_vaults, denomination, postings)
 
 
 def _validate_deposit_limits(
-    deposit_vaults: list, denomination: str, posting: PostingInstruction
+    deposit_vaults: list, denomination: str, postings: PostingInstructionBatch
 ) -> None:
     """
-    Determine whether a deposit to one of the accounts should be accepted, raising
-    Rejected exceptions otherwise
+    Determine whether a batch of postings to the accounts should be accepted, raising
+    Rejected exceptions otherwise. The batch is evaluated as a whole: its credits less its
+    debits across all the deposit accounts must fit within the total limit.
 
     :param deposit_vaults: deposit account vault objects.
     :param denomination: the denomination of the loc and loan accounts
-    :param posting: the posting to process
+    :param postings: the posting instruction batch to process
     :raises: Rejected if the deposit should not be accepted
     :return: None
     """
-    total_limit = 0
-    total_balance = posting.amount
+    deposit_account_ids = {deposit_vault.account_id for deposit_vault in deposit_vaults}
+    incoming_amount = Decimal(0)
+    for posting in postings:
+        if posting.account_id in deposit_account_ids:
+            incoming_amount += posting.amount if posting.credit else -posting.amount
+    if incoming_amount <= 0:
+        return
+
+    # data_scope="all" has Vault load every supervisee's balances and parameters for this hook
+    # anyway, so the totals are summed from them rather than cached: a cache would save no
+    # fetching and would lag behind maximum_balance_limit changes.
+    total_limit = Decimal(0)
+    total_balance = incoming_amount
     for deposit_vault in deposit_vaults:
         # This is how the balance dictionary is fetched using the
         # live balances Fetcher ID
@@ -149,6 +151,65 @@ def _validate_deposit_limits(
             reason_code=RejectedReason.AGAINST_TNC,
         )
 
+def _apply_monthly_fees(
+    deposit_vaults: list, effective_date: datetime, event_types: list = None
+) -> None:
+    """
+    Instructs what each supervisee's own MONTHLY_FEE hook directed
+    :param deposit_vaults: list[Vault], deposit account vault objects
+    :param effective_date: datetime, when this MONTHLY_FEE execution runs
+    :param event_types: list[str], if given, only instructions with these event types
+    :return: None
+    """
+    for deposit_vault in deposit_vaults:
+        posting_ins = _get_directed_posting_instructions(deposit_vault)
+        if event_types is not None:
+            posting_ins = [
+                posting_instruction
+                for posting_instruction in posting_ins
+                if posting_instruction.instruction_details.get("event_type") in event_types
+            ]
+        if posting_ins:
+            deposit_vault.instruct_posting_batch(
+                posting_instructions=posting_ins, effective_date=effective_date
+            )
+
+
+def _count_deposits(deposit_vaults: list, threshold: int) -> int:
+    """
+    Counts the postings across the supervisees that are deposits rather than interest, fees or
+    bonuses, stopping as soon as the count reaches threshold.
+    :param deposit_vaults: list[Vault], deposit account vault objects
+    :param threshold: int, the count beyond which the exact number does not matter
+    :return: int, the number of deposits, or threshold if there are at least that many
+    """
+    deposits = 0
+    for deposit_vault in deposit_vaults:
+        if deposits >= threshold:
+            break
+        for posting in deposit_vault.get_postings():
+            if posting.instruction_details.get("event_type") not in IGNORED_DEPOSIT_EVENT_TYPES:
+                deposits += 1
+                if deposits >= threshold:
+                    break
+    return min(deposits, threshold)
+
+
+def _get_directed_posting_instructions(deposit_vault) -> list:
+    """
+    Collects the posting instructions from every posting instruction batch directive the
+    supervisee's own hook produced, so they can be instructed as a single batch.
+    :param deposit_vault: Vault, the supervisee vault object
+    :return: list, the posting instructions of all the supervisee's batch directives
+    """
+    deposit_hook_directives = deposit_vault.get_hook_directives()
+    pib_directives = deposit_hook_directives.posting_instruction_batch_directives or []
+    posting_ins = []
+    for pib_directive in pib_directives:
+        posting_ins.extend(pib_directive.posting_instruction_batch)
+    return posting_ins
+
+
 def _get_supervisees_for_alias(vault, alias: str) -> list:
     """
     Returns a list of supervisee vault objects for the given alias, ordered by account creation date
@@ -0,0 +1,138 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import supervisor_stub
+from datetime import datetime, timedelta, timezone
+import unittest
+
+MONTHLY_FEE_DATE = datetime(2019, 2, 1, 0, 10, tzinfo=timezone.utc)
+
+
+def fee(account_id):
+    return supervisor_stub.debit(account_id, "10", event_type="MONTHLY_FEE")
+
+
+def tracker_reset(account_id):
+    # Stands in for the supervisee clearing its DEPOSITED_THIS_PERIOD flag.
+    return supervisor_stub.debit(account_id, "1", event_type="UPDATE_DEPOSIT_TRACKER")
+
+
+class MonthlyFeeTest(unittest.TestCase):
+    def make_plan(self, size):
+        plan = supervisor_stub.make_plan(size)
+        for supervisee in plan.supervisees.values():
+            supervisee.directed_posting_instructions = [fee(supervisee.account_id)]
+        return plan, supervisor_stub.load_supervisor(plan)
+
+    def run_monthly_fee(self, supervisor):
+        supervisor["scheduled_code"]("MONTHLY_FEE", MONTHLY_FEE_DATE)
+
+    def test_fee_applied_without_a_deposit_per_supervisee(self):
+        plan, supervisor = self.make_plan(3)
+        supervisees = sorted(plan.supervisees)
+        plan.supervisees[supervisees[0]].postings = [
+            supervisor_stub.credit(supervisees[0], "5"),
+            supervisor_stub.credit(supervisees[0], "1", event_type="APPLY_INTEREST"),
+            supervisor_stub.credit(supervisees[0], "1", event_type="OPENING_BONUS"),
+        ]
+        self.run_monthly_fee(supervisor)
+        for supervisee in plan.supervisees.values():
+            self.assertEqual(len(supervisee.instructed), 1)
+            self.assertEqual(supervisee.instructed[0][0], MONTHLY_FEE_DATE)
+
+    def test_fee_waived_with_a_deposit_per_supervisee(self):
+        plan, supervisor = self.make_plan(3)
+        supervisees = sorted(plan.supervisees)
+        # Deposits are counted across the plan, not per supervisee.
+        plan.supervisees[supervisees[0]].postings = [
+            supervisor_stub.credit(supervisees[0], "5") for _ in range(3)]
+        self.run_monthly_fee(supervisor)
+        for supervisee in plan.supervisees.values():
+            self.assertEqual(supervisee.instructed, [])
+
+    def test_supervisees_reset_their_trackers_whether_or_not_the_fee_is_waived(self):
+        for waived in [False, True]:
+            plan, supervisor = self.make_plan(3)
+            first, *others = [
+                plan.supervisees[account_id] for account_id in sorted(plan.supervisees)]
+            # The first supervisee had a deposit, so its own hook resets its tracker instead of
+            # charging the fee.
+            first.directed_posting_instructions = [tracker_reset(first.account_id)]
+            first.postings = [
+                supervisor_stub.credit(first.account_id, "5") for _ in range(3 if waived else 1)]
+            self.run_monthly_fee(supervisor)
+
+            self.assertEqual(
+                first.instructed, [(MONTHLY_FEE_DATE, first.directed_posting_instructions)])
+            for supervisee in others:
+                expected = [(MONTHLY_FEE_DATE, supervisee.directed_posting_instructions)]
+                self.assertEqual(supervisee.instructed, [] if waived else expected)
+
+    def test_large_plan_completes_in_one_execution(self):
+        plan, supervisor = self.make_plan(1000)
+        self.run_monthly_fee(supervisor)
+        self.assertTrue(all(supervisee.instructed for supervisee in plan.supervisees.values()))
+        schedule = plan.schedules["MONTHLY_FEE"]
+        self.assertEqual(
+            (schedule.year, schedule.month, schedule.day, schedule.hour, schedule.minute),
+            ("2019", "3", "1", "0", "10"),
+        )
+
+
+class DepositLimitTest(unittest.TestCase):
+    # Three supervisees holding 100 each against limits of 200 each: 300 of headroom.
+    def setUp(self):
+        self.plan = supervisor_stub.make_plan(3, balance="100", maximum_balance_limit="200")
+        self.supervisor = supervisor_stub.load_supervisor(self.plan)
+        self.account_ids = sorted(self.plan.supervisees)
+
+    def pre_posting(self, *posting_instructions):
+        self.supervisor["pre_posting_code"](
+            supervisor_stub.batch(posting_instructions), supervisor_stub.START)
+
+    def assert_rejected(self, *posting_instructions):
+        with self.assertRaises(self.supervisor["Rejected"]) as context:
+            self.pre_posting(*posting_instructions)
+        self.assertIn("exceed total limit", context.exception.message)
+
+    def test_credit_within_and_over_the_plan_limit(self):
+        self.pre_posting(supervisor_stub.credit(self.account_ids[0], "300"))
+        self.assert_rejected(supervisor_stub.credit(self.account_ids[0], "300.01"))
+
+    def test_batch_is_checked_on_its_net_effect(self):
+        self.pre_posting(
+            supervisor_stub.credit(self.account_ids[0], "250"),
+            supervisor_stub.credit(self.account_ids[1], "150"),
+            supervisor_stub.debit(self.account_ids[2], "100"),
+        )
+        self.assert_rejected(
+            supervisor_stub.credit(self.account_ids[0], "250"),
+            supervisor_stub.credit(self.account_ids[1], "150"),
+        )
+        # Debits alone never breach the limit, whatever the balances.
+        self.plan.supervisees[self.account_ids[0]].set_balance("DEFAULT", "1000")
+        self.pre_posting(supervisor_stub.debit(self.account_ids[0], "1"))
+
+    def test_balances_are_read_when_the_posting_is_checked(self):
+        self.plan.supervisees[self.account_ids[1]].set_balance("DEFAULT", "300")
+        self.assert_rejected(supervisor_stub.credit(self.account_ids[0], "100.01"))
+
+    def test_lowered_limit_applies_to_the_next_posting(self):
+        self.plan.supervisees[self.account_ids[2]].set_parameter(
+            "maximum_balance_limit", "100", at=supervisor_stub.START + timedelta(hours=1))
+        self.assert_rejected(supervisor_stub.credit(self.account_ids[0], "200.01"))
+        self.pre_posting(supervisor_stub.credit(self.account_ids[0], "200"))
+
+    def test_replaced_supervisee_is_counted_instead_of_the_old_one(self):
+        # The same number of supervisees, but a fuller account in place of one of them.
+        replaced = self.plan.supervisees.pop(self.account_ids[2])
+        self.plan.supervisees["deposit_new"] = supervisor_stub.SuperviseeVault(
+            "deposit_new", replaced.get_account_creation_date(), "200", "200")
+        self.assert_rejected(supervisor_stub.credit(self.account_ids[0], "200.01"))
+        self.pre_posting(supervisor_stub.credit("deposit_new", "0.01"), supervisor_stub.debit(
+            "deposit_new", "0.01"))
+
+
+if __name__ == "__main__":
+    unittest.main()
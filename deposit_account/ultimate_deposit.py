@@ -16,14 +16,11 @@ from contracts_api import (
     Posting,
     PostingInstructionsDirective,
     PostingInstructionType,
-    PostingsIntervalFetcher,
     Rejection,
     RejectionReason,
-    RelativeDateTime,
     requires,
     ScheduledEvent,
     ScheduleExpression,
-    Shift,
     SmartContractEventType,
     TransactionCode,
     Tside,
@@ -36,6 +33,8 @@ from contracts_api import (
     ActivationHookResult,
     DerivedParameterHookArguments,
     DerivedParameterHookResult,
+    PostPostingHookArguments,
+    PostPostingHookResult,
     PrePostingHookArguments,
     PrePostingHookResult,
     ScheduledEventHookArguments,
@@ -57,7 +56,7 @@ from contracts_api import (
 )
 
 api = "4.0.0"
-version = "1.0.0"
+version = "1.1.0"
 tside = Tside.LIABILITY
 supported_denominations = ["GBP"]
 
@@ -167,14 +166,6 @@ data_fetchers = [
         fetcher_id="live_balances",
         at=DefinedDateTime.LIVE,
     ),
-    PostingsIntervalFetcher(
-        fetcher_id="1_month",
-        start=RelativeDateTime(
-            origin=DefinedDateTime.EFFECTIVE_DATETIME,
-            shift=Shift(months=-1),
-        ),
-        end=DefinedDateTime.EFFECTIVE_DATETIME,
-    ),
 ]
 
 # event types
@@ -196,6 +187,21 @@ event_types = [
 
 # balance addresses
 INTEREST = "INTEREST"
+# Set to 1 (against INTERNAL_CONTRA) by the first deposit since the last monthly fee, so the
+# fee only needs live balances rather than a month of postings.
+DEPOSITED_THIS_PERIOD = "DEPOSITED_THIS_PERIOD"
+INTERNAL_CONTRA = "INTERNAL_CONTRA"
+
+# event_type of the instructions that set and reset DEPOSITED_THIS_PERIOD
+UPDATE_DEPOSIT_TRACKER = "UPDATE_DEPOSIT_TRACKER"
+# event_types of the instructions the contract makes itself, which are never deposits
+CONTRACT_EVENT_TYPES = [
+    "OPENING_BONUS",
+    APPLY_INTEREST,
+    MONTHLY_FEE,
+    ACCRUE_INTEREST,
+    UPDATE_DEPOSIT_TRACKER,
+]
 
 
 @requires(parameters=True)
@@ -291,6 +297,34 @@ def pre_posting_hook(vault, hook_arguments: PrePostingHookArguments):
             )
 
 
+@requires(parameters=True)
+@fetch_account_data(balances=["live_balances"])
+def post_posting_hook(
+    vault, hook_arguments: PostPostingHookArguments
+) -> Optional[PostPostingHookResult]:
+    # Vault does not run this hook for the postings the contract instructs itself, and their
+    # event_types are skipped anyway, so only the customer's own deposits set the flag. Once it
+    # is set, further deposits in the period post nothing.
+    if not _has_deposit(hook_arguments.posting_instructions):
+        return None
+    denomination = vault.get_parameter_timeseries(name="denomination").latest()
+    balances = vault.get_balances_observation(fetcher_id="live_balances").balances
+    if balances[
+        BalanceCoordinate(DEPOSITED_THIS_PERIOD, DEFAULT_ASSET, denomination, Phase.COMMITTED)
+    ].net > 0:
+        return None
+    return PostPostingHookResult(
+        posting_instructions_directives=[
+            PostingInstructionsDirective(
+                posting_instructions=_update_deposit_tracker(
+                    vault, denomination, Decimal(1)
+                ),
+                value_datetime=hook_arguments.effective_datetime,
+            )
+        ]
+    )
+
+
 @requires(parameters=True)
 def activation_hook(
     vault, hook_arguments: ActivationHookArguments
@@ -365,7 +399,7 @@ def activation_hook(
 @requires(event_type="APPLY_INTEREST", parameters=True)
 @fetch_account_data(event_type="APPLY_INTEREST", balances=["live_balances"])
 @requires(event_type="MONTHLY_FEE", parameters=True)
-@fetch_account_data(event_type="MONTHLY_FEE", postings=["1_month"])
+@fetch_account_data(event_type="MONTHLY_FEE", balances=["live_balances"])
 @requires(event_type="ACCRUE_INTEREST", parameters=True)
 @fetch_account_data(event_type="ACCRUE_INTEREST", balances=["live_balances"])
 def scheduled_event_hook(vault, hook_arguments: ScheduledEventHookArguments):
@@ -452,28 +486,22 @@ def _handle_monthly_fee_schedule(vault, hook_arguments):
         name="monthly_fee_income_internal_account"
     ).latest()
 
-    deposits = 0
+    balances = vault.get_balances_observation(fetcher_id="live_balances").balances
+    deposited = balances[
+        BalanceCoordinate(DEPOSITED_THIS_PERIOD, DEFAULT_ASSET, denomination, Phase.COMMITTED)
+    ].net
 
-    posting_instructions = vault.get_posting_instructions(fetcher_id="1_month")
-    for posting_instruction in posting_instructions:
-        if posting_instruction.type == PostingInstructionType.CUSTOM_INSTRUCTION:
-            # custom instructions do not have an "amount" attribute but its postings do
-            if (
-                posting_instruction.instruction_details.get("event_type")
-                != "APPLY_INTEREST"
-            ):
-                for posting in posting_instruction.postings:
-                    if posting.amount > 0:
-                        deposits += 1
-        else:
-            if (
-                posting_instruction.amount > 0
-                and posting_instruction.instruction_details.get("event_type")
-                != "APPLY_INTEREST"
-            ):
-                deposits += 1
-
-    if not deposits:
+    if deposited > 0:
+        # clear the flag for the next period; concurrent deposits may have set it more than once
+        posting_instructions_directives.append(
+            PostingInstructionsDirective(
+                posting_instructions=_update_deposit_tracker(
+                    vault, denomination, -deposited
+                ),
+                value_datetime=hook_arguments.effective_datetime,
+            )
+        )
+    else:
         posting_instruction = _move_funds_between_vault_accounts(
             from_account_id=vault.account_id,
             from_account_address=DEFAULT_ADDRESS,
@@ -576,6 +604,61 @@ def _get_next_schedule_expression(start_date, offset):
     )
 
 
+def _has_deposit(
+    posting_instructions: list[
+        Union[
+            AuthorisationAdjustment,
+            CustomInstruction,
+            InboundAuthorisation,
+            InboundHardSettlement,
+            OutboundAuthorisation,
+            OutboundHardSettlement,
+            Release,
+            Settlement,
+            Transfer,
+        ]
+    ]
+) -> bool:
+    for posting_instruction in posting_instructions:
+        if posting_instruction.instruction_details.get("event_type") in CONTRACT_EVENT_TYPES:
+            continue
+        if posting_instruction.type == PostingInstructionType.CUSTOM_INSTRUCTION:
+            # custom instructions do not have an "amount" attribute but its postings do
+            if any(posting.amount > 0 for posting in posting_instruction.postings):
+                return True
+        elif posting_instruction.amount > 0:
+            return True
+    return False
+
+
+def _update_deposit_tracker(
+    vault, denomination: str, amount: Decimal
+) -> list[CustomInstruction]:
+    """
+    Adds amount (which may be negative) to DEPOSITED_THIS_PERIOD, against INTERNAL_CONTRA.
+    """
+    from_address, to_address = INTERNAL_CONTRA, DEPOSITED_THIS_PERIOD
+    if amount < 0:
+        from_address, to_address = to_address, from_address
+    return _move_funds_between_vault_accounts(
+        from_account_id=vault.account_id,
+        from_account_address=from_address,
+        to_account_id=vault.account_id,
+        to_account_address=to_address,
+        asset=DEFAULT_ASSET,
+        denomination=denomination,
+        amount=abs(amount),
+        instruction_details={
+            # CLv4 has no client transaction ID - this is for compatibility with legacy integrations
+            "ext_client_transaction_id": (
+                f"{UPDATE_DEPOSIT_TRACKER}_{vault.get_hook_execution_id()}"
+            ),
+            "description": f"Updating deposited this period flag by {amount}.",
+            "event_type": UPDATE_DEPOSIT_TRACKER,
+        },
+    )
+
+
 def total_balances(
     input_posting_instructions: list[
         Union[
@@ -0,0 +1,159 @@
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+
+import ultimate_deposit
+from contracts_api import (
+    Balance,
+    BalanceCoordinate,
+    BalanceDefaultDict,
+    BalancesObservation,
+    DEFAULT_ASSET,
+    InboundHardSettlement,
+    OutboundHardSettlement,
+    Phase,
+    PostPostingHookArguments,
+    ScheduledEventHookArguments,
+)
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import Mock
+import unittest
+
+ACCOUNT_ID = "Main account"
+EFFECTIVE_DATE = datetime(2019, 2, 1, 0, 10, tzinfo=timezone.utc)
+PARAMETERS = {
+    "denomination": "GBP",
+    "monthly_fee": Decimal("10"),
+    "monthly_fee_income_internal_account": "MONTHLY_FEE_INCOME_INTERNAL_ACCOUNT",
+}
+DEPOSITED_THIS_PERIOD = BalanceCoordinate(
+    ultimate_deposit.DEPOSITED_THIS_PERIOD, DEFAULT_ASSET, "GBP", Phase.COMMITTED
+)
+
+
+def make_vault(deposited=Decimal(0)):
+    vault = Mock()
+    vault.account_id = ACCOUNT_ID
+    vault.get_hook_execution_id.return_value = "hook_execution_id"
+    vault.get_parameter_timeseries.side_effect = lambda name: Mock(
+        latest=Mock(return_value=PARAMETERS[name])
+    )
+    vault.get_balances_observation.return_value = BalancesObservation(
+        balances=BalanceDefaultDict(
+            mapping={
+                DEPOSITED_THIS_PERIOD: Balance(credit=deposited, debit=Decimal(0), net=deposited)
+            }
+        ),
+        value_datetime=EFFECTIVE_DATE,
+    )
+    return vault
+
+
+def deposit(amount, event_type=None):
+    return InboundHardSettlement(
+        amount=Decimal(amount),
+        denomination="GBP",
+        target_account_id=ACCOUNT_ID,
+        internal_account_id="1",
+        instruction_details={"event_type": event_type} if event_type else {},
+    )
+
+
+def withdrawal(amount):
+    return OutboundHardSettlement(
+        amount=Decimal(amount),
+        denomination="GBP",
+        target_account_id=ACCOUNT_ID,
+        internal_account_id="1",
+    )
+
+
+def instructed_postings(result):
+    return [
+        (posting.account_address, posting.credit, posting.amount)
+        for directive in result.posting_instructions_directives
+        for posting_instruction in directive.posting_instructions
+        for posting in posting_instruction.postings
+        if posting.account_id == ACCOUNT_ID
+    ]
+
+
+class DepositedThisPeriodTest(unittest.TestCase):
+    def post_posting(self, vault, *posting_instructions):
+        return ultimate_deposit.post_posting_hook(
+            vault,
+            PostPostingHookArguments(
+                effective_datetime=EFFECTIVE_DATE,
+                posting_instructions=list(posting_instructions),
+                client_transactions={},
+            ),
+        )
+
+    def monthly_fee(self, vault):
+        return ultimate_deposit.scheduled_event_hook(
+            vault,
+            ScheduledEventHookArguments(
+                effective_datetime=EFFECTIVE_DATE, event_type=ultimate_deposit.MONTHLY_FEE
+            ),
+        )
+
+    def test_first_deposit_of_the_period_sets_the_flag(self):
+        result = self.post_posting(make_vault(), withdrawal("5"), deposit("20"), deposit("30"))
+        self.assertEqual(
+            instructed_postings(result),
+            [
+                (ultimate_deposit.DEPOSITED_THIS_PERIOD, True, Decimal(1)),
+                (ultimate_deposit.INTERNAL_CONTRA, False, Decimal(1)),
+            ],
+        )
+
+    def test_later_deposits_post_nothing(self):
+        self.assertIsNone(self.post_posting(make_vault(deposited=Decimal(1)), deposit("20")))
+
+    def test_withdrawals_and_contract_postings_are_not_deposits(self):
+        self.assertIsNone(
+            self.post_posting(
+                make_vault(),
+                withdrawal("5"),
+                deposit("100", event_type="OPENING_BONUS"),
+                deposit("1", event_type=ultimate_deposit.APPLY_INTEREST),
+                deposit("1", event_type=ultimate_deposit.UPDATE_DEPOSIT_TRACKER),
+            )
+        )
+
+    def test_fee_charged_without_a_deposit(self):
+        result = self.monthly_fee(make_vault())
+        self.assertEqual(
+            instructed_postings(result),
+            [("DEFAULT", False, PARAMETERS["monthly_fee"])],
+        )
+        self.assertEqual(
+            result.update_account_event_type_directives[0].event_type,
+            ultimate_deposit.MONTHLY_FEE,
+        )
+
+    def test_fee_waived_and_flag_reset_after_a_deposit(self):
+        result = self.monthly_fee(make_vault(deposited=Decimal(1)))
+        self.assertEqual(
+            instructed_postings(result),
+            [
+                (ultimate_deposit.INTERNAL_CONTRA, True, Decimal(1)),
+                (ultimate_deposit.DEPOSITED_THIS_PERIOD, False, Decimal(1)),
+            ],
+        )
+
+    def test_flag_set_twice_is_reset_in_full(self):
+        # Concurrent batches can each see the flag clear and both set it.
+        result = self.monthly_fee(make_vault(deposited=Decimal(2)))
+        self.assertEqual(
+            instructed_postings(result),
+            [
+                (ultimate_deposit.INTERNAL_CONTRA, True, Decimal(2)),
+                (ultimate_deposit.DEPOSITED_THIS_PERIOD, False, Decimal(2)),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,1346 @@
+"""
+Runs v3 smart contracts in-process against an in-memory ledger, instead of through the core API's
+simulate endpoint.
+
+The contract source is executed with stand-ins for the globals Vault provides (Parameter,
+requires, Rejected, Phase, timedelta, ...) and a `vault` object backed by the ledger.
+LocalSimulator then drives pre_posting_code, post_posting_code and scheduled_code in time order.
+Posting batches are queued with submit (taking the same create_posting_instruction_batch
+instructions the product test suites send to simulate_contracts) or with the hard settlement
+helpers, and run_until executes them along with every scheduled event that falls due.
+
+    sim = LocalSimulator.from_file(
+        "current_account/tutorial_contract.py",
+        start=datetime(2019, 1, 1, tzinfo=timezone.utc),
+        template_params={"denomination": "GBP", "gross_interest_rate": "0.08", ...},
+    )
+    sim.inbound_hard_settlement("1000", datetime(2019, 1, 1, 1, tzinfo=timezone.utc))
+    sim.run_until(datetime(2019, 1, 5, 1, tzinfo=timezone.utc))
+    sim.balances()[("ACCRUED_INCOMING", DEFAULT_ASSET, "GBP", Phase.COMMITTED)].net
+
+Only what the contracts in this repository rely on is modelled: hard settlements and internal
+transfers, committed postings, and schedules given as year/month/day/hour/minute/second fields.
+As on Vault, postings a contract instructs itself do not run the posting hooks again.
+"""
+import builtins
+import calendar
+import heapq
+import itertools
+import json
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta as _timedelta
+from decimal import ROUND_CEILING, ROUND_DOWN, ROUND_FLOOR, ROUND_HALF_DOWN, ROUND_HALF_EVEN
+from decimal import ROUND_HALF_UP, ROUND_UP, Decimal
+
+from dateutil.relativedelta import relativedelta
+
+DEFAULT_ADDRESS = "DEFAULT"
+DEFAULT_ASSET = "COMMERCIAL_BANK_MONEY"
+MAIN_ACCOUNT_ID = "main_account"
+# How many days ahead to look for a day matching a schedule before deciding it never fires again.
+MAX_SCHEDULE_LOOKAHEAD_DAYS = 4 * 366
+
+_ONE_DAY = _timedelta(days=1)
+_WINDOW_UNITS = {
+    "minute": "minutes",
+    "hour": "hours",
+    "day": "days",
+    "week": "weeks",
+    "month": "months",
+    "year": "years",
+}
+
+
+class Tside:
+    ASSET = "ASSET"
+    LIABILITY = "LIABILITY"
+
+
+class Phase:
+    COMMITTED = "POSTING_PHASE_COMMITTED"
+    PENDING_IN = "POSTING_PHASE_PENDING_INCOMING"
+    PENDING_OUT = "POSTING_PHASE_PENDING_OUTGOING"
+
+
+class Level:
+    GLOBAL = "GLOBAL"
+    TEMPLATE = "TEMPLATE"
+    INSTANCE = "INSTANCE"
+
+
+class UpdatePermission:
+    FIXED = "FIXED"
+    OPS_EDITABLE = "OPS_EDITABLE"
+    USER_EDITABLE = "USER_EDITABLE"
+    USER_EDITABLE_WITH_OPS_PERMISSION = "USER_EDITABLE_WITH_OPS_PERMISSION"
+
+
+class NumberKind:
+    PLAIN = "PLAIN"
+    MONEY = "MONEY"
+    MONTHS = "MONTHS"
+    PERCENTAGE = "PERCENTAGE"
+
+
+class RejectedReason:
+    UNKNOWN_REASON = "UNKNOWN_REASON"
+    INSUFFICIENT_FUNDS = "INSUFFICIENT_FUNDS"
+    WRONG_DENOMINATION = "WRONG_DENOMINATION"
+    AGAINST_TNC = "AGAINST_TNC"
+    CLIENT_CUSTOM_REASON = "CLIENT_CUSTOM_REASON"
+
+
+class PostingInstructionType:
+    AUTHORISATION = "AUTHORISATION"
+    AUTHORISATION_ADJUSTMENT = "AUTHORISATION_ADJUSTMENT"
+    CUSTOM_INSTRUCTION = "CUSTOM_INSTRUCTION"
+    HARD_SETTLEMENT = "HARD_SETTLEMENT"
+    RELEASE = "RELEASE"
+    SETTLEMENT = "SETTLEMENT"
+    TRANSFER = "TRANSFER"
+
+
+class NoteType:
+    RAW_TEXT = "RAW_TEXT"
+    REASSURING = "REASSURING"
+    NEGATIVE = "NEGATIVE"
+    POSITIVE = "POSITIVE"
+
+
+class Rejected(Exception):
+    def __init__(self, message="", reason_code=RejectedReason.UNKNOWN_REASON):
+        super().__init__(message)
+        self.message = message
+        self.reason_code = reason_code
+
+
+class InvalidContractParameter(Exception):
+    pass
+
+
+class NumberShape:
+    def __init__(self, **constraints):
+        self.constraints = constraints
+
+    def parse(self, value):
+        value = Decimal(value)
+        # Contracts use whole-number parameters such as days of the month and terms directly in
+        # date arithmetic (date.replace(day=...)), which needs ints.
+        if self.constraints.get("step") == 1 and value == value.to_integral_value():
+            return int(value)
+        return value
+
+
+class StringShape:
+    parse = str
+
+
+class DenominationShape(StringShape):
+    pass
+
+
+class AccountIdShape(StringShape):
+    pass
+
+
+class DateShape:
+    @staticmethod
+    def parse(value):
+        if isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class OptionalValue:
+    __slots__ = ("value",)
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def is_set(self):
+        return self.value is not None
+
+
+class OptionalShape:
+    def __init__(self, shape):
+        self.shape = shape
+
+    def parse(self, value):
+        return OptionalValue(None if value is None else self.shape.parse(value))
+
+
+class Parameter:
+    def __init__(self, name, shape=None, level=None, default_value=None, **details):
+        self.name = name
+        self.shape = shape
+        self.level = level
+        self.default_value = default_value
+        self.details = details
+
+    def parse(self, value):
+        if isinstance(self.shape, OptionalShape):
+            return self.shape.parse(value)
+        if value is None or self.shape is None:
+            return value
+        return self.shape.parse(value)
+
+
+def requires(**requirements):
+    """Records a hook's data requirements on it; get_postings uses them for its window."""
+    def decorator(hook):
+        hook.__dict__.setdefault("requirements", []).append(requirements)
+        return hook
+
+    return decorator
+
+
+def fetch_account_data(**fetchers):
+    def decorator(hook):
+        return hook
+
+    return decorator
+
+
+Balance = namedtuple("Balance", ["credit", "debit", "net"])
+_ZERO = Decimal(0)
+_ZERO_BALANCE = Balance(_ZERO, _ZERO, _ZERO)
+
+# Balance coordinates, (address, asset, denomination, phase), interned to small integers shared by
+# every timeseries, so columns are keyed by an int and each tuple is stored once.
+_coordinate_ids = {}
+_coordinates = []
+
+
+def _intern(key):
+    coordinate = _coordinate_ids.get(key)
+    if coordinate is None:
+        coordinate = _coordinate_ids[key] = len(_coordinates)
+        _coordinates.append(tuple(key))
+    return coordinate
+
+
+def _added(left, right):
+    return Balance(left.credit + right.credit, left.debit + right.debit, left.net + right.net)
+
+
+class BalanceDefaultDict(dict):
+    """
+    Balances keyed by (address, asset, denomination, phase). Missing keys read as a zero Balance
+    without being inserted, so hooks can index freely into snapshots shared with the ledger.
+    """
+    def __missing__(self, key):
+        return _ZERO_BALANCE
+
+    def copy(self):
+        return BalanceDefaultDict(self)
+
+    def __add__(self, other):
+        total = self.copy()
+        total += other
+        return total
+
+    def __iadd__(self, other):
+        if type(other) is _InstructionBalances:
+            # Summing instructions, as total_balances does, adds their legs without building a
+            # dict for each one.
+            for posting in other.postings():
+                _add_posting(self, posting, other.tside)
+        else:
+            for key, balance in other.items():
+                self[key] = _added(self[key], balance)
+        return self
+
+
+Posting = namedtuple(
+    "Posting",
+    ["credit", "amount", "denomination", "account_id", "account_address", "asset", "phase"],
+)
+
+
+def _posted(balance, posting, tside):
+    credit, debit, net = balance
+    amount = posting.amount
+    if posting.credit:
+        credit += amount
+    else:
+        debit += amount
+    # Net is credit - debit for liability accounts and debit - credit for asset accounts.
+    if posting.credit == (tside == Tside.LIABILITY):
+        net += amount
+    else:
+        net -= amount
+    return Balance(credit, debit, net)
+
+
+def _key(posting):
+    return (posting.account_address, posting.asset, posting.denomination, posting.phase)
+
+
+def _add_posting(balances, posting, tside):
+    key = _key(posting)
+    balances[key] = _posted(balances[key], posting, tside)
+
+
+class _BalanceMapping:
+    """
+    The read-only mapping interface hooks use on balances (indexing with zero defaults, get, in,
+    items, ...), over whatever _lookup and _keys provide.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        balance = self._lookup(key)
+        return _ZERO_BALANCE if balance is None else balance
+
+    def get(self, key, default=None):
+        balance = self._lookup(key)
+        return default if balance is None else balance
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def keys(self):
+        return list(self._keys())
+
+    def items(self):
+        return [(key, self._lookup(key)) for key in self._keys()]
+
+    def values(self):
+        return [self._lookup(key) for key in self._keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def copy(self):
+        return BalanceDefaultDict(self.items())
+
+    def __eq__(self, other):
+        if not isinstance(other, (dict, _BalanceMapping)):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+
+class _InstructionBalances(_BalanceMapping):
+    """What PostingInstruction.balances returns: computed from the legs on each lookup."""
+    __slots__ = ("instruction", "account_id", "tside")
+
+    def __init__(self, instruction, account_id, tside):
+        self.instruction = instruction
+        self.account_id = account_id
+        self.tside = tside
+
+    def postings(self):
+        account_id = self.account_id
+        return [
+            posting for posting in self.instruction.postings if posting.account_id == account_id
+        ]
+
+    def _lookup(self, key):
+        key = tuple(key)
+        balance = None
+        for posting in self.postings():
+            if _key(posting) == key:
+                balance = _posted(balance or _ZERO_BALANCE, posting, self.tside)
+        return balance
+
+    def _keys(self):
+        return dict.fromkeys(_key(posting) for posting in self.postings())
+
+
+class PostingInstruction:
+    """
+    One instruction of a batch. Its postings are the legs it moves money between; the
+    instruction-level attributes hooks read (credit, amount, account_address, ...) are those of
+    the first leg, which is always the leg on the account the instruction targets.
+    """
+    __slots__ = (
+        "type",
+        "postings",
+        "client_transaction_id",
+        "instruction_details",
+        "pics",
+        "value_timestamp",
+        "tside",
+    )
+
+    def __init__(
+        self,
+        type,
+        postings,
+        client_transaction_id="",
+        instruction_details=None,
+        pics=(),
+        value_timestamp=None,
+        tside=Tside.LIABILITY,
+    ):
+        self.type = type
+        self.postings = postings
+        self.client_transaction_id = client_transaction_id
+        self.instruction_details = instruction_details or {}
+        self.pics = pics
+        self.value_timestamp = value_timestamp
+        self.tside = tside
+
+    @property
+    def credit(self):
+        return self.postings[0].credit
+
+    @property
+    def amount(self):
+        return self.postings[0].amount
+
+    @property
+    def denomination(self):
+        return self.postings[0].denomination
+
+    @property
+    def account_id(self):
+        return self.postings[0].account_id
+
+    @property
+    def account_address(self):
+        return self.postings[0].account_address
+
+    @property
+    def asset(self):
+        return self.postings[0].asset
+
+    @property
+    def phase(self):
+        return self.postings[0].phase
+
+    def balances(self, account_id=None, tside=None):
+        return _InstructionBalances(self, account_id or self.account_id, tside or self.tside)
+
+
+class PostingInstructionBatch(list):
+    def __init__(
+        self,
+        posting_instructions=(),
+        value_timestamp=None,
+        client_batch_id="",
+        batch_details=None,
+    ):
+        super().__init__(posting_instructions)
+        self.value_timestamp = value_timestamp
+        self.client_batch_id = client_batch_id
+        self.batch_details = batch_details or {}
+
+
+class ParameterTimeseries:
+    def __init__(self, entries=()):
+        self._timestamps = [timestamp for timestamp, _ in entries]
+        self._values = [value for _, value in entries]
+
+    def latest(self):
+        return self._values[-1] if self._values else None
+
+    def at(self, timestamp):
+        index = bisect_right(self._timestamps, timestamp)
+        return self._values[index - 1] if index else None
+
+    def before(self, timestamp):
+        index = bisect_left(self._timestamps, timestamp)
+        return self._values[index - 1] if index else None
+
+
+class _BalanceRun:
+    """
+    A fast-forwarded stretch of one scheduled event: `count` executions `interval` apart from
+    `first`, each adding the same Balance to every coordinate in `delta`.
+    """
+    __slots__ = ("first", "interval", "count", "delta")
+
+    def __init__(self, first, interval, count, delta):
+        self.first = first
+        self.interval = interval
+        self.count = count
+        self.delta = delta
+
+    @property
+    def last(self):
+        return self.first + self.interval * (self.count - 1)
+
+    def steps_at(self, timestamp):
+        return min(self.count, (timestamp - self.first) // self.interval + 1)
+
+    def steps_before(self, timestamp):
+        return min(self.count, -((self.first - timestamp) // self.interval))
+
+    def after(self, coordinate, base, steps):
+        credit, debit, net = self.delta[coordinate]
+        return Balance(
+            base.credit + steps * credit, base.debit + steps * debit, base.net + steps * net)
+
+
+class BalanceTimeseries:
+    """
+    The balances of one account after every batch committed to it, in value-time order.
+
+    Each commit is an entry, numbered in order, with its timestamp in _timestamps. Balances are
+    stored by column: for each interned coordinate, the entries that changed it and the Balance
+    after each, in parallel lists. Only what a commit changes is stored, and at/before return a
+    _BalanceSnapshot that finds an entry and then each coordinate's value by binary search. An
+    entry can also be a _BalanceRun, standing for many executions of a fast-forwarded event.
+    """
+    def __init__(self):
+        self._timestamps = []
+        self._entries = {}
+        self._values = {}
+        self._runs = {}
+        self._latest = {}
+        self._end = None
+
+    def latest(self):
+        return _BalanceSnapshot(self, len(self._timestamps) - 1, None)
+
+    def at(self, timestamp):
+        entry = bisect_right(self._timestamps, timestamp) - 1
+        run = self._runs.get(entry)
+        return _BalanceSnapshot(self, entry, run and run.steps_at(timestamp))
+
+    def before(self, timestamp):
+        entry = bisect_left(self._timestamps, timestamp) - 1
+        run = self._runs.get(entry)
+        return _BalanceSnapshot(self, entry, run and run.steps_before(timestamp))
+
+    def append(self, timestamp, postings, tside):
+        """Commits the postings' legs on this account at `timestamp`."""
+        self._check_order(timestamp)
+        changed = {}
+        latest = self._latest
+        for posting in postings:
+            coordinate = _intern(_key(posting))
+            balance = changed.get(coordinate) or latest.get(coordinate, _ZERO_BALANCE)
+            changed[coordinate] = _posted(balance, posting, tside)
+        self._append_entry(timestamp, changed)
+        self._end = timestamp
+
+    def append_run(self, first, interval, count, delta):
+        self._check_order(first)
+        run = _BalanceRun(
+            first,
+            interval,
+            count,
+            {_intern(key): balance for key, balance in delta.items()},
+        )
+        self._runs[len(self._timestamps)] = run
+        latest = self._latest
+        # A run's columns hold the balances it starts from; lookups add the steps taken.
+        self._append_entry(
+            first,
+            {coordinate: latest.get(coordinate, _ZERO_BALANCE) for coordinate in run.delta},
+        )
+        for coordinate in run.delta:
+            latest[coordinate] = run.after(coordinate, latest[coordinate], count)
+        self._end = run.last
+
+    def _append_entry(self, timestamp, changed):
+        entry = len(self._timestamps)
+        self._timestamps.append(timestamp)
+        entries = self._entries
+        values = self._values
+        for coordinate, balance in changed.items():
+            if coordinate in entries:
+                entries[coordinate].append(entry)
+                values[coordinate].append(balance)
+            else:
+                entries[coordinate] = array("q", [entry])
+                values[coordinate] = [balance]
+            self._latest[coordinate] = balance
+
+    def _value(self, coordinate, entry, steps):
+        entries = self._entries.get(coordinate)
+        if entries is None:
+            return None
+        if entries[-1] <= entry:
+            index = len(entries) - 1
+        else:
+            index = bisect_right(entries, entry) - 1
+            if index < 0:
+                return None
+        balance = self._values[coordinate][index]
+        if self._runs:
+            changed_at = entries[index]
+            run = self._runs.get(changed_at)
+            if run is not None:
+                # Runs before the snapshot's own entry have taken all their steps.
+                if changed_at < entry or steps is None:
+                    steps = run.count
+                balance = run.after(coordinate, balance, steps)
+        return balance
+
+    def _check_order(self, timestamp):
+        if self._end is not None and timestamp < self._end:
+            raise ValueError(
+                f"Cannot commit balances at {timestamp}, before the latest at "
+                f"{self._end}; backdated postings are not supported"
+            )
+
+    def __len__(self):
+        return len(self._timestamps)
+
+
+class _BalanceSnapshot(_BalanceMapping):
+    """
+    The balances of a BalanceTimeseries as of one entry. Later commits only append to the
+    columns, so a snapshot never changes once taken. `steps` is how far into the entry's run the
+    snapshot falls, if the entry is a run.
+    """
+    __slots__ = ("_timeseries", "_entry", "_steps")
+
+    def __init__(self, timeseries, entry, steps):
+        self._timeseries = timeseries
+        self._entry = entry
+        self._steps = steps
+
+    def __getitem__(self, key):
+        coordinate = _coordinate_ids.get(key)
+        if coordinate is None or self._entry < 0:
+            return _ZERO_BALANCE
+        balance = self._timeseries._value(coordinate, self._entry, self._steps)
+        return _ZERO_BALANCE if balance is None else balance
+
+    def _lookup(self, key):
+        coordinate = _coordinate_ids.get(key)
+        if coordinate is None or self._entry < 0:
+            return None
+        return self._timeseries._value(coordinate, self._entry, self._steps)
+
+    def _keys(self):
+        entry = self._entry
+        return [
+            _coordinates[coordinate]
+            for coordinate, entries in self._timeseries._entries.items()
+            if entries[0] <= entry
+        ]
+
+
+class _PostingRun:
+    """The instructions of one fast-forwarded event, repeated `count` times `interval` apart."""
+    __slots__ = ("first", "interval", "count", "instructions")
+
+    def __init__(self, first, interval, count, instructions):
+        self.first = first
+        self.interval = interval
+        self.count = count
+        self.instructions = instructions
+
+    def steps(self, start, end):
+        """The range of executions with value timestamps in [start, end)."""
+        low = 0 if start is None else max(0, -((self.first - start) // self.interval))
+        high = self.count
+        if end is not None:
+            high = min(high, -((self.first - end) // self.interval))
+        return range(low, max(low, high))
+
+
+class PostingLedger:
+    """
+    The instructions with a leg on one account, in value-time order, indexed by value timestamp.
+
+    window() is a binary search plus the instructions it returns. Fast-forwarded runs are kept
+    whole and only expanded when a window lists them.
+    """
+    def __init__(self, account_id):
+        self.account_id = account_id
+        self._timestamps = []
+        self._instructions = []
+        self._runs = []
+
+    def append(self, timestamp, instruction):
+        self._timestamps.append(timestamp)
+        self._instructions.append(instruction)
+
+    def append_run(self, first, interval, count, instructions):
+        self._runs.append(_PostingRun(first, interval, count, instructions))
+
+    def window(self, start=None, end=None):
+        """The instructions with value timestamps in [start, end), earliest first."""
+        low, high = _bounds(self._timestamps, start, end)
+        instructions = self._instructions[low:high]
+        if self._runs:
+            for run in self._runs:
+                for step in run.steps(start, end):
+                    value_timestamp = run.first + run.interval * step
+                    instructions.extend(
+                        _at_value_timestamp(instruction, value_timestamp)
+                        for instruction in run.instructions
+                    )
+            instructions.sort(key=lambda instruction: instruction.value_timestamp)
+        return instructions
+
+    def __len__(self):
+        return len(self._instructions) + sum(
+            run.count * len(run.instructions) for run in self._runs)
+
+
+def _bounds(timestamps, start, end):
+    low = 0 if start is None else bisect_left(timestamps, start)
+    high = len(timestamps) if end is None else bisect_left(timestamps, end)
+    return low, max(low, high)
+
+
+def _at_value_timestamp(instruction, value_timestamp):
+    return PostingInstruction(
+        instruction.type,
+        instruction.postings,
+        client_transaction_id=instruction.client_transaction_id,
+        instruction_details=instruction.instruction_details,
+        pics=instruction.pics,
+        value_timestamp=value_timestamp,
+        tside=instruction.tside,
+    )
+
+
+class _ReadTracking:
+    """What a scheduled hook read, to tell whether running it again would repeat its output."""
+    __slots__ = ("keys", "repeatable")
+
+    def __init__(self):
+        self.keys = set()
+        self.repeatable = True
+
+
+class _TrackedBalances:
+    def __init__(self, balances, tracking):
+        self._balances = balances
+        self._tracking = tracking
+
+    def __getitem__(self, key):
+        self._tracking.keys.add(key)
+        return self._balances[key]
+
+    def get(self, key, default=None):
+        self._tracking.keys.add(key)
+        return self._balances.get(key, default)
+
+    def __contains__(self, key):
+        self._tracking.keys.add(key)
+        return key in self._balances
+
+    def _read_all(self):
+        self._tracking.repeatable = False
+        return self._balances
+
+    def items(self):
+        return self._read_all().items()
+
+    def keys(self):
+        return self._read_all().keys()
+
+    def values(self):
+        return self._read_all().values()
+
+    def __iter__(self):
+        return iter(self._read_all())
+
+    def __len__(self):
+        return len(self._read_all())
+
+
+class _TrackedTimeseries:
+    def __init__(self, timeseries, tracking):
+        self._timeseries = timeseries
+        self._tracking = tracking
+
+    def latest(self):
+        return _TrackedBalances(self._timeseries.latest(), self._tracking)
+
+    def at(self, timestamp):
+        return _TrackedBalances(self._timeseries.at(timestamp), self._tracking)
+
+    def before(self, timestamp):
+        return _TrackedBalances(self._timeseries.before(timestamp), self._tracking)
+
+
+Rejection = namedtuple("Rejection", ["timestamp", "batch", "message", "reason_code"])
+FastForward = namedtuple("FastForward", ["event_type", "first", "count"])
+_Replay = namedtuple("_Replay", ["deltas", "instructions", "account_commits"])
+AccountNote = namedtuple("AccountNote", ["date", "body", "note_type", "is_visible_to_customer"])
+
+
+def contract_globals():
+    """The names Vault makes available to v3 contract code, backed by the local stand-ins."""
+    return {
+        "__builtins__": builtins,
+        "vault": None,
+        "AccountIdShape": AccountIdShape,
+        "Balance": Balance,
+        "BalanceDefaultDict": BalanceDefaultDict,
+        "DateShape": DateShape,
+        "DEFAULT_ADDRESS": DEFAULT_ADDRESS,
+        "DEFAULT_ASSET": DEFAULT_ASSET,
+        "DenominationShape": DenominationShape,
+        "InvalidContractParameter": InvalidContractParameter,
+        "Level": Level,
+        "NoteType": NoteType,
+        "NumberKind": NumberKind,
+        "NumberShape": NumberShape,
+        "OptionalShape": OptionalShape,
+        "OptionalValue": OptionalValue,
+        "Parameter": Parameter,
+        "Phase": Phase,
+        "PostingInstruction": PostingInstruction,
+        "PostingInstructionBatch": PostingInstructionBatch,
+        "PostingInstructionType": PostingInstructionType,
+        "Rejected": Rejected,
+        "RejectedReason": RejectedReason,
+        "StringShape": StringShape,
+        "Tside": Tside,
+        "UpdatePermission": UpdatePermission,
+        "fetch_account_data": fetch_account_data,
+        "requires": requires,
+        # Vault's timedelta accepts months and years, as relativedelta does.
+        "timedelta": relativedelta,
+        "calendar": calendar,
+        "date": date,
+        "datetime": datetime,
+        "math": math,
+        "json_dumps": json.dumps,
+        "json_loads": json.loads,
+        "Decimal": Decimal,
+        "ROUND_CEILING": ROUND_CEILING,
+        "ROUND_DOWN": ROUND_DOWN,
+        "ROUND_FLOOR": ROUND_FLOOR,
+        "ROUND_HALF_DOWN": ROUND_HALF_DOWN,
+        "ROUND_HALF_EVEN": ROUND_HALF_EVEN,
+        "ROUND_HALF_UP": ROUND_HALF_UP,
+        "ROUND_UP": ROUND_UP,
+    }
+
+
+def load_contract(code, filename="<contract>"):
+    """Executes contract source and returns its module namespace."""
+    namespace = contract_globals()
+    exec(compile(code, filename, "exec"), namespace)
+    return namespace
+
+
+def next_schedule_time(schedule, after):
+    """
+    Returns the first time strictly after `after` matching a schedule as returned by
+    execution_schedules, or None if there is none. Missing year/month/day fields match every
+    value and missing hour/minute/second fields default to 0.
+    """
+    year, month, day_of_month = (
+        int(schedule[field]) if field in schedule else None for field in ("year", "month", "day")
+    )
+    hour, minute, second = (int(schedule.get(field, 0)) for field in ("hour", "minute", "second"))
+    start_date = schedule.get("start_date")
+    end_date = schedule.get("end_date")
+    day = after.date()
+    if start_date:
+        day = max(day, date.fromisoformat(start_date[:10]))
+    end = date.fromisoformat(end_date[:10]) if end_date else None
+    for _ in range(MAX_SCHEDULE_LOOKAHEAD_DAYS):
+        if end is not None and day > end:
+            return None
+        if (
+            (year is None or day.year == year)
+            and (month is None or day.month == month)
+            and (day_of_month is None or day.day == day_of_month)
+        ):
+            candidate = datetime(
+                day.year, day.month, day.day, hour, minute, second, tzinfo=after.tzinfo)
+            if candidate > after:
+                return candidate
+        day += _ONE_DAY
+    return None
+
+
+def _is_daily(schedule):
+    return not any(field in schedule for field in ("year", "month", "day", "end_date"))
+
+
+def _parse_window(window):
+    count, unit = window.split()
+    return relativedelta(**{_WINDOW_UNITS[unit.rstrip("s")]: int(count)})
+
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class LocalVault:
+    """The `vault` object contract code runs against, for the simulated account."""
+    def __init__(self, simulator):
+        self._simulator = simulator
+        self.account_id = simulator.account_id
+
+    def get_account_creation_date(self):
+        return self._simulator.start
+
+    def get_hook_execution_id(self):
+        return self._simulator._hook_execution_id()
+
+    def get_parameter_timeseries(self, name):
+        return self._simulator._parameters[name]
+
+    def get_balance_timeseries(self):
+        timeseries = self._simulator.balance_timeseries()
+        tracking = self._simulator._tracking
+        return timeseries if tracking is None else _TrackedTimeseries(timeseries, tracking)
+
+    def get_last_execution_time(self, event_type):
+        self._simulator._not_repeatable()
+        return self._simulator.last_execution_times.get(event_type)
+
+    def get_postings(self, include_proposed=True):
+        self._simulator._not_repeatable()
+        return self._simulator._hook_postings(include_proposed)
+
+    def make_internal_transfer_instructions(
+        self,
+        amount,
+        denomination,
+        client_transaction_id,
+        from_account_id,
+        from_account_address,
+        to_account_id,
+        to_account_address,
+        asset=DEFAULT_ASSET,
+        instruction_details=None,
+        pics=(),
+        **options,
+    ):
+        amount = Decimal(amount)
+        if amount <= 0:
+            raise ValueError(f"Internal transfer amount must be positive, not {amount}")
+        postings = (
+            Posting(
+                False,
+                amount,
+                denomination,
+                from_account_id,
+                from_account_address,
+                asset,
+                Phase.COMMITTED,
+            ),
+            Posting(
+                True, amount, denomination, to_account_id, to_account_address, asset,
+                Phase.COMMITTED,
+            ),
+        )
+        return [
+            PostingInstruction(
+                PostingInstructionType.CUSTOM_INSTRUCTION,
+                postings,
+                client_transaction_id=client_transaction_id,
+                instruction_details=instruction_details,
+                pics=pics,
+                tside=self._simulator.tside,
+            )
+        ]
+
+    def instruct_posting_batch(
+        self,
+        posting_instructions,
+        effective_date,
+        client_batch_id=None,
+        batch_details=None,
+        **options,
+    ):
+        batch = PostingInstructionBatch(
+            posting_instructions,
+            value_timestamp=effective_date,
+            client_batch_id=client_batch_id or self.get_hook_execution_id(),
+            batch_details=batch_details,
+        )
+        self._simulator._instruct(batch)
+
+    def add_account_note(self, body, note_type, is_visible_to_customer, date):
+        self._simulator._not_repeatable()
+        self._simulator.notes.append(AccountNote(date, body, note_type, is_visible_to_customer))
+
+
+_BATCH = 0
+_DIRECTIVE = 1
+_EVENT = 2
+
+
+class LocalSimulator:
+    def __init__(
+        self,
+        contract_code,
+        *,
+        start,
+        template_params=None,
+        instance_params=None,
+        account_id=MAIN_ACCOUNT_ID,
+        filename="<contract>",
+        fast_forward_events=(),
+    ):
+        """
+        :param fast_forward_events: daily event types whose scheduled_code depends only on
+            balances and parameters, such as the interest accrual events. Once one of them has run
+            and nothing but its own postings has touched the account since, its later executions
+            up to the next queued batch or event are applied in closed form without running the
+            hook: the same postings, repeated, stored as a single run in each balance timeseries.
+        """
+        if start.tzinfo is None:
+            raise ValueError("The start datetime passed in is not timezone-aware")
+        self.namespace = load_contract(contract_code, filename)
+        self.start = start
+        self.now = start
+        self.account_id = account_id
+        self.tside = self.namespace.get("tside", Tside.LIABILITY)
+        self.committed_batches = []
+        self.rejections = []
+        self.notes = []
+        self.last_execution_times = {}
+        self.fast_forwarded = []
+
+        self._ledger = {}
+        self._tsides = {account_id: self.tside}
+        # Every instruction with a leg on the simulated account.
+        self.postings = PostingLedger(account_id)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._pending = []
+        self._proposed = None
+        self._hook = None
+        self._hook_event_type = None
+        self._hook_counter = itertools.count()
+        self._hook_number = 0
+        self._end = start
+        self._fast_forward_events = frozenset(fast_forward_events)
+        self._replays = {}
+        self._tracking = None
+        # Bumped by every commit to the simulated account; a replay is only valid while unchanged.
+        self._account_commits = 0
+
+        values = dict(template_params or {})
+        values.update(instance_params or {})
+        self._parameters = {
+            parameter.name: ParameterTimeseries(
+                [(start, parameter.parse(values.get(parameter.name, parameter.default_value)))]
+            )
+            for parameter in self.namespace.get("parameters", [])
+        }
+        self.vault = self.namespace["vault"] = LocalVault(self)
+        self._pre_posting_code = self.namespace.get("pre_posting_code")
+        self._post_posting_code = self.namespace.get("post_posting_code")
+        self._scheduled_code = self.namespace.get("scheduled_code")
+
+        post_activate_code = self.namespace.get("post_activate_code")
+        if post_activate_code is not None:
+            self._run_hook(post_activate_code, start)
+        execution_schedules = self.namespace.get("execution_schedules")
+        if execution_schedules is not None:
+            self._begin_hook(execution_schedules)
+            for event_type, schedule in execution_schedules():
+                self._schedule(event_type, schedule, start)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as contract_file:
+            return cls(contract_file.read(), filename=path, **kwargs)
+
+    def balance_timeseries(self, account_id=None):
+        account_id = account_id or self.account_id
+        timeseries = self._ledger.get(account_id)
+        if timeseries is None:
+            timeseries = self._ledger[account_id] = BalanceTimeseries()
+        return timeseries
+
+    def balances(self, account_id=None):
+        return self.balance_timeseries(account_id).latest()
+
+    def set_tside(self, account_id, tside):
+        """Internal accounts default to LIABILITY, as the empty contracts the test suites use."""
+        self._tsides[account_id] = tside
+
+    def submit(self, instruction):
+        """
+        Queues a create_posting_instruction_batch instruction, given either as the event dict or
+        as a vault_caller.SimulationInstruction wrapping one. The batch is processed at its
+        value_timestamp, or at the instruction's time if it has none.
+        """
+        event = instruction if isinstance(instruction, dict) else instruction.instruction
+        if "create_posting_instruction_batch" not in event:
+            raise ValueError(
+                "Only create_posting_instruction_batch instructions can be simulated locally, "
+                f"not {', '.join(event)}"
+            )
+        details = event["create_posting_instruction_batch"]
+        value_timestamp = details.get("value_timestamp")
+        value_timestamp = (
+            _parse_timestamp(value_timestamp)
+            if value_timestamp
+            else getattr(instruction, "time", self.now)
+        )
+        posting_instructions = []
+        for posting_instruction in details["posting_instructions"]:
+            if "inbound_hard_settlement" in posting_instruction:
+                credit, settlement = True, posting_instruction["inbound_hard_settlement"]
+            elif "outbound_hard_settlement" in posting_instruction:
+                credit, settlement = False, posting_instruction["outbound_hard_settlement"]
+            else:
+                raise ValueError(
+                    "Only inbound_hard_settlement and outbound_hard_settlement instructions can "
+                    "be simulated locally"
+                )
+            posting_instructions.append(
+                self._hard_settlement(
+                    credit,
+                    settlement["amount"],
+                    settlement["denomination"],
+                    settlement["target_account"]["account_id"],
+                    settlement["internal_account_id"],
+                    value_timestamp,
+                    posting_instruction.get("client_transaction_id", ""),
+                    posting_instruction.get("instruction_details"),
+                    posting_instruction.get("pics", ()),
+                )
+            )
+        self._push(
+            value_timestamp,
+            _BATCH,
+            PostingInstructionBatch(
+                posting_instructions,
+                value_timestamp=value_timestamp,
+                client_batch_id=details.get("client_batch_id", ""),
+                batch_details=details.get("batch_details"),
+            ),
+        )
+
+    def inbound_hard_settlement(self, amount, value_timestamp, **kwargs):
+        self._submit_hard_settlement(True, amount, value_timestamp, **kwargs)
+
+    def outbound_hard_settlement(self, amount, value_timestamp, **kwargs):
+        self._submit_hard_settlement(False, amount, value_timestamp, **kwargs)
+
+    def _submit_hard_settlement(
+        self,
+        credit,
+        amount,
+        value_timestamp,
+        denomination="GBP",
+        internal_account_id="1",
+        client_transaction_id="",
+        instruction_details=None,
+        pics=(),
+    ):
+        instruction = self._hard_settlement(
+            credit,
+            amount,
+            denomination,
+            self.account_id,
+            internal_account_id,
+            value_timestamp,
+            client_transaction_id,
+            instruction_details,
+            pics,
+        )
+        self._push(
+            value_timestamp,
+            _BATCH,
+            PostingInstructionBatch([instruction], value_timestamp=value_timestamp),
+        )
+
+    def _hard_settlement(
+        self,
+        credit,
+        amount,
+        denomination,
+        account_id,
+        internal_account_id,
+        value_timestamp,
+        client_transaction_id,
+        instruction_details,
+        pics,
+    ):
+        amount = Decimal(amount)
+        return PostingInstruction(
+            PostingInstructionType.HARD_SETTLEMENT,
+            (
+                Posting(
+                    credit, amount, denomination, account_id, DEFAULT_ADDRESS, DEFAULT_ASSET,
+                    Phase.COMMITTED,
+                ),
+                Posting(
+                    not credit, amount, denomination, internal_account_id, DEFAULT_ADDRESS,
+                    DEFAULT_ASSET, Phase.COMMITTED,
+                ),
+            ),
+            client_transaction_id=client_transaction_id,
+            instruction_details=instruction_details,
+            pics=pics,
+            value_timestamp=value_timestamp,
+            tside=self.tside,
+        )
+
+    def run_until(self, end):
+        """Processes every queued batch and scheduled event up to and including `end`."""
+        queue = self._queue
+        self._end = end
+        while queue and queue[0][0] <= end:
+            timestamp, _, kind, payload = heapq.heappop(queue)
+            self.now = timestamp
+            if kind == _BATCH:
+                self._process_batch(payload, timestamp)
+            elif kind == _DIRECTIVE:
+                self._commit(payload, timestamp)
+            else:
+                self._run_scheduled_event(payload, timestamp)
+        self.now = max(self.now, end)
+
+    def _push(self, timestamp, kind, payload):
+        if timestamp < self.now:
+            raise ValueError(
+                f"Cannot queue work at {timestamp}, the simulation is already at {self.now}")
+        heapq.heappush(self._queue, (timestamp, next(self._sequence), kind, payload))
+
+    def _schedule(self, event_type, schedule, after):
+        next_time = next_schedule_time(schedule, after)
+        if next_time is not None:
+            self._push(next_time, _EVENT, (event_type, schedule))
+
+    def _process_batch(self, batch, timestamp):
+        if self._pre_posting_code is not None:
+            self._proposed = batch
+            try:
+                self._run_hook(self._pre_posting_code, timestamp, batch, timestamp)
+            except Rejected as e:
+                self.rejections.append(Rejection(timestamp, batch, e.message, e.reason_code))
+                return False
+            finally:
+                self._proposed = None
+        self._commit(batch, timestamp)
+        if self._post_posting_code is not None:
+            self._run_hook(self._post_posting_code, timestamp, batch, timestamp)
+        return True
+
+    def _run_scheduled_event(self, payload, timestamp):
+        event_type, schedule = payload
+        if self._scheduled_code is not None:
+            if event_type in self._fast_forward_events and _is_daily(schedule):
+                replay = self._replays.get(event_type)
+                if replay is not None and replay.account_commits == self._account_commits:
+                    timestamp = self._fast_forward(event_type, replay, timestamp)
+                else:
+                    self._run_tracked_event(event_type, timestamp)
+            else:
+                self._run_hook(
+                    self._scheduled_code, timestamp, event_type, timestamp, event_type=event_type)
+        self.last_execution_times[event_type] = timestamp
+        self._schedule(event_type, schedule, timestamp)
+
+    def _run_tracked_event(self, event_type, timestamp):
+        self._replays.pop(event_type, None)
+        self._tracking = tracking = _ReadTracking()
+        try:
+            batches = self._run_hook(
+                self._scheduled_code, timestamp, event_type, timestamp, event_type=event_type)
+        finally:
+            self._tracking = None
+        if not tracking.repeatable:
+            return
+        deltas = {}
+        instructions = []
+        for batch in batches:
+            for instruction in batch:
+                for posting in instruction.postings:
+                    delta = deltas.setdefault(posting.account_id, BalanceDefaultDict())
+                    _add_posting(
+                        delta, posting, self._tsides.get(posting.account_id, Tside.LIABILITY))
+                if any(posting.account_id == self.account_id for posting in instruction.postings):
+                    instructions.append(instruction)
+        # Output that feeds back into what the hook reads would change the next execution.
+        if tracking.keys.isdisjoint(deltas.get(self.account_id, ())):
+            self._replays[event_type] = _Replay(deltas, instructions, self._account_commits)
+
+    def _fast_forward(self, event_type, replay, first):
+        """Applies the replay from `first` up to the next queued work; returns the last time."""
+        count = (self._end - first) // _ONE_DAY + 1
+        if self._queue:
+            next_time = self._queue[0][0]
+            # Work queued for exactly `first` still runs after this execution, as it would have.
+            count = min(count, max(1, -((first - next_time) // _ONE_DAY)))
+        for account_id, delta in replay.deltas.items():
+            self.balance_timeseries(account_id).append_run(first, _ONE_DAY, count, delta)
+        if replay.instructions:
+            self.postings.append_run(first, _ONE_DAY, count, replay.instructions)
+        if self.account_id in replay.deltas:
+            # Other replays may read what this one wrote.
+            self._account_commits += 1
+            self._replays[event_type] = replay._replace(account_commits=self._account_commits)
+        self.fast_forwarded.append(FastForward(event_type, first, count))
+        self.now = first + _ONE_DAY * (count - 1)
+        return self.now
+
+    def _not_repeatable(self):
+        if self._tracking is not None:
+            self._tracking.repeatable = False
+
+    def _run_hook(self, hook, timestamp, *args, event_type=None):
+        """Runs a hook and commits its directives; returns the batches committed."""
+        self._begin_hook(hook, event_type)
+        hook(*args)
+        pending, self._pending = self._pending, []
+        for batch in pending:
+            self._commit(batch, timestamp)
+        return pending
+
+    def _begin_hook(self, hook, event_type=None):
+        self._hook = hook
+        self._hook_event_type = event_type
+        self._hook_number = next(self._hook_counter)
+        self._pending = []
+
+    def _hook_execution_id(self):
+        return f"{self._hook.__name__}_{self._hook_number}"
+
+    def _instruct(self, batch):
+        if batch.value_timestamp > self.now:
+            self._not_repeatable()
+            self._push(batch.value_timestamp, _DIRECTIVE, batch)
+        else:
+            # Vault applies hook directives once the hook has returned.
+            self._pending.append(batch)
+
+    def _commit(self, batch, timestamp):
+        touched = {}
+        for instruction in batch:
+            if instruction.value_timestamp is None:
+                instruction.value_timestamp = timestamp
+            for posting in instruction.postings:
+                touched.setdefault(posting.account_id, []).append(posting)
+            if any(posting.account_id == self.account_id for posting in instruction.postings):
+                self.postings.append(timestamp, instruction)
+        if self.account_id in touched:
+            self._account_commits += 1
+        for account_id, postings in touched.items():
+            self.balance_timeseries(account_id).append(
+                timestamp, postings, self._tsides.get(account_id, Tside.LIABILITY))
+        self.committed_batches.append(batch)
+
+    def _hook_postings(self, include_proposed):
+        window = self._postings_window()
+        postings = self.postings.window(None if window is None else self.now - window)
+        if include_proposed and self._proposed is not None:
+            postings.extend(
+                instruction for instruction in self._proposed
+                if any(posting.account_id == self.account_id for posting in instruction.postings)
+            )
+        return postings
+
+    def _postings_window(self):
+        for requirements in getattr(self._hook, "requirements", ()):
+            if requirements.get("event_type", self._hook_event_type) != self._hook_event_type:
+                continue
+            if "postings" in requirements:
+                return _parse_window(requirements["postings"])
+        return None
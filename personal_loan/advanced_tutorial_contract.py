@@ -12,6 +12,10 @@ ACCRUED_INTEREST = 'ACCRUED_INTEREST'
 DUE = 'DUE'
 FEES = 'FEES'
 DUE_ACCRUED = 'DUE_ACCRUED'
+# Repayments received since DUE was last topped up, tracked against INTERNAL_CONTRA so the
+# account's overall balance is unchanged
+REPAID_THIS_PERIOD = 'REPAID_THIS_PERIOD'
+INTERNAL_CONTRA = 'INTERNAL_CONTRA'
 
 parameters = [
     Parameter(
@@ -137,7 +141,7 @@ def post_activate_code():
         posting_instructions=posting_ins, effective_date=start_date)
 
 
-@requires(parameters=True, balances='latest', postings='1 month')
+@requires(parameters=True, balances='latest')
 def pre_posting_code(postings, effective_date):
     denomination = vault.get_parameter_timeseries(name='denomination').latest()
     payment_day_param = vault.get_parameter_timeseries(
@@ -160,18 +164,15 @@ def pre_posting_code(postings, effective_date):
         )
 
     balances = vault.get_balance_timeseries().latest()
-    recent_postings = vault.get_postings(include_proposed=False)
 
     total_due = sum(
         balance.net for ((address, asset, denomination, phase), balance) in balances.items() if
         address in [DUE, FEES, DUE_ACCRUED]
     )
 
-    amount_paid_off_this_month = sum(
-        posting.amount for posting in recent_postings if
-        posting.credit and posting.type != PostingInstructionType.CUSTOM_INSTRUCTION
-        and posting.value_timestamp > next_payment_date - timedelta(months=1)
-    )
+    amount_paid_off_this_month = balances[
+        (REPAID_THIS_PERIOD, DEFAULT_ASSET, denomination, Phase.COMMITTED)
+    ].net
     proposed_amount = sum(
         post.amount for post in postings if post.account_address == DEFAULT_ADDRESS
         and post.asset == DEFAULT_ASSET
@@ -181,7 +182,9 @@ def pre_posting_code(postings, effective_date):
             f'Repayments do not start until {next_payment_date.date()}',
             reason_code=RejectedReason.AGAINST_TNC,
         )
-    if amount_paid_off_this_month + proposed_amount > total_due:
+    # Repayments come off DUE and FEES as they arrive, so total_due is already net of
+    # amount_paid_off_this_month
+    if proposed_amount > total_due:
         raise Rejected(
             f'Cannot overpay with this account, you can currently pay up to {total_due} '
             f'(attempting to pay {amount_paid_off_this_month} + {proposed_amount})',
@@ -202,6 +205,40 @@ def post_posting_code(postings, effective_date):
             vault, effective_date, posting, client_transaction_id, denomination, balances
         )
 
+    amount_repaid = sum(
+        abs(posting.balances()[
+            (DEFAULT_ADDRESS, DEFAULT_ASSET, denomination, Phase.COMMITTED)].net)
+        for posting in postings
+        if posting.credit and posting.type != PostingInstructionType.CUSTOM_INSTRUCTION
+    )
+    if amount_repaid:
+        _update_repaid_this_period(
+            vault, effective_date, denomination, amount_repaid, 'REPAYMENT'
+        )
+
+
+def _update_repaid_this_period(vault, effective_date, denomination, amount, reason):
+    # amount may be negative, to clear the tracker at the start of a payment period
+    from_address, to_address = REPAID_THIS_PERIOD, INTERNAL_CONTRA
+    if amount < 0:
+        from_address, to_address = to_address, from_address
+    posting_ins = vault.make_internal_transfer_instructions(
+        amount=abs(amount),
+        denomination=denomination,
+        client_transaction_id=f'UPDATE_REPAID_THIS_PERIOD_{vault.get_hook_execution_id()}',
+        from_account_id=vault.account_id,
+        from_account_address=from_address,
+        to_account_id=vault.account_id,
+        to_account_address=to_address,
+        instruction_details={
+            'description': f'Repaid this period updated by {amount} ({reason})'
+        },
+        asset=DEFAULT_ASSET
+    )
+    vault.instruct_posting_batch(
+        posting_instructions=posting_ins, effective_date=effective_date
+    )
+
 
 def _process_payment(vault, effective_date, posting, client_transaction_id, denomination, balances):
     repayment_amount_remaining = abs(
@@ -329,7 +366,7 @@ def _calculate_first_payment_day(payment_day, roll_over_to_next_month, creation_
 @requires(event_type='ACCRUED_INTEREST', parameters=True, balances='1 day')
 @requires(event_type='APPLY_INTEREST', parameters=True, balances='1 day', last_execution_time=['APPLY_INTEREST'])
 @requires(event_type='TRANSFER_DUE_AMOUNT', parameters=True, balances='1 day', last_execution_time=['TRANSFER_DUE_AMOUNT'])
-@requires(event_type='CHECK_FOR_PAYMENT', parameters=True, balances='1 month', postings='1 month', last_execution_time=['CHECK_FOR_PAYMENT'])
+@requires(event_type='CHECK_FOR_PAYMENT', parameters=True, balances='latest', last_execution_time=['CHECK_FOR_PAYMENT'])
 def scheduled_code(event_type, effective_date):
     internal_account = vault.get_parameter_timeseries(
         name='internal_account').latest()
@@ -374,27 +411,16 @@ def scheduled_code(event_type, effective_date):
             creation_date, balances
         )
     elif event_type == 'CHECK_FOR_PAYMENT':
-        recent_postings = vault.get_postings()
         balances = vault.get_balance_timeseries().latest()
         _check_monthly_payment(
-            vault, effective_date, internal_account, denomination, late_payment_fee, balances, recent_postings, payment_day
+            vault, effective_date, internal_account, denomination, late_payment_fee, balances
         )
 
 
-def _check_monthly_payment(vault, effective_date, internal_account, denomination, late_payment_fee, balances, recent_postings, payment_day):
-    monthly_repayment = balances[(
+def _check_monthly_payment(vault, effective_date, internal_account, denomination, late_payment_fee, balances):
+    # Repayments are moved onto DUE as they arrive, so whatever is left on it is unpaid
+    unpaid_amount = balances[(
         DUE, DEFAULT_ASSET, denomination, Phase.COMMITTED)].net
-    next_payment_date = _calculate_next_payment_date(
-        payment_day, effective_date)
-
-    amount_paid_off_this_month = sum(
-        abs(posting.balances()[
-            (DEFAULT_ADDRESS, DEFAULT_ASSET, denomination, Phase.COMMITTED)].net)
-        for posting in recent_postings
-        if posting.credit and posting.type != PostingInstructionType.CUSTOM_INSTRUCTION
-        and posting.value_timestamp > next_payment_date - timedelta(months=1)
-    )
-    unpaid_amount = monthly_repayment - amount_paid_off_this_month
 
     if unpaid_amount > 0:
         posting_ins = vault.make_internal_transfer_instructions(
@@ -449,6 +475,14 @@ def _transfer_due_amount(vault, effective_date, previous_payment_checked, denomi
         posting_instructions=posting_ins, effective_date=effective_date
     )
 
+    repaid_this_period = balances[
+        (REPAID_THIS_PERIOD, DEFAULT_ASSET, denomination, Phase.COMMITTED)
+    ].net
+    if repaid_this_period:
+        _update_repaid_this_period(
+            vault, effective_date, denomination, -repaid_this_period, 'NEW_PAYMENT_PERIOD'
+        )
+
 # In the last month of the loan, the repayment will be calculated as the sum of all the
 # remaining balances, rather than the amortised monthly repayment amount, to ensure that
 # the entire debt is repaid before the loan is closed.
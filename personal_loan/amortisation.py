@@ -0,0 +1,279 @@
+"""
+Generates month-by-month repayment schedules for many personal loans at once, with numpy,
+following advanced_tutorial_contract's scheduled code and rounding.
+
+For a loan repaid in full on every payment day, the contract's balances only change at the
+payment-day events, so each period reduces to:
+  * ACCRUED_INTEREST: the same daily accrual, DEFAULT * rate / 365 rounded half up to 4 decimal
+    places (_precision_accrual), on every midnight of the period.
+  * APPLY_INTEREST: the accrued total rounded half up to 2 decimal places
+    (_precision_fulfillment) moves into DEFAULT; the sub-penny remainder stays accrued.
+  * TRANSFER_DUE_AMOUNT: the amortised payment from _calculate_monthly_payment moves to DUE, plus
+    _calculate_additional_interest for a first period longer than the creation month. Once the
+    loan's natural end is less than 28 days away the whole outstanding balance falls due instead.
+Late payments, fees and loan_end_date are not modelled.
+
+    schedules = generate_schedules(
+        loan_amounts=["3000", "15000"],
+        loan_terms=[2, 5],
+        creation_dates=["2019-01-01", "2019-03-31"],
+        payment_days=[6, None],
+        gross_interest_rate_tiers=template_params["gross_interest_rate_tiers"],
+        tier_ranges=template_params["tier_ranges"],
+    )
+    schedules.due[0, :schedules.periods[0]]  # amounts moved to DUE, in units of 10^-4
+"""
+import json
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+DAYS_IN_YEAR = 365
+# Every amount in a schedule is in units of 10^-4, the contract's accrual precision; applied
+# interest and amortised payments are whole pence, a final payment can carry accrued remainders.
+DECIMAL_PLACES = 4
+_UNITS_PER_PENNY = 100
+_DEFAULT_PAYMENT_DAY = 28
+# The contract only falls back to the outstanding balance within this many days of the end.
+_FINAL_PAYMENT_WINDOW = np.timedelta64(28, "D")
+_SCHEDULE_TIME = np.timedelta64(1, "s")
+# Payments rounded by float arithmetic closer than this to half a penny are redone with Decimal.
+_TIE_TOLERANCE = 1e-6
+
+AmortisationSchedule = namedtuple(
+    "AmortisationSchedule",
+    [
+        # (loans, periods), one column per payment day, with NaT / 0 after a loan's last payment.
+        "due_dates",
+        "due",
+        "interest",
+        "principal",
+        "balance",
+        # (loans,)
+        "monthly_payment",
+        "additional_interest",
+        "interest_rate",
+        "periods",
+    ],
+)
+
+
+def generate_schedules(
+    loan_amounts,
+    loan_terms,
+    creation_dates,
+    payment_days,
+    gross_interest_rate_tiers,
+    tier_ranges,
+):
+    """
+    :param loan_amounts: str, Decimal or int per loan, as the loan_amount parameter
+    :param loan_terms: int per loan, the loan_term parameter in years
+    :param creation_dates: anything numpy converts to datetime64, per loan
+    :param payment_days: int or None (the parameter is optional) per loan
+    :param gross_interest_rate_tiers: the template parameter, as its JSON string or a dict
+    :param tier_ranges: the template parameter, as its JSON string or a dict
+    :return: AmortisationSchedule; due is what TRANSFER_DUE_AMOUNT moves to DUE, split into the
+        interest applied that period and principal, and balance is DEFAULT afterwards
+    """
+    amounts = [Decimal(amount) for amount in loan_amounts]
+    loans = len(amounts)
+    amount_units = np.array(
+        [int(amount.scaleb(DECIMAL_PLACES)) for amount in amounts], dtype=np.int64)
+    terms = np.asarray(loan_terms, dtype=np.int64).reshape(loans)
+    created = np.asarray(creation_dates, dtype="datetime64[s]").reshape(loans)
+    payment_day = np.array(
+        [_DEFAULT_PAYMENT_DAY if day is None else int(day) for day in payment_days],
+        dtype=np.int64,
+    ).reshape(loans)
+    payment_day[payment_day > _DEFAULT_PAYMENT_DAY] = 1
+
+    rates = _tier_rates(amounts, amount_units, gross_interest_rate_tiers, tier_ranges)
+    monthly_payment = _monthly_payments(amounts, terms, rates)
+    accrual_factor, accrual_denominator = _daily_rate_fraction(rates)
+
+    # _get_payment_day and _calculate_first_payment_day, on datetime64 arrays.
+    created_day = created.astype("datetime64[D]")
+    time_of_day = created - created_day
+    created_month = created.astype("datetime64[M]")
+    day_of_month = (created_day - created_month.astype("datetime64[D]")).astype(np.int64) + 1
+    first_month = created_month + (payment_day < day_of_month).astype(np.int64)
+    first_payment = first_month.astype("datetime64[D]") + (payment_day - 1)
+    too_soon = first_payment - created_day < np.timedelta64(28, "D")
+    first_month = first_month + too_soon.astype(np.int64)
+    first_payment = first_month.astype("datetime64[D]") + (payment_day - 1)
+
+    # _calculate_additional_interest.
+    days_in_creation_month = (
+        (created_month + 1).astype("datetime64[D]") - created_month.astype("datetime64[D]")
+    ).astype(np.int64)
+    additional_days = (first_payment - created_day).astype(np.int64) - days_in_creation_month
+    additional_interest = np.array(
+        [
+            _contract_additional_interest(amount, rate, days)
+            for amount, rate, days in zip(amounts, rates, additional_days)
+        ],
+        dtype=np.int64,
+    ).reshape(loans)
+
+    # creation_date + timedelta(years=loan_term), clamped to the end of the month as relativedelta
+    # does for 29 February.
+    end_month = created_month + 12 * terms
+    days_in_end_month = (
+        (end_month + 1).astype("datetime64[D]") - end_month.astype("datetime64[D]")
+    ).astype(np.int64)
+    natural_end = (
+        end_month.astype("datetime64[D]") + (np.minimum(day_of_month, days_in_end_month) - 1)
+        + time_of_day
+    )
+
+    max_periods = int(12 * terms.max()) + 2 if loans else 0
+    due_dates = np.full((loans, max_periods), np.datetime64("NaT"), dtype="datetime64[D]")
+    due = np.zeros((loans, max_periods), dtype=np.int64)
+    interest = np.zeros((loans, max_periods), dtype=np.int64)
+    balance = np.zeros((loans, max_periods), dtype=np.int64)
+    periods = np.zeros(loans, dtype=np.int64)
+
+    default = amount_units.copy()
+    accrued = np.zeros(loans, dtype=np.int64)
+    active = np.ones(loans, dtype=bool)
+    previous = created_day
+    for period in range(max_periods):
+        if not active.any():
+            break
+        payment_date = (first_month + period).astype("datetime64[D]") + (payment_day - 1)
+        days = (payment_date - previous).astype(np.int64)
+        previous = payment_date
+
+        daily = _accrue(default, accrual_factor, accrual_denominator, rates)
+        accrued += np.where(active, days * daily, 0)
+        applied = _to_pence(np.abs(accrued)) * _UNITS_PER_PENNY
+        applied = np.where(active, applied, 0)
+        accrued -= applied
+        default += applied
+
+        final = natural_end < payment_date + _SCHEDULE_TIME + _FINAL_PAYMENT_WINDOW
+        period_due = np.where(final, default + accrued, monthly_payment)
+        if period == 0:
+            period_due = period_due + additional_interest
+        period_due = np.where(active, period_due, 0)
+        default -= period_due
+
+        due_dates[active, period] = payment_date[active]
+        due[:, period] = period_due
+        interest[:, period] = applied
+        balance[:, period] = np.where(active, default, 0)
+        periods += active
+        active &= ~final
+
+    return AmortisationSchedule(
+        due_dates,
+        due,
+        interest,
+        due - interest,
+        balance,
+        monthly_payment,
+        additional_interest,
+        rates,
+        periods,
+    )
+
+
+def to_decimal(amount):
+    """Converts one amount from a schedule back to the Decimal the contract uses."""
+    return Decimal(int(amount)).scaleb(-DECIMAL_PLACES)
+
+
+def _tier_rates(amounts, amount_units, gross_interest_rate_tiers, tier_ranges):
+    if isinstance(gross_interest_rate_tiers, str):
+        gross_interest_rate_tiers = json.loads(gross_interest_rate_tiers)
+    if isinstance(tier_ranges, str):
+        tier_ranges = json.loads(tier_ranges)
+    # As _calculate_tier_values: the last tier whose bounds contain the amount wins.
+    tier_index = np.full(len(amounts), -1, dtype=np.int64)
+    tier_rates = []
+    for index, (tier, bounds) in enumerate(tier_ranges.items()):
+        low = int(Decimal(str(bounds["min"])).scaleb(DECIMAL_PLACES))
+        high = int(Decimal(str(bounds["max"])).scaleb(DECIMAL_PLACES))
+        tier_index[(low <= amount_units) & (amount_units <= high)] = index
+        tier_rates.append(Decimal(gross_interest_rate_tiers[tier]))
+    if (tier_index < 0).any():
+        unmatched = [str(amounts[i]) for i in np.flatnonzero(tier_index < 0)]
+        raise ValueError(
+            f"Requested loan amounts {', '.join(unmatched)} do not fit into any tier.")
+    return [tier_rates[index] for index in tier_index]
+
+
+def _monthly_payments(amounts, terms, rates):
+    """_calculate_monthly_payment for every loan, in units of 10^-4."""
+    loans = len(amounts)
+    amount = np.array([float(amount) for amount in amounts])
+    monthly_rate = np.array([float(rate) for rate in rates]) / 12
+    periods = 12 * terms
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (1 + monthly_rate) ** periods
+        pence = np.where(
+            monthly_rate == 0,
+            amount / periods,
+            amount * (monthly_rate * growth / (growth - 1)),
+        ) * 100
+    payment = np.floor(pence + 0.5).astype(np.int64)
+    fraction = pence - np.floor(pence)
+    for loan in np.flatnonzero(np.abs(fraction - 0.5) < _TIE_TOLERANCE):
+        payment[loan] = _contract_monthly_payment(amounts[loan], int(terms[loan]), rates[loan])
+    return payment.reshape(loans) * _UNITS_PER_PENNY
+
+
+def _contract_monthly_payment(loan_amount, loan_term, interest_rate):
+    no_of_periods = 12 * loan_term
+    if interest_rate == 0:
+        return int(_precision_fulfillment(loan_amount / no_of_periods).scaleb(2))
+    monthly_rate = interest_rate / 12
+    top_calc = monthly_rate * ((1 + monthly_rate) ** no_of_periods)
+    bottom_calc = ((1 + monthly_rate) ** no_of_periods) - 1
+    return int(_precision_fulfillment(loan_amount * (top_calc / bottom_calc)).scaleb(2))
+
+
+def _contract_additional_interest(loan_amount, interest_rate, additional_days):
+    if not additional_days:
+        return 0
+    daily_rate = interest_rate / DAYS_IN_YEAR
+    amount = _precision_fulfillment(loan_amount * daily_rate * int(additional_days))
+    return int(amount.scaleb(DECIMAL_PLACES))
+
+
+def _daily_rate_fraction(rates):
+    """
+    Returns (numerator_factor, denominator) such that a daily accrual in 10^-4 units is exactly
+    |DEFAULT in 10^-4 units| * numerator_factor / denominator before rounding.
+    """
+    places = max([0] + [-rate.as_tuple().exponent for rate in rates])
+    numerator_factor = np.array([int(rate.scaleb(places)) for rate in rates], dtype=np.int64)
+    denominator = np.int64(DAYS_IN_YEAR * 10 ** places)
+    divisor = np.gcd(numerator_factor, denominator)
+    divisor[divisor == 0] = 1
+    return numerator_factor // divisor, denominator // divisor
+
+
+def _accrue(default, numerator_factor, denominator, rates):
+    numerator = np.abs(default) * numerator_factor
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice_remainder = 2 * remainder
+    accrual = quotient + (twice_remainder >= denominator)
+    # Decimal rounds rate / 365 to 28 significant digits before multiplying, so an exact tie can
+    # fall either side of it; redo those the contract's way.
+    for loan in np.flatnonzero(twice_remainder == denominator):
+        balance = Decimal(int(default[loan])).scaleb(-DECIMAL_PLACES)
+        amount = (balance * (rates[loan] / DAYS_IN_YEAR)).copy_abs().quantize(
+            Decimal(".0001"), rounding=ROUND_HALF_UP)
+        accrual[loan] = int(amount.scaleb(DECIMAL_PLACES))
+    return accrual
+
+
+def _to_pence(units):
+    return (units + _UNITS_PER_PENNY // 2) // _UNITS_PER_PENNY
+
+
+def _precision_fulfillment(amount):
+    return amount.copy_abs().quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
@@ -0,0 +1,140 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.dirname(__file__))
+
+import amortisation
+import local_simulator
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import json
+import unittest
+
+CONTRACT_FILE = os.path.join(os.path.dirname(__file__), "advanced_tutorial_contract.py")
+TEMPLATE_PARAMS = {
+    "denomination": "GBP",
+    "gross_interest_rate_tiers": json.dumps(
+        {
+            "tier1": "0.135",
+            "tier2": "0.098",
+            "tier3": "0.045",
+            "tier4": "0.03",
+            "tier5": "0.035",
+        }
+    ),
+    "tier_ranges": json.dumps(
+        {
+            "tier1": {"min": 1000, "max": 2999},
+            "tier2": {"min": 3000, "max": 4999},
+            "tier3": {"min": 5000, "max": 7499},
+            "tier4": {"min": 7500, "max": 14999},
+            "tier5": {"min": 15000, "max": 20000},
+        }
+    ),
+    "internal_account": "1",
+    "late_payment_fee": "25",
+}
+LOANS = [
+    ("3000", 2, datetime(2019, 1, 1, 9, tzinfo=timezone.utc), 6),
+    ("1000", 1, datetime(2019, 1, 31, tzinfo=timezone.utc), None),
+    ("7499", 3, datetime(2019, 3, 31, tzinfo=timezone.utc), 28),
+    ("15000", 1, datetime(2020, 2, 29, tzinfo=timezone.utc), 1),
+    ("9500", 2, datetime(2019, 6, 15, 23, 30, tzinfo=timezone.utc), 20),
+]
+
+
+def address(name):
+    return (name, local_simulator.DEFAULT_ASSET, "GBP", local_simulator.Phase.COMMITTED)
+
+
+class AmortisationTest(unittest.TestCase):
+    def run_contract(
+        self, loan_amount, loan_term, created, payment_day, template_params, fast_forward_events,
+    ):
+        instance_params = {
+            "loan_amount": loan_amount,
+            "loan_term": str(loan_term),
+            "deposit_account": "12345",
+        }
+        if payment_day is not None:
+            instance_params["payment_day"] = str(payment_day)
+        return local_simulator.LocalSimulator.from_file(
+            CONTRACT_FILE,
+            start=created,
+            template_params=template_params,
+            instance_params=instance_params,
+            fast_forward_events=fast_forward_events,
+        )
+
+    def assert_matches_contract(
+        self, loans, template_params=TEMPLATE_PARAMS, fast_forward_events=(),
+    ):
+        schedules = amortisation.generate_schedules(
+            [amount for amount, _, _, _ in loans],
+            [term for _, term, _, _ in loans],
+            [created.replace(tzinfo=None) for _, _, created, _ in loans],
+            [payment_day for _, _, _, payment_day in loans],
+            template_params["gross_interest_rate_tiers"],
+            template_params["tier_ranges"],
+        )
+        for loan, (amount, term, created, payment_day) in enumerate(loans):
+            sim = self.run_contract(
+                amount, term, created, payment_day, template_params, fast_forward_events)
+            for period in range(schedules.periods[loan]):
+                due_date = schedules.due_dates[loan, period].astype(datetime)
+                due_time = datetime(
+                    due_date.year, due_date.month, due_date.day, tzinfo=timezone.utc)
+                sim.run_until(due_time + timedelta(seconds=1))
+                balances = sim.balances()
+                message = f"loan {loan} period {period}"
+                self.assertEqual(
+                    balances[address("DUE")].net,
+                    amortisation.to_decimal(schedules.due[loan, period]),
+                    message,
+                )
+                self.assertEqual(
+                    balances[address("DEFAULT")].net,
+                    amortisation.to_decimal(schedules.balance[loan, period]),
+                    message,
+                )
+                # Repay in full later that day, so nothing is overdue.
+                sim.inbound_hard_settlement(
+                    str(balances[address("DUE")].net),
+                    due_time + timedelta(hours=12),
+                    internal_account_id="12345",
+                )
+            sim.run_until(due_time + timedelta(days=1))
+            self.assertEqual(sim.rejections, [])
+            self.assertEqual(sim.notes, [])
+            self.assertEqual(sim.balances()[address("DUE")].net, Decimal(0))
+
+    def test_matches_contract_across_tiers_and_terms(self):
+        self.assert_matches_contract(LOANS)
+
+    def test_matches_contract_with_fast_forward_accrual(self):
+        self.assert_matches_contract(LOANS, fast_forward_events=("ACCRUED_INTEREST",))
+
+    def test_matches_contract_without_interest(self):
+        template_params = dict(
+            TEMPLATE_PARAMS,
+            gross_interest_rate_tiers='{"tier1": "0"}',
+            tier_ranges='{"tier1": {"min": 1000, "max": 25000}}',
+        )
+        # 1005 / 24 = 41.875 lands exactly on half a penny.
+        self.assert_matches_contract(
+            [("1005", 2, datetime(2019, 1, 1, tzinfo=timezone.utc), 5)], template_params)
+
+    def test_first_payment_matches_sandbox(self):
+        # The same loan as tests.TutorialTest.test_interest_charges.
+        schedules = amortisation.generate_schedules(
+            ["3000"], [2], ["2019-01-01T09:00"], [6],
+            TEMPLATE_PARAMS["gross_interest_rate_tiers"], TEMPLATE_PARAMS["tier_ranges"],
+        )
+        self.assertEqual(str(schedules.due_dates[0, 0]), "2019-02-06")
+        self.assertEqual(amortisation.to_decimal(schedules.balance[0, 0]), Decimal("2886.81"))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# flake8: noqa
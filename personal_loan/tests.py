@@ -7,6 +7,7 @@ import unittest
 import os
 from decimal import Decimal
 from datetime import datetime, timezone
+import local_simulator
 import vault_caller
 import json  # this needs to be added
 
@@ -15,6 +16,7 @@ core_api_url = "https://core-api.public-sandbox.partner.tmachine.io"
 auth_token = "A0003256414797670411991!FZ/D4LwwwqJMTyKW644WAqJkf/uXg7sC7LhWNtl7kL5dVCA7NDz6KQVLcMsei1O8eXBwxked7hNvZWQ9YXmrR8OPG+M="
 
 CONTRACT_FILE = './advanced_tutorial_contract.py'
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
 
 default_template_params = {
     'denomination': 'GBP',
@@ -120,7 +122,8 @@ class TutorialTest(unittest.TestCase):
             self.smart_contract_contents = smart_contract_file.read()
         self.client = vault_caller.Client(
             core_api_url=core_api_url,
-            auth_token=auth_token
+            auth_token=auth_token,
+            transport=vault_caller.transport_from_environment(RECORDINGS_DIR),
         )
 
     def test_initial_fund_movement(self):
@@ -790,3 +793,73 @@ class TutorialTest(unittest.TestCase):
         self.assertEqual(final_balances["DUE"], "441.67")
         self.assertEqual(final_balances["FEES"], "25")
         self.assertEqual(final_balances["DEFAULT"], "5416.66")
+
+
+class RepaidThisPeriodTest(unittest.TestCase):
+    """
+    Runs the contract in-process with local_simulator, so these need no sandbox. Same loan as
+    the partial payment tests above.
+    """
+
+    template_params = {
+        "denomination": "GBP",
+        "gross_interest_rate_tiers": '{"tier1": "0"}',
+        "tier_ranges": '{"tier1": {"min": 1000, "max": 25000}}',
+        "internal_account": "1",
+        "late_payment_fee": "25",
+    }
+    instance_params = {
+        "loan_term": "1",
+        "loan_amount": "6500",
+        "payment_day": "5",
+        "deposit_account": "12345",
+    }
+
+    def setUp(self):
+        self.sim = local_simulator.LocalSimulator.from_file(
+            os.path.join(os.path.dirname(__file__), CONTRACT_FILE),
+            start=datetime(year=2019, month=1, day=1, tzinfo=timezone.utc),
+            template_params=self.template_params,
+            instance_params=self.instance_params,
+        )
+
+    def balance(self, address):
+        return self.sim.balances()[
+            (address, local_simulator.DEFAULT_ASSET, "GBP", local_simulator.Phase.COMMITTED)
+        ].net
+
+    def pay(self, amount, hour):
+        self.sim.inbound_hard_settlement(
+            amount,
+            datetime(year=2019, month=2, day=5, hour=hour, tzinfo=timezone.utc),
+            internal_account_id="12345",
+        )
+
+    def test_partial_payments_tracked_until_next_period(self):
+        for amount, hour in [("200", 5), ("200", 7), ("200", 9)]:
+            self.pay(amount, hour)
+        self.sim.run_until(datetime(year=2019, month=2, day=5, hour=12, tzinfo=timezone.utc))
+        self.assertEqual(self.balance("DUE"), Decimal("141.67"))
+        self.assertEqual(self.balance("REPAID_THIS_PERIOD"), Decimal("400"))
+        self.assertEqual(
+            [rejection.message for rejection in self.sim.rejections],
+            ["Cannot overpay with this account, you can currently pay up to 141.67 "
+             "(attempting to pay 400 + 200)"],
+        )
+
+        self.sim.run_until(datetime(year=2019, month=3, day=5, hour=12, tzinfo=timezone.utc))
+        self.assertEqual(len(self.sim.notes), 1)
+        self.assertEqual(self.balance("REPAID_THIS_PERIOD"), Decimal(0))
+        self.assertEqual(self.balance("INTERNAL_CONTRA"), Decimal(0))
+
+    def test_attempted_overpayment(self):
+        self.pay("1000", 9)
+        self.sim.run_until(datetime(year=2019, month=2, day=5, hour=12, tzinfo=timezone.utc))
+        self.assertEqual(
+            [rejection.message for rejection in self.sim.rejections],
+            ["Cannot overpay with this account, you can currently pay up to 541.67 "
+             "(attempting to pay 0 + 1000)"],
+        )
+        # A rejected payment is neither applied nor tracked.
+        self.assertEqual(self.balance("DUE"), Decimal("541.67"))
+        self.assertEqual(self.balance("REPAID_THIS_PERIOD"), Decimal(0))
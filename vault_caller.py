@@ -1,7 +1,59 @@
+import ast
+import asyncio
 import functools
+import gzip
+import hashlib
+import io
+import itertools
 import json
+import math
+import os
+import threading
+import time
+import uuid
+import zlib
 import requests
-from collections import namedtuple
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+# Gateway errors and throttling are safe to retry: a simulation has no side effects on the
+# server, so replaying the same request is idempotent.
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+DEFAULT_DECODE_CHUNK_SIZE = 256 * 1024
+DEFAULT_CACHE_MAX_BYTES = 1024 ** 3
+_CACHE_SUFFIX = ".ndjson.gz"
+TRANSPORT_MODE_ENV = "VAULT_TRANSPORT"
+_JSON_ENCODER = json.JSONEncoder()
+HTTP_CONNECT_TIMEOUT = 10
+DEFAULT_DEADLINE_GRACE = 1.0
+# Workload units per instruction, relative to one scheduled event run on one simulated day.
+INSTRUCTION_WORK_UNITS = 0.5
+_GRPC_TIMEOUT_UNITS = {"H": 3600, "M": 60, "S": 1, "m": 1e-3, "u": 1e-6, "n": 1e-9}
+DEFAULT_METRICS_HISTORY = 1000
+METRICS_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_METRIC_TOTALS = (
+    "calls",
+    "cache_hits",
+    "request_bytes",
+    "response_bytes",
+    "events",
+    "time_to_first_byte_seconds",
+    "total_seconds",
+    "decode_seconds",
+)
 
 
 class VaultException(Exception):
@@ -28,32 +80,971 @@ SimulationInstruction = namedtuple(
     "SimulationInstruction", ["time", "instruction"])
 
 
+class DecodeStats:
+    def __init__(self):
+        self.bytes = 0
+        self.events = 0
+        self.decode_seconds = 0.0
+        self.elapsed_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def events_per_second(self):
+        return self.events / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def add(self, other):
+        with self._lock:
+            self.bytes += other.bytes
+            self.events += other.events
+            self.decode_seconds += other.decode_seconds
+            self.elapsed_seconds += other.elapsed_seconds
+
+    def __repr__(self):
+        return "DecodeStats(bytes=%d, events=%d, %.0f bytes/s, %.0f events/s)" % (
+            self.bytes,
+            self.events,
+            self.bytes_per_second,
+            self.events_per_second,
+        )
+
+
+class Projection(
+    namedtuple(
+        "Projection",
+        ["accounts", "addresses", "kinds", "final_only"],
+        defaults=(None, None, None, False),
+    )
+):
+    """
+    Restricts a simulation stream to what the caller asserts on.
+
+    accounts / addresses: only keep balances for these account ids / balance addresses.
+    kinds: only keep these keys of each result (e.g. "balances", "posting_instruction_batches",
+        "logs"). Events where all of them are empty are dropped.
+    final_only: only return the last event that still has something left after projection.
+
+    Lines that cannot match are recognised from their raw bytes and skipped without being
+    decoded. Error lines are always decoded so VaultException is still raised. With final_only,
+    the lines that might match are kept raw and decoded newest first until one does, so usually
+    only the last of them is decoded.
+    """
+
+    __slots__ = ()
+
+    def wants_line(self, buffer, start, end):
+        if self.is_error_line(buffer, start, end):
+            return True
+        for values in (self.accounts, self.addresses, self.kinds):
+            if values and not any(
+                buffer.find(b'"%s"' % value.encode(), start, end) >= 0 for value in values
+            ):
+                return False
+        return True
+
+    @staticmethod
+    def is_error_line(buffer, start, end):
+        return buffer.find(b'"error"', start, end) >= 0 or buffer.find(
+            b'"vault_error_code"', start, end) >= 0
+
+    def apply(self, event):
+        result = event.get("result")
+        if result is None:
+            return event
+        if self.kinds:
+            result = {kind: value for kind, value in result.items()
+                      if kind in self.kinds or kind == "timestamp"}
+        else:
+            result = dict(result)
+        if (self.accounts or self.addresses) and "balances" in result:
+            balances = {}
+            for account_id, account_balances in result["balances"].items():
+                if self.accounts and account_id not in self.accounts:
+                    continue
+                kept = [
+                    balance for balance in account_balances.get("balances", [])
+                    if not self.addresses or balance["account_address"] in self.addresses
+                ]
+                if kept:
+                    balances[account_id] = {**account_balances, "balances": kept}
+            result["balances"] = balances
+        if not any(value for kind, value in result.items() if kind != "timestamp"):
+            return None
+        return {**event, "result": result}
+
+
+class NdjsonDecoder:
+    """
+    Splits a stream of byte chunks into NDJSON events. Chunks are appended to one reusable
+    buffer and lines are handed to the JSON decoder as memoryview slices of it, so no per-line
+    copies are made when orjson is installed (the stdlib decoder needs its own bytes copy).
+    """
+
+    def __init__(self, chunk_size=DEFAULT_DECODE_CHUNK_SIZE, loads=None, projection=None):
+        self.chunk_size = chunk_size
+        if loads is not None:
+            self._loads, self._accepts_memoryview = loads, False
+        elif orjson is not None:
+            self._loads, self._accepts_memoryview = orjson.loads, True
+        else:
+            self._loads, self._accepts_memoryview = json.loads, False
+        self._projection = projection
+        self.stats = DecodeStats()
+
+    def _decode(self, view, start, end):
+        decode_started = time.perf_counter()
+        if self._accepts_memoryview:
+            with view[start:end] as line:
+                event = self._loads(line)
+        else:
+            event = self._loads(bytes(view[start:end]))
+        self.stats.decode_seconds += time.perf_counter() - decode_started
+        self.stats.events += 1
+        return event
+
+    def iter_events(self, chunks):
+        stats = self.stats
+        projection = self._projection
+        final_only = projection is not None and projection.final_only
+        # Lines that might be the final event, oldest first, and the newest event known to match.
+        candidates = []
+        candidate_bytes = 0
+        final_event = None
+        started = time.perf_counter()
+        buffer = bytearray()
+        try:
+            for chunk in itertools.chain(chunks, [None]):
+                if chunk is None:
+                    # A trailing newline flushes a last line the server did not terminate.
+                    chunk = b"\n"
+                else:
+                    stats.bytes += len(chunk)
+                buffer += chunk
+                start = 0
+                with memoryview(buffer) as view:
+                    while True:
+                        end = buffer.find(b"\n", start)
+                        if end < 0:
+                            break
+                        if end - start > 1 or (end > start and buffer[start] != 13):
+                            if projection is None:
+                                yield self._decode(view, start, end)
+                            elif not projection.wants_line(buffer, start, end):
+                                pass
+                            elif final_only and not projection.is_error_line(buffer, start, end):
+                                candidates.append(bytes(view[start:end]))
+                                candidate_bytes += end - start
+                                if candidate_bytes > self.chunk_size:
+                                    final_event = self._last_match(candidates, final_event)
+                                    candidates = []
+                                    candidate_bytes = 0
+                            else:
+                                yield self._decode(view, start, end)
+                        start = end + 1
+                # The view must be released before the buffer can be resized.
+                del buffer[:start]
+            if final_only:
+                final_event = self._last_match(candidates, final_event)
+                if final_event is not None:
+                    yield final_event
+        finally:
+            stats.elapsed_seconds = time.perf_counter() - started
+
+    def _last_match(self, lines, default):
+        # A line can mention what the projection looks for and still be empty once projected
+        # (an account in a posting but not in the balances, say), so decode until one is not.
+        for line in reversed(lines):
+            event = self._decode(memoryview(line), 0, len(line))
+            if self._projection.apply(event) is not None:
+                return event
+        return default
+
+
+def request_key(url, body):
+    """
+    Stable identifier of a request: the API path plus the exact serialised payload. Used to
+    address cached responses and recordings.
+    """
+    digest = hashlib.sha256(url.encode())
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+# url is the full URL; key is request_key() of the API path and body, so it does not depend on
+# the host or the auth token.
+# timeout is the time left until the client-side deadline, in seconds.
+TransportRequest = namedtuple(
+    "TransportRequest", ["url", "headers", "body", "key", "timeout"], defaults=(None,))
+
+
+class HttpTransport:
+    """
+    Sends requests to the core API over a pooled keep-alive connection with bounded retries.
+    Transports return a response supporting the context manager protocol, status_code, ok and
+    iter_content(chunk_size).
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size=DEFAULT_POOL_SIZE,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_factor=DEFAULT_BACKOFF_FACTOR,
+    ):
+        # A single adapter (and therefore a single urllib3 connection pool) is shared by every
+        # thread using this transport, so keep-alive connections are reused across calls. The
+        # pool blocks rather than opening throwaway connections when all of them are in use.
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=Retry(
+                total=max_retries,
+                connect=max_retries,
+                read=max_retries,
+                status=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=frozenset(["POST"]),
+                raise_on_status=False,
+            ),
+        )
+        self._local = threading.local()
+
+    def close(self):
+        self._adapter.close()
+
+    def _session(self):
+        # requests.Session is not safe to share between threads (cookie and header state), so
+        # each thread gets its own lightweight session mounted on the shared connection pool.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            session.headers["Connection"] = "keep-alive"
+            self._local.session = session
+        return session
+
+    def open(self, request):
+        # A file-like body is streamed to the socket in blocks rather than sent as one string,
+        # and urllib3 can rewind it if the request has to be retried.
+        # The read timeout bounds each blocking socket read; the overall deadline is enforced
+        # between chunks by the client.
+        try:
+            return self._session().post(
+                request.url,
+                headers=request.headers,
+                data=io.BytesIO(request.body),
+                stream=True,
+                timeout=None if request.timeout is None else (
+                    min(request.timeout, HTTP_CONNECT_TIMEOUT), request.timeout),
+            )
+        except requests.exceptions.ReadTimeout as e:
+            raise DeadlineExceeded("No response from the core API before the deadline") from e
+
+
+class RecordingNotFound(Exception):
+    pass
+
+
+class RecordingTransport:
+    """
+    Passes requests through to another transport (HTTP by default) and saves the raw NDJSON of
+    every successful response under its request key, for ReplayTransport to serve later.
+    """
+
+    def __init__(self, directory, transport=None):
+        self.directory = directory
+        self._transport = transport if transport is not None else HttpTransport()
+        os.makedirs(directory, exist_ok=True)
+
+    def close(self):
+        self._transport.close()
+
+    def open(self, request):
+        return _RecordingResponse(
+            self._transport.open(request), os.path.join(self.directory, request.key + ".ndjson"))
+
+
+class _RecordingResponse:
+    def __init__(self, response, path):
+        self._response = response
+        self._path = path
+        self._temp_path = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        self._file = open(self._temp_path, "wb")
+        self._chunks = None
+        self.status_code = response.status_code
+        self.ok = response.ok
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.ok:
+                # The consumer may stop at an error line; record the rest of the stream anyway
+                # so a replay behaves exactly like the original response.
+                if self._chunks is None:
+                    self._chunks = self._response.iter_content(
+                        chunk_size=DEFAULT_DECODE_CHUNK_SIZE)
+                for chunk in self._chunks:
+                    self._file.write(chunk)
+                self._file.close()
+                os.replace(self._temp_path, self._path)
+        finally:
+            self._file.close()
+            if os.path.exists(self._temp_path):
+                os.remove(self._temp_path)
+            self._response.close()
+
+    def iter_content(self, chunk_size):
+        self._chunks = self._response.iter_content(chunk_size=chunk_size)
+        for chunk in self._chunks:
+            self._file.write(chunk)
+            yield chunk
+
+
+class ReplayTransport:
+    """
+    Serves responses saved by RecordingTransport from local files, chunk by chunk, so replayed
+    simulations stream exactly like live ones without any network access.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def close(self):
+        pass
+
+    def open(self, request):
+        path = os.path.join(self.directory, request.key + ".ndjson")
+        try:
+            return _ReplayResponse(open(path, "rb"))
+        except FileNotFoundError:
+            raise RecordingNotFound(
+                "No recording %s for this request; record it first with "
+                "%s=record" % (path, TRANSPORT_MODE_ENV)
+            ) from None
+
+
+class _ReplayResponse:
+    status_code = 200
+    ok = True
+
+    def __init__(self, recording):
+        self._recording = recording
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._recording.close()
+
+    def iter_content(self, chunk_size):
+        return iter(functools.partial(self._recording.read, chunk_size), b"")
+
+
+def transport_from_environment(recordings_directory, **http_kwargs):
+    """
+    Picks the transport from the VAULT_TRANSPORT environment variable: "record" records live
+    responses into recordings_directory, "replay" serves them back without network access and
+    "live" (the default) talks to the core API directly. Any other value is rejected rather than
+    silently falling back to the network.
+    """
+    mode = os.environ.get(TRANSPORT_MODE_ENV, "").lower()
+    if mode == "record":
+        return RecordingTransport(recordings_directory, HttpTransport(**http_kwargs))
+    if mode == "replay":
+        return ReplayTransport(recordings_directory)
+    if mode in ("", "live"):
+        return HttpTransport(**http_kwargs)
+    raise ValueError(
+        "Unknown %s %r; use record, replay or live"
+        % (TRANSPORT_MODE_ENV, os.environ[TRANSPORT_MODE_ENV])
+    )
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return "CacheStats(hits=%d, misses=%d, stores=%d, evictions=%d)" % (
+            self.hits,
+            self.misses,
+            self.stores,
+            self.evictions,
+        )
+
+
+class ResponseCache:
+    """
+    Opt-in on-disk cache of raw simulate responses, keyed by request_key() of the full request
+    payload (contract code, parameters, instructions and timestamps). Responses are stored
+    gzipped and the least recently used ones are evicted once the cache grows beyond max_bytes.
+
+    Cached responses are replayed through the normal decoder, so projections and error handling
+    behave exactly as they do for a live response. Each hit is decompressed once to the end
+    before it is replayed, so a damaged entry is dropped and fetched again instead of failing the
+    caller part way through its events.
+    """
+
+    def __init__(self, directory, *, max_bytes=DEFAULT_CACHE_MAX_BYTES, compresslevel=6):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + _CACHE_SUFFIX)
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(_CACHE_SUFFIX):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            # mtime doubles as the last-used time for LRU eviction.
+            os.utime(path)
+            _check_gzip(path)
+            cached = gzip.open(path, "rb")
+        except FileNotFoundError:
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        except (OSError, EOFError, zlib.error):
+            self._discard(path)
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        with self._lock:
+            self.stats.hits += 1
+        return cached
+
+    def writer(self, key):
+        return _CacheWriter(self, key)
+
+    def _store(self, key, temp_path):
+        path = self._path(key)
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.stats.stores += 1
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _discard(self, path):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            self._size -= size
+
+    def _evict(self):
+        for path, _, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                os.remove(path)
+            self._size = 0
+
+
+def _check_gzip(path):
+    # gzip checks the CRC and length in the trailer once it reaches the end of the stream.
+    with gzip.open(path, "rb") as cached:
+        while cached.read(DEFAULT_DECODE_CHUNK_SIZE):
+            pass
+
+
+class _CacheWriter:
+    def __init__(self, cache, key):
+        self._cache = cache
+        self._key = key
+        shard = os.path.dirname(cache._path(key))
+        os.makedirs(shard, exist_ok=True)
+        self._temp_path = os.path.join(shard, "%s.%s.tmp" % (key, uuid.uuid4().hex))
+        self._file = gzip.open(self._temp_path, "wb", compresslevel=cache.compresslevel)
+        self._committed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self._file.closed:
+            self._file.close()
+        if not self._committed:
+            os.remove(self._temp_path)
+
+    def tee(self, chunks):
+        for chunk in chunks:
+            self._file.write(chunk)
+            yield chunk
+
+    def commit(self):
+        self._file.close()
+        self._cache._store(self._key, self._temp_path)
+        self._committed = True
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class SimulationWorkload(namedtuple(
+        "SimulationWorkload", ["simulated_days", "scheduled_events", "instructions"])):
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, smart_contracts, start_timestamp, end_timestamp, instructions):
+        simulated_days = max((end_timestamp - start_timestamp).total_seconds() / 86400, 0)
+        scheduled_events = sum(
+            count_scheduled_events(contract.get("code", ""))
+            for contract in smart_contracts if isinstance(contract, dict))
+        return cls(simulated_days, scheduled_events, len(instructions))
+
+    @property
+    def units(self):
+        # Server-side cost is dominated by running every scheduled event on every simulated day
+        # (plus a floor of one unit a day for simply stepping through time) and by processing
+        # the instructions.
+        return (
+            self.simulated_days * (1 + self.scheduled_events)
+            + self.instructions * INSTRUCTION_WORK_UNITS
+        )
+
+
+def count_scheduled_events(code):
+    """
+    Number of scheduled event types a contract declares: the schedules returned by a v3
+    execution_schedules hook, or EventType / SmartContractEventType declarations. Each is
+    counted as running daily, which overestimates monthly events but keeps deadlines safe.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return 0
+    count = 0
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and node.name == "execution_schedules":
+            for returned in ast.walk(node):
+                if isinstance(returned, ast.Return) and isinstance(returned.value, ast.List):
+                    count += len(returned.value.elts)
+        elif isinstance(node, ast.Call) and getattr(node.func, "id", None) in (
+            "EventType",
+            "SmartContractEventType",
+        ):
+            count += 1
+    return count
+
+
+class DeadlinePolicy:
+    """
+    Estimates a simulate deadline from the simulated period, the contracts' scheduled events
+    and the instruction count, and learns the server's actual speed from completed calls.
+
+    Completed calls feed an exponentially weighted linear fit of elapsed seconds against workload
+    units, so the fixed overhead (base_seconds) and the rate (seconds_per_unit) are learnt
+    separately: a run of short calls refines the overhead without dragging down the rate long
+    simulations need. The rate is only refitted once the observed workloads vary enough to
+    separate the two, and never drops below min_rate_fraction of its initial value. A timed out
+    call bumps the rate up by backoff so the next similar simulation gets more time.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_seconds=5.0,
+        seconds_per_unit=0.02,
+        safety_factor=2.0,
+        min_seconds=5.0,
+        max_seconds=600.0,
+        smoothing=0.2,
+        backoff=1.5,
+        min_rate_fraction=0.5,
+    ):
+        self.base_seconds = base_seconds
+        self.seconds_per_unit = seconds_per_unit
+        self.min_seconds_per_unit = seconds_per_unit * min_rate_fraction
+        self.safety_factor = safety_factor
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.smoothing = smoothing
+        self.backoff = backoff
+        # Exponentially weighted moments of the completed calls' (units, elapsed seconds).
+        self._mean_units = None
+        self._mean_seconds = 0.0
+        self._var_units = 0.0
+        self._cov = 0.0
+        self._lock = threading.Lock()
+
+    def estimate(self, workload):
+        with self._lock:
+            seconds = (self.base_seconds + workload.units * self.seconds_per_unit) * (
+                self.safety_factor)
+        return min(max(seconds, self.min_seconds), self.max_seconds)
+
+    def observe(self, workload, elapsed_seconds, timed_out=False):
+        units = workload.units
+        if units <= 0:
+            return
+        with self._lock:
+            if timed_out:
+                self.seconds_per_unit *= self.backoff
+                return
+            if self._mean_units is None:
+                self._mean_units, self._mean_seconds = units, elapsed_seconds
+            else:
+                d_units = units - self._mean_units
+                d_seconds = elapsed_seconds - self._mean_seconds
+                self._mean_units += self.smoothing * d_units
+                self._mean_seconds += self.smoothing * d_seconds
+                self._var_units = (1 - self.smoothing) * (
+                    self._var_units + self.smoothing * d_units * d_units)
+                self._cov = (1 - self.smoothing) * (
+                    self._cov + self.smoothing * d_units * d_seconds)
+            # Calls of (nearly) the same size say nothing about the rate, only about the overhead.
+            if self._var_units > (0.1 * self._mean_units) ** 2:
+                self.seconds_per_unit = max(
+                    self._cov / self._var_units, self.min_seconds_per_unit)
+            self.base_seconds = max(
+                self._mean_seconds - self.seconds_per_unit * self._mean_units, 0.0)
+
+
+def _deadline_errors(chunks):
+    # requests reports a read timeout in the middle of a stream as a ConnectionError.
+    chunks = iter(chunks)
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.Timeout) or (
+                e.args and isinstance(e.args[0], ReadTimeoutError)
+            ):
+                raise DeadlineExceeded("Simulation stream timed out at its deadline") from e
+            raise
+        yield chunk
+
+
+def _is_timeout(metrics):
+    # Only the deadline expiring counts; a connect timeout says nothing about simulation speed.
+    if metrics.error_code in ("DeadlineExceeded", "ReadTimeout"):
+        return True
+    # 504 Gateway Timeout, or gRPC's DEADLINE_EXCEEDED passed through by the gateway.
+    return metrics.status_code == 504 or metrics.error_code in (4, "4", "DEADLINE_EXCEEDED")
+
+
+def _parse_grpc_timeout(timeout):
+    return float(timeout[:-1]) * _GRPC_TIMEOUT_UNITS[timeout[-1]]
+
+
+def _format_grpc_timeout(seconds):
+    return "%dS" % math.ceil(seconds)
+
+
+class CallMetrics:
+    """
+    Measurements for one simulate call. Timings are in seconds from when the call started;
+    error_code is the Vault error code (or exception name) the call failed with, if any.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.cached = False
+        self.status_code = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.events = 0
+        self.time_to_first_byte = None
+        self.total_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.error_code = None
+
+    def __repr__(self):
+        return "CallMetrics(%s)" % ", ".join(
+            "%s=%r" % (name, value) for name, value in vars(self).items())
+
+
+class MetricsSink(ABC):
+    """Receives the CallMetrics of every call a Client makes, from whichever thread made it."""
+
+    @abstractmethod
+    def record(self, metrics):
+        pass
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Keeps the most recent calls and running totals per (url, error_code), which is what
+    PrometheusExporter renders.
+    """
+
+    def __init__(self, max_calls=DEFAULT_METRICS_HISTORY):
+        self.calls = deque(maxlen=max_calls)
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        key = (metrics.url, "" if metrics.error_code is None else str(metrics.error_code))
+        with self._lock:
+            self.calls.append(metrics)
+            totals = self.totals.get(key)
+            if totals is None:
+                totals = self.totals[key] = dict.fromkeys(_METRIC_TOTALS, 0)
+                totals["duration_buckets"] = [0] * len(METRICS_DURATION_BUCKETS)
+            totals["calls"] += 1
+            totals["cache_hits"] += int(metrics.cached)
+            totals["request_bytes"] += metrics.request_bytes
+            totals["response_bytes"] += metrics.response_bytes
+            totals["events"] += metrics.events
+            totals["time_to_first_byte_seconds"] += metrics.time_to_first_byte or 0.0
+            totals["total_seconds"] += metrics.total_seconds
+            totals["decode_seconds"] += metrics.decode_seconds
+            for i, bucket in enumerate(METRICS_DURATION_BUCKETS):
+                if metrics.total_seconds <= bucket:
+                    totals["duration_buckets"][i] += 1
+
+
+class PrometheusExporter:
+    """
+    Renders an InMemoryMetricsSink in the Prometheus text exposition format, either for a
+    scrape endpoint or for the node_exporter textfile collector (see write()).
+    """
+
+    _COUNTERS = [
+        ("calls", "vault_simulate_calls_total", "Simulate calls made."),
+        ("cache_hits", "vault_simulate_cache_hits_total", "Simulate calls served from cache."),
+        ("request_bytes", "vault_simulate_request_bytes_total", "Request payload bytes sent."),
+        ("response_bytes", "vault_simulate_response_bytes_total", "Response bytes decoded."),
+        ("events", "vault_simulate_events_total", "Result events decoded."),
+        ("time_to_first_byte_seconds", "vault_simulate_time_to_first_byte_seconds_total",
+         "Time until the first response byte."),
+        ("decode_seconds", "vault_simulate_decode_seconds_total", "Time spent decoding JSON."),
+    ]
+
+    def __init__(self, sink, prefix_labels=None):
+        self._sink = sink
+        self._prefix_labels = prefix_labels or {}
+
+    def _labels(self, url, error_code, **extra):
+        labels = {**self._prefix_labels, "url": url, "error_code": error_code, **extra}
+        return "{%s}" % ",".join(
+            '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in labels.items()
+        )
+
+    def render(self):
+        with self._sink._lock:
+            totals = {key: dict(value) for key, value in self._sink.totals.items()}
+        lines = []
+        for field, name, help_text in self._COUNTERS:
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s counter" % name)
+            for (url, error_code), values in sorted(totals.items()):
+                lines.append("%s%s %s" % (name, self._labels(url, error_code), values[field]))
+        name = "vault_simulate_duration_seconds"
+        lines.append("# HELP %s Total time of a simulate call, including streaming." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for (url, error_code), values in sorted(totals.items()):
+            for bucket, count in zip(METRICS_DURATION_BUCKETS, values["duration_buckets"]):
+                lines.append("%s_bucket%s %s" % (
+                    name, self._labels(url, error_code, le=bucket), count))
+            lines.append("%s_bucket%s %s" % (
+                name, self._labels(url, error_code, le="+Inf"), values["calls"]))
+            lines.append("%s_sum%s %s" % (
+                name, self._labels(url, error_code), values["total_seconds"]))
+            lines.append("%s_count%s %s" % (
+                name, self._labels(url, error_code), values["calls"]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temp_path, path)
+
+
+def _timed_chunks(chunks, metrics, started, deadline):
+    for chunk in _deadline_errors(chunks):
+        if metrics.time_to_first_byte is None:
+            metrics.time_to_first_byte = time.perf_counter() - started
+        if time.monotonic() > deadline:
+            # Leaving the generator closes the response, cancelling the stream.
+            raise DeadlineExceeded("Simulation stream cancelled at its client-side deadline")
+        yield chunk
+
+
 class Client:
-    def __init__(self, *, core_api_url, auth_token):
+    def __init__(
+        self,
+        *,
+        core_api_url,
+        auth_token,
+        pool_size=DEFAULT_POOL_SIZE,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_factor=DEFAULT_BACKOFF_FACTOR,
+        decode_chunk_size=DEFAULT_DECODE_CHUNK_SIZE,
+        cache=None,
+        metrics_sink=None,
+        transport=None,
+        deadline_policy=None,
+    ):
         self._core_api_url = core_api_url.rstrip("/")
         self._auth_token = auth_token
+        self._decode_chunk_size = decode_chunk_size
+        self._cache = cache
+        self.metrics_sink = metrics_sink if metrics_sink is not None else InMemoryMetricsSink()
+        self.deadline_policy = deadline_policy if deadline_policy is not None else DeadlinePolicy()
+        # Running totals across every call made by this client.
+        self.decode_stats = DecodeStats()
+        if transport is None:
+            transport = HttpTransport(
+                pool_size=pool_size, max_retries=max_retries, backoff_factor=backoff_factor)
+        self.transport = transport
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.transport.close()
 
     @_auth_required
-    def _api_post(self, url, payload, timeout):
-        response = requests.post(
-            self._core_api_url + url,
-            headers={
-                "Content-Type": "application/json",
-                "X-Auth-Token": self._auth_token,
-                "grpc-timeout": timeout,
-            },
-            json=payload,
-            stream=True,
-        )
+    def _api_stream(self, url, payload, timeout, projection=None, workload=None):
+        metrics = CallMetrics(url)
+        started = time.perf_counter()
+        # The client gives up slightly after the server-side deadline, so the server normally
+        # gets to report its own timeout first.
+        deadline = time.monotonic() + _parse_grpc_timeout(timeout) + DEFAULT_DEADLINE_GRACE
+        completed = False
+        try:
+            yield from self._stream_response(
+                url, payload, timeout, projection, metrics, started, deadline)
+            completed = True
+        except VaultException as e:
+            metrics.error_code = e.vault_error_code
+            raise
+        except Exception as e:
+            metrics.error_code = type(e).__name__
+            raise
+        finally:
+            metrics.total_seconds = time.perf_counter() - started
+            self.metrics_sink.record(metrics)
+            # A stream the caller abandoned or that failed early says nothing about how long the
+            # simulation takes, so only complete streams and deadline expiries are learnt from.
+            if workload is not None and not metrics.cached:
+                if completed:
+                    self.deadline_policy.observe(workload, metrics.total_seconds)
+                elif _is_timeout(metrics):
+                    self.deadline_policy.observe(
+                        workload, metrics.total_seconds, timed_out=True)
+
+    def _stream_response(self, url, payload, timeout, projection, metrics, started, deadline):
+        # Simulate payloads arrive already serialised (see _serialize_simulate_payload).
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        metrics.request_bytes = len(body)
 
-        resp = []
-        for line in response.iter_lines():
-            json_line = json.loads(line)
-            self._handle_error(json_line)
+        key = request_key(url, body)
+        cache_key = None
+        if self._cache is not None:
+            cache_key = key
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                metrics.cached = True
+                with cached:
+                    chunks = iter(functools.partial(cached.read, self._decode_chunk_size), b"")
+                    yield from self._decode_stream(
+                        _timed_chunks(chunks, metrics, started, deadline), projection, metrics)
+                return
 
-            resp.append(json_line)
+        # Closing the response hands the connection back to the pool even when an error line
+        # (or a consumer that stops iterating early) abandons the stream part way through.
+        with self.transport.open(
+            TransportRequest(
+                url=self._core_api_url + url,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Auth-Token": self._auth_token,
+                    "grpc-timeout": timeout,
+                },
+                body=body,
+                key=key,
+                timeout=max(deadline - time.monotonic(), 0),
+            )
+        ) as response:
+            metrics.status_code = response.status_code
+            chunks = _timed_chunks(
+                response.iter_content(chunk_size=self._decode_chunk_size),
+                metrics,
+                started,
+                deadline,
+            )
+            if cache_key is None:
+                yield from self._decode_stream(chunks, projection, metrics)
+            else:
+                # Only complete, error-free responses are cached; the writer discards anything
+                # else when it is closed without being committed.
+                with self._cache.writer(cache_key) as writer:
+                    yield from self._decode_stream(writer.tee(chunks), projection, metrics)
+                    if response.ok:
+                        writer.commit()
 
-        return resp
+    def _decode_stream(self, chunks, projection, metrics):
+        decoder = NdjsonDecoder(self._decode_chunk_size, projection=projection)
+        try:
+            for json_line in decoder.iter_events(chunks):
+                self._handle_error(json_line)
+                if projection is not None:
+                    json_line = projection.apply(json_line)
+                    if json_line is None:
+                        continue
+
+                yield json_line
+        finally:
+            self.decode_stats.add(decoder.stats)
+            metrics.response_bytes = decoder.stats.bytes
+            metrics.events = decoder.stats.events
+            metrics.decode_seconds = decoder.stats.decode_seconds
+
+    def _api_post(self, url, payload, timeout, projection=None):
+        return list(self._api_stream(url, payload, timeout, projection))
 
     @staticmethod
     def _handle_error(content):
@@ -64,21 +1055,238 @@ class Client:
             raise ValueError(content["error"])
 
     def simulate_contracts(
-        self, *, smart_contracts, start_timestamp, end_timestamp, instructions, timeout="10S"
+        self,
+        *,
+        smart_contracts,
+        start_timestamp,
+        end_timestamp,
+        instructions,
+        timeout=None,
+        projection=None,
+    ):
+        """
+        Runs a simulation and returns all of its results. Without an explicit grpc-style timeout
+        (e.g. "30S") the deadline comes from the client's DeadlinePolicy.
+        """
+        return list(
+            self.iter_simulate_contracts(
+                smart_contracts=smart_contracts,
+                start_timestamp=start_timestamp,
+                end_timestamp=end_timestamp,
+                instructions=instructions,
+                timeout=timeout,
+                projection=projection,
+            )
+        )
+
+    def iter_simulate_contracts(
+        self,
+        *,
+        smart_contracts,
+        start_timestamp,
+        end_timestamp,
+        instructions,
+        timeout=None,
+        projection=None,
     ):
-        instructions = [_instruction_to_json(
-            instruction) for instruction in instructions]
-        payload = self._api_post(
+        """
+        Same as simulate_contracts, but yields each result as it is streamed back instead of
+        holding the whole simulation in memory. Raises VaultException on the first error line.
+        """
+        if not hasattr(instructions, "__len__"):
+            instructions = list(instructions)
+        timeout, workload = self._simulate_timeout(
+            smart_contracts, start_timestamp, end_timestamp, instructions, timeout)
+        return self._simulate_stream(
+            smart_contracts, start_timestamp, end_timestamp, instructions, timeout, projection,
+            workload)
+
+    def _simulate_timeout(
+        self, smart_contracts, start_timestamp, end_timestamp, instructions, timeout
+    ):
+        # Returns the grpc-style timeout to send and, when it was estimated, the workload the
+        # deadline policy should learn from.
+        if timeout is not None:
+            return timeout, None
+        workload = SimulationWorkload.of(
+            smart_contracts, start_timestamp, end_timestamp, instructions)
+        return _format_grpc_timeout(self.deadline_policy.estimate(workload)), workload
+
+    def _simulate_stream(
+        self, smart_contracts, start_timestamp, end_timestamp, instructions, timeout, projection,
+        workload,
+    ):
+        return self._api_stream(
             "/v1/contracts:simulate",
-            {
-                "smart_contracts": smart_contracts,
-                "start_timestamp": _datetime_to_rfc_3339(start_timestamp),
-                "end_timestamp": _datetime_to_rfc_3339(end_timestamp),
-                "instructions": instructions,
-            },
+            _serialize_simulate_payload(
+                smart_contracts, start_timestamp, end_timestamp, instructions),
             timeout=timeout,
+            projection=projection,
+            workload=workload,
         )
-        return payload
+
+
+class AsyncClient:
+    # requests has no asyncio support, so simulations run on a thread pool sized to the
+    # connection pool of the wrapped Client. Payloads and deadlines come from that Client, so
+    # both clients send exactly the same requests.
+    def __init__(self, *, core_api_url, auth_token, max_concurrency=DEFAULT_POOL_SIZE, **kwargs):
+        self._client = Client(
+            core_api_url=core_api_url, auth_token=auth_token, pool_size=max_concurrency, **kwargs
+        )
+        self._max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="vault-simulate"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._client.close()
+
+    async def simulate_contracts(
+        self,
+        *,
+        smart_contracts,
+        start_timestamp,
+        end_timestamp,
+        instructions,
+        timeout=None,
+        projection=None,
+    ):
+        """
+        Runs Client.simulate_contracts on the thread pool. The call's deadline is also enforced
+        here, from when a worker picks the call up, so a stream that stalls raises
+        DeadlineExceeded even where the transport has no read timeout to give up with. The
+        worker itself is only freed once the transport gives up.
+        """
+        if not hasattr(instructions, "__len__"):
+            instructions = list(instructions)
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def start(seconds):
+            if not started.done():
+                started.set_result(seconds)
+
+        def call():
+            # The deadline is worked out on the worker, so time spent queued for a free worker
+            # does not count against it and the contract parsing stays off the event loop.
+            call_timeout, workload = self._client._simulate_timeout(
+                smart_contracts, start_timestamp, end_timestamp, instructions, timeout)
+            loop.call_soon_threadsafe(start, _parse_grpc_timeout(call_timeout))
+            return list(self._client._simulate_stream(
+                smart_contracts, start_timestamp, end_timestamp, instructions, call_timeout,
+                projection, workload))
+
+        future = loop.run_in_executor(self._executor, call)
+        try:
+            await asyncio.wait([started, future], return_when=asyncio.FIRST_COMPLETED)
+            if not started.done():
+                return await future
+            # Allow the Client a grace period past its own deadline to report the expiry first.
+            done, _ = await asyncio.wait(
+                [future], timeout=started.result() + 2 * DEFAULT_DEADLINE_GRACE)
+            if not done:
+                raise DeadlineExceeded("Simulation stream stalled past its client-side deadline")
+            return future.result()
+        finally:
+            future.cancel()
+            started.cancel()
+
+    async def simulate_many(self, simulations, *, concurrency=None, return_exceptions=False):
+        """
+        Runs every simulation (an iterable of simulate_contracts keyword arguments) with at most
+        `concurrency` in flight, yielding (index, result) pairs in completion order. With
+        return_exceptions the exception takes the place of the result instead of aborting the
+        remaining simulations.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self._max_concurrency)
+
+        async def run(index, simulation):
+            async with semaphore:
+                try:
+                    return index, await self.simulate_contracts(**simulation)
+                except asyncio.CancelledError:
+                    # Cancellation is never a simulation's result.
+                    raise
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    return index, e
+
+        tasks = [
+            asyncio.ensure_future(run(index, simulation))
+            for index, simulation in enumerate(simulations)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _simulate_payload(smart_contracts, start_timestamp, end_timestamp, instructions):
+    return {
+        "smart_contracts": smart_contracts,
+        "start_timestamp": _datetime_to_rfc_3339(start_timestamp),
+        "end_timestamp": _datetime_to_rfc_3339(end_timestamp),
+        "instructions": [_instruction_to_json(instruction) for instruction in instructions],
+    }
+
+
+def _serialize_simulate_payload(smart_contracts, start_timestamp, end_timestamp, instructions):
+    """
+    Serialises a simulate request straight into a buffer, one instruction at a time, producing
+    exactly the same bytes as json.dumps(_simulate_payload(...)). Avoids building a merged dict
+    per instruction and one large Python structure for the whole request, and converts each
+    distinct instruction time to RFC 3339 only once.
+    """
+    to_rfc_3339 = _Rfc3339Cache()
+    encode = _JSON_ENCODER.encode
+    buffer = io.BytesIO()
+    write = buffer.write
+    write(b'{"smart_contracts": ')
+    write(encode(smart_contracts).encode())
+    write(b', "start_timestamp": ')
+    write(encode(to_rfc_3339(start_timestamp)).encode())
+    write(b', "end_timestamp": ')
+    write(encode(to_rfc_3339(end_timestamp)).encode())
+    write(b', "instructions": [')
+    separator = b""
+    for time_, instruction in instructions:
+        write(separator)
+        separator = b", "
+        if "timestamp" in instruction:
+            # The instruction's own timestamp wins, as it does with the dict merge.
+            write(encode({"timestamp": to_rfc_3339(time_), **instruction}).encode())
+            continue
+        write(b'{"timestamp": ')
+        write(encode(to_rfc_3339(time_)).encode())
+        if instruction:
+            write(b", ")
+            write(encode(instruction)[1:].encode())
+        else:
+            write(b"}")
+    write(b"]}")
+    return buffer.getvalue()
+
+
+class _Rfc3339Cache(dict):
+    def __call__(self, dt):
+        # Equal instants hash and compare equal whatever their zone, and all of them serialise
+        # to the same UTC string, so the datetime itself is a safe key.
+        try:
+            return self[dt]
+        except KeyError:
+            value = self[dt] = _datetime_to_rfc_3339(dt)
+            return value
 
 
 def _datetime_to_rfc_3339(dt):
@@ -86,7 +1294,9 @@ def _datetime_to_rfc_3339(dt):
         dt) is not None
     if not timezone_aware:
         raise ValueError("The datetime object passed in is not timezone-aware")
-    return dt.astimezone().isoformat()
+    # Normalise to UTC rather than the machine's local zone so the same simulation always
+    # serialises to the same payload (and request key) wherever it runs.
+    return dt.astimezone(timezone.utc).isoformat()
 
 
 def _instruction_to_json(instruction):
@@ -0,0 +1,652 @@
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+
+import vault_caller
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import asyncio
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+START = datetime(year=2019, month=1, day=1, tzinfo=timezone.utc)
+# A five year loan with four scheduled events: 1825 * (1 + 4) workload units.
+LOAN_WORKLOAD = vault_caller.SimulationWorkload(1825, 4, 0)
+SHORT_WORKLOAD = vault_caller.SimulationWorkload(1, 4, 0)
+
+
+def ndjson(*events):
+    return b"".join(json.dumps(event).encode() + b"\n" for event in events)
+
+
+class FakeResponse:
+    def __init__(self, chunks, status_code=200):
+        self._chunks = chunks
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+    def iter_content(self, chunk_size):
+        for chunk in self._chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            if callable(chunk):
+                # Stands in for a blocking read.
+                chunk()
+                continue
+            yield chunk
+
+
+class FakeTransport:
+    """Serves canned chunks for every request and remembers what was sent."""
+
+    def __init__(self, chunks=(), status_code=200):
+        self.chunks = list(chunks)
+        self.status_code = status_code
+        self.requests = []
+
+    def close(self):
+        pass
+
+    def open(self, request):
+        self.requests.append(request)
+        return FakeResponse(self.chunks, self.status_code)
+
+
+class RecordingPolicy(vault_caller.DeadlinePolicy):
+    def __init__(self):
+        super().__init__()
+        self.observations = []
+
+    def observe(self, workload, elapsed_seconds, timed_out=False):
+        self.observations.append((workload, timed_out))
+        super().observe(workload, elapsed_seconds, timed_out)
+
+
+class DeadlinePolicyTest(unittest.TestCase):
+    def make_client(self, transport):
+        self.policy = RecordingPolicy()
+        return vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", transport=transport,
+            deadline_policy=self.policy,
+        )
+
+    def simulate(self, client):
+        return client.iter_simulate_contracts(
+            smart_contracts=[], start_timestamp=START, end_timestamp=START, instructions=[])
+
+    def test_short_calls_do_not_shrink_long_deadlines(self):
+        policy = vault_caller.DeadlinePolicy()
+        initial = policy.estimate(LOAN_WORKLOAD)
+        for _ in range(30):
+            policy.observe(SHORT_WORKLOAD, 0.5)
+        self.assertGreaterEqual(policy.estimate(LOAN_WORKLOAD), initial * 0.9)
+        # The short calls were faster than the default overhead, which is what they teach.
+        self.assertLess(policy.base_seconds, 5.0)
+
+    def test_rate_is_fitted_from_varied_workloads(self):
+        policy = vault_caller.DeadlinePolicy()
+        for days in [10, 100, 400, 1000] * 10:
+            workload = vault_caller.SimulationWorkload(days, 4, 0)
+            policy.observe(workload, 2.0 + workload.units * 0.04)
+        self.assertAlmostEqual(policy.seconds_per_unit, 0.04, places=6)
+        self.assertAlmostEqual(policy.base_seconds, 2.0, places=4)
+
+    def test_rate_never_drops_below_floor(self):
+        policy = vault_caller.DeadlinePolicy(seconds_per_unit=0.02, min_rate_fraction=0.5)
+        for days in [10, 1000] * 20:
+            policy.observe(vault_caller.SimulationWorkload(days, 4, 0), 0.1)
+        self.assertEqual(policy.seconds_per_unit, 0.01)
+
+    def test_timeout_backs_off(self):
+        policy = vault_caller.DeadlinePolicy()
+        before = policy.estimate(LOAN_WORKLOAD)
+        policy.observe(LOAN_WORKLOAD, 375, timed_out=True)
+        self.assertGreater(policy.estimate(LOAN_WORKLOAD), before)
+
+    def test_completed_stream_is_observed(self):
+        client = self.make_client(FakeTransport([ndjson({"result": {"timestamp": "x"}})]))
+        list(self.simulate(client))
+        self.assertEqual(len(self.policy.observations), 1)
+        self.assertFalse(self.policy.observations[0][1])
+
+    def test_abandoned_stream_is_not_observed(self):
+        client = self.make_client(FakeTransport([
+            ndjson({"result": {"timestamp": "1"}}), ndjson({"result": {"timestamp": "2"}})]))
+        stream = self.simulate(client)
+        next(stream)
+        stream.close()
+        self.assertEqual(self.policy.observations, [])
+
+    def test_early_failure_is_not_observed(self):
+        client = self.make_client(FakeTransport([ConnectionResetError("reset")]))
+        with self.assertRaises(ConnectionResetError):
+            list(self.simulate(client))
+        self.assertEqual(self.policy.observations, [])
+
+        client = self.make_client(FakeTransport(
+            [ndjson({"vault_error_code": 3, "message": "bad contract"})]))
+        with self.assertRaises(vault_caller.VaultException):
+            list(self.simulate(client))
+        self.assertEqual(self.policy.observations, [])
+
+    def test_deadline_expiry_is_observed_as_timeout(self):
+        client = self.make_client(FakeTransport(
+            [vault_caller.DeadlineExceeded("Simulation stream timed out at its deadline")]))
+        with self.assertRaises(vault_caller.DeadlineExceeded):
+            list(self.simulate(client))
+        self.assertEqual(len(self.policy.observations), 1)
+        self.assertTrue(self.policy.observations[0][1])
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def store(self, cache, key, data):
+        with cache.writer(key) as writer:
+            for _ in writer.tee([data]):
+                pass
+            writer.commit()
+
+    def read(self, cache, key):
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        with cached:
+            return cached.read()
+
+    def simulate(self, client):
+        return client.simulate_contracts(
+            smart_contracts=[], start_timestamp=START, end_timestamp=START, instructions=[],
+            timeout="10S")
+
+    def test_miss_then_hit(self):
+        cache = vault_caller.ResponseCache(self.directory)
+        events = [{"result": {"timestamp": "1"}}, {"result": {"timestamp": "2"}}]
+        transport = FakeTransport([ndjson(*events)])
+        client = vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", transport=transport, cache=cache)
+
+        self.assertEqual(self.simulate(client), events)
+        self.assertEqual(self.simulate(client), events)
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(
+            (cache.stats.misses, cache.stats.hits, cache.stats.stores), (1, 1, 1))
+        self.assertTrue(client.metrics_sink.calls[-1].cached)
+
+    def test_error_responses_are_not_stored(self):
+        cache = vault_caller.ResponseCache(self.directory)
+        transport = FakeTransport([ndjson({"vault_error_code": 3, "message": "bad contract"})])
+        client = vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", transport=transport, cache=cache)
+        for _ in range(2):
+            with self.assertRaises(vault_caller.VaultException):
+                self.simulate(client)
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(cache.stats.stores, 0)
+        self.assertEqual(list(cache._entries()), [])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        data = os.urandom(1000)
+        cache = vault_caller.ResponseCache(self.directory, max_bytes=2500, compresslevel=0)
+        for age, key in [(30, "aa01"), (20, "bb02")]:
+            self.store(cache, key, data)
+            os.utime(cache._path(key), (time.time() - age, time.time() - age))
+        # Reading aa01 makes bb02 the least recently used entry.
+        self.assertEqual(self.read(cache, "aa01"), data)
+        self.store(cache, "cc03", data)
+
+        self.assertIsNone(self.read(cache, "bb02"))
+        self.assertEqual(self.read(cache, "aa01"), data)
+        self.assertEqual(self.read(cache, "cc03"), data)
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertLessEqual(cache._size, cache.max_bytes)
+        # A cache reopened on the same directory picks up the size of what is already there.
+        self.assertEqual(vault_caller.ResponseCache(self.directory)._size, cache._size)
+
+    def test_corrupt_entries_are_dropped(self):
+        cache = vault_caller.ResponseCache(self.directory)
+        self.store(cache, "aa01", ndjson({"result": {}}) * 100)
+        self.store(cache, "bb02", b"")
+        with open(cache._path("aa01"), "rb") as cached_file:
+            truncated = cached_file.read()[:-10]
+        with open(cache._path("aa01"), "wb") as cached_file:
+            cached_file.write(truncated)
+        with open(cache._path("bb02"), "wb") as cached_file:
+            cached_file.write(b"not gzip")
+
+        for key in ["aa01", "bb02"]:
+            self.assertIsNone(cache.get(key))
+            self.assertFalse(os.path.exists(cache._path(key)))
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (0, 2))
+        self.assertEqual(list(cache._entries()), [])
+
+    def test_corrupt_entry_is_fetched_again(self):
+        cache = vault_caller.ResponseCache(self.directory)
+        events = [{"result": {"timestamp": "1"}}]
+        transport = FakeTransport([ndjson(*events)])
+        client = vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", transport=transport, cache=cache)
+        self.simulate(client)
+        with gzip.open(cache._path(transport.requests[0].key), "rb") as cached:
+            self.assertEqual(cached.read(), ndjson(*events))
+        with open(cache._path(transport.requests[0].key), "wb") as cached_file:
+            cached_file.write(b"\x1f\x8b damaged")
+
+        self.assertEqual(self.simulate(client), events)
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(self.simulate(client), events)
+        self.assertEqual(len(transport.requests), 2)
+
+
+class NdjsonDecoderTest(unittest.TestCase):
+    events = [{"result": {"timestamp": str(i), "logs": ["é", i]}} for i in range(5)]
+
+    def decoders(self):
+        yield "stdlib", vault_caller.NdjsonDecoder(loads=json.loads)
+        with mock.patch.object(vault_caller, "orjson", None):
+            decoder = vault_caller.NdjsonDecoder()
+        self.assertIs(decoder._loads, json.loads)
+        yield "stdlib without orjson", decoder
+        if vault_caller.orjson is not None:
+            yield "orjson", vault_caller.NdjsonDecoder()
+
+    def decode(self, chunks):
+        results = {}
+        for name, decoder in self.decoders():
+            results[name] = list(decoder.iter_events(iter(chunks)))
+            self.assertEqual(decoder.stats.bytes, sum(len(chunk) for chunk in chunks), name)
+        return results
+
+    def test_default_decoder(self):
+        decoder = vault_caller.NdjsonDecoder()
+        if vault_caller.orjson is None:
+            self.assertIs(decoder._loads, json.loads)
+        else:
+            self.assertIs(decoder._loads, vault_caller.orjson.loads)
+            self.assertTrue(decoder._accepts_memoryview)
+
+    def test_lines_split_across_chunks(self):
+        stream = ndjson(*self.events)
+        for size in [1, 2, 7, len(stream) // 2, len(stream)]:
+            chunks = [stream[i:i + size] for i in range(0, len(stream), size)]
+            for name, events in self.decode(chunks).items():
+                self.assertEqual(events, self.events, (name, size))
+
+    def test_blank_lines_are_skipped(self):
+        stream = b"\n\n" + ndjson(self.events[0]) + b"\r\n\n" + ndjson(self.events[1]) + b"\n"
+        for name, events in self.decode([stream[:3], stream[3:20], stream[20:]]).items():
+            self.assertEqual(events, self.events[:2], name)
+
+    def test_crlf_and_unterminated_last_line(self):
+        stream = json.dumps(self.events[0]).encode() + b"\r\n" + json.dumps(self.events[1]).encode()
+        for name, events in self.decode([stream]).items():
+            self.assertEqual(events, self.events[:2], name)
+
+    def test_empty_stream(self):
+        for name, events in self.decode([]).items():
+            self.assertEqual(events, [], name)
+        for name, events in self.decode([b"", b"\n"]).items():
+            self.assertEqual(events, [], name)
+
+    def test_stats(self):
+        decoder = vault_caller.NdjsonDecoder()
+        list(decoder.iter_events([ndjson(*self.events)]))
+        self.assertEqual(decoder.stats.events, len(self.events))
+        self.assertEqual(decoder.stats.bytes, len(ndjson(*self.events)))
+
+    def test_invalid_line_raises(self):
+        for name, decoder in self.decoders():
+            with self.assertRaises(ValueError, msg=name):
+                list(decoder.iter_events([ndjson(self.events[0]) + b"{not json\n"]))
+
+
+def balances_event(timestamp, balances=None, postings=(), logs=()):
+    """A simulate result holding {account_id: {address: amount}} balances."""
+    return {
+        "result": {
+            "timestamp": timestamp,
+            "balances": {
+                account_id: {
+                    "balances": [
+                        {"account_address": address, "amount": amount}
+                        for address, amount in addresses.items()
+                    ]
+                }
+                for account_id, addresses in (balances or {}).items()
+            },
+            "posting_instruction_batches": list(postings),
+            "logs": list(logs),
+        }
+    }
+
+
+DECODE_CHUNK_SIZE = vault_caller.DEFAULT_DECODE_CHUNK_SIZE
+
+
+class ProjectionTest(unittest.TestCase):
+    # Balances of main_account only: events that mention it elsewhere are empty once projected.
+    final_balances = vault_caller.Projection(
+        accounts=["main_account"], kinds=["balances"], final_only=True)
+
+    def simulate(self, chunks, projection, decode_chunk_size=DECODE_CHUNK_SIZE):
+        self.transport = FakeTransport(chunks)
+        client = vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", transport=self.transport,
+            decode_chunk_size=decode_chunk_size)
+        return client.simulate_contracts(
+            smart_contracts=[], start_timestamp=START, end_timestamp=START, instructions=[],
+            timeout="10S", projection=projection)
+
+    def test_accounts(self):
+        events = [
+            balances_event("1", {"main_account": {"DEFAULT": "10"}, "1": {"DEFAULT": "-10"}}),
+            balances_event("2", {"1": {"DEFAULT": "-20"}}),
+        ]
+        results = self.simulate(
+            [ndjson(*events)], vault_caller.Projection(accounts=["main_account"]))
+        self.assertEqual(
+            results, [balances_event("1", {"main_account": {"DEFAULT": "10"}})])
+
+    def test_addresses(self):
+        events = [
+            balances_event("1", {"main_account": {"DEFAULT": "10", "DUE": "5"}}),
+            balances_event("2", {"main_account": {"DEFAULT": "20"}}),
+        ]
+        results = self.simulate([ndjson(*events)], vault_caller.Projection(addresses=["DUE"]))
+        self.assertEqual(results, [balances_event("1", {"main_account": {"DUE": "5"}})])
+
+    def test_kinds(self):
+        events = [
+            balances_event("1", {"main_account": {"DEFAULT": "10"}}, logs=["accrued"]),
+            balances_event("2", {"main_account": {"DEFAULT": "10"}}),
+        ]
+        results = self.simulate([ndjson(*events)], vault_caller.Projection(kinds=["logs"]))
+        self.assertEqual(results, [{"result": {"timestamp": "1", "logs": ["accrued"]}}])
+
+    def test_final_only_skips_a_trailing_event_that_does_not_match(self):
+        events = [
+            balances_event("1", {"main_account": {"DEFAULT": "10"}}),
+            balances_event("2", {"main_account": {"DEFAULT": "20"}}),
+            # Mentions main_account, but holds no balances for it.
+            balances_event("3", {"1": {"DEFAULT": "-20"}}, postings=[{"main_account": "x"}]),
+        ]
+        self.assertEqual(
+            self.simulate([ndjson(*events)], self.final_balances),
+            [{"result": {"timestamp": "2", "balances": {
+                "main_account": {"balances": [{"account_address": "DEFAULT", "amount": "20"}]}}}}],
+        )
+
+    def test_final_only_across_many_lines(self):
+        # A small decode chunk size resolves the candidates many times along the stream.
+        events = [
+            balances_event(str(i), {"main_account": {"DEFAULT": str(i)}} if i % 7 == 0 else {},
+                           postings=[{"main_account": "x"}])
+            for i in range(100)
+        ]
+        for chunk_size in [64, 1024, DECODE_CHUNK_SIZE]:
+            results = self.simulate([ndjson(*events)], self.final_balances, chunk_size)
+            self.assertEqual([result["result"]["timestamp"] for result in results], ["98"])
+
+    def test_final_only_without_a_match(self):
+        events = [balances_event("1", {"1": {"DEFAULT": "-20"}}, postings=[{"main_account": "x"}])]
+        self.assertEqual(self.simulate([ndjson(*events)], self.final_balances), [])
+
+    def test_final_only_with_a_trailing_error(self):
+        match = balances_event("1", {"main_account": {"DEFAULT": "10"}})
+        with self.assertRaises(vault_caller.VaultException):
+            self.simulate(
+                [ndjson(match, {"vault_error_code": 3, "message": "bad contract"})],
+                self.final_balances,
+            )
+        with self.assertRaises(ValueError):
+            self.simulate([ndjson(match, {"error": "stream reset"})], self.final_balances)
+
+
+class MetricsSinkTest(unittest.TestCase):
+    def test_record_must_be_implemented(self):
+        with self.assertRaises(TypeError):
+            vault_caller.MetricsSink()
+
+        class Incomplete(vault_caller.MetricsSink):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_custom_sink_receives_every_call(self):
+        class ListSink(vault_caller.MetricsSink):
+            def __init__(self):
+                self.recorded = []
+
+            def record(self, metrics):
+                self.recorded.append(metrics)
+
+        sink = ListSink()
+        client = vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", metrics_sink=sink,
+            transport=FakeTransport([ndjson({"result": {"timestamp": "1"}})]))
+        client.simulate_contracts(
+            smart_contracts=[], start_timestamp=START, end_timestamp=START, instructions=[],
+            timeout="10S")
+        self.assertEqual(len(sink.recorded), 1)
+        self.assertEqual(sink.recorded[0].url, "/v1/contracts:simulate")
+        self.assertEqual(sink.recorded[0].events, 1)
+
+
+class ScriptedTransport(FakeTransport):
+    """Serves the chunks respond(contract code) returns for each request."""
+
+    def __init__(self, respond):
+        super().__init__()
+        self._respond = respond
+
+    def open(self, request):
+        self.requests.append(request)
+        return FakeResponse(self._respond(json.loads(request.body)["smart_contracts"][0]["code"]))
+
+
+class AsyncClientTest(unittest.TestCase):
+    def setUp(self):
+        # Lets stalled reads finish once the test is done with them.
+        self.release = threading.Event()
+        patcher = mock.patch.object(vault_caller, "DEFAULT_DEADLINE_GRACE", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, code):
+        if code == "stall":
+            return [ndjson({"result": {"timestamp": "1"}}), self.release.wait]
+        if code == "bad":
+            return [ndjson({"vault_error_code": 3, "message": "bad contract"})]
+        if code.startswith("sleep"):
+            return [lambda: time.sleep(float(code[5:])), ndjson({"result": {"code": code}})]
+        return [ndjson({"result": {"code": code}})]
+
+    def client(self, max_concurrency=2):
+        client = vault_caller.AsyncClient(
+            core_api_url="http://vault", auth_token="token", max_concurrency=max_concurrency,
+            transport=ScriptedTransport(self.respond))
+        # Cleanups run last in first: stalled reads are released before the pool shuts down.
+        self.addCleanup(client.close)
+        self.addCleanup(self.release.set)
+        return client
+
+    def simulation(self, code, timeout="10S"):
+        return dict(
+            smart_contracts=[{"code": code}], start_timestamp=START, end_timestamp=START,
+            instructions=[], timeout=timeout)
+
+    def collect(self, client, simulations, **kwargs):
+        async def collect():
+            return [pair async for pair in client.simulate_many(simulations, **kwargs)]
+
+        return asyncio.run(collect())
+
+    def test_results_and_errors(self):
+        results = dict(self.collect(
+            self.client(), [self.simulation("a"), self.simulation("bad"), self.simulation("b")],
+            return_exceptions=True))
+        self.assertEqual(results[0], [{"result": {"code": "a"}}])
+        self.assertIsInstance(results[1], vault_caller.VaultException)
+        self.assertEqual(results[2], [{"result": {"code": "b"}}])
+
+        with self.assertRaises(vault_caller.VaultException):
+            self.collect(self.client(), [self.simulation("bad")])
+
+    def test_stalled_stream_raises_at_its_deadline(self):
+        started = time.monotonic()
+        with self.assertRaises(vault_caller.DeadlineExceeded):
+            asyncio.run(self.client().simulate_contracts(**self.simulation("stall", "200m")))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_deadline_starts_when_a_worker_picks_the_call_up(self):
+        # The second call waits 0.3s for the only worker, then takes 0.3s of its 0.5s deadline.
+        results = dict(self.collect(
+            self.client(max_concurrency=1),
+            [self.simulation("sleep0.3", "500m"), self.simulation("sleep0.3", "500m")],
+            concurrency=2, return_exceptions=True))
+        self.assertEqual(results[1], [{"result": {"code": "sleep0.3"}}])
+
+    def test_cancellation_is_not_returned_as_a_result(self):
+        client = self.client()
+        pairs = []
+
+        async def consume():
+            async for pair in client.simulate_many(
+                    [self.simulation("a"), self.simulation("stall")], return_exceptions=True):
+                pairs.append(pair)
+
+        async def cancel_while_stalled():
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await task
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel_while_stalled())
+        self.assertEqual(pairs, [(0, [{"result": {"code": "a"}}])])
+
+
+class RecordReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def client(self, transport):
+        return vault_caller.Client(
+            core_api_url="http://vault", auth_token="token", transport=transport)
+
+    def simulate(self, client, instructions=()):
+        return client.iter_simulate_contracts(
+            smart_contracts=[], start_timestamp=START, end_timestamp=START,
+            instructions=list(instructions), timeout="10S")
+
+    def test_replay_serves_what_was_recorded(self):
+        events = [{"result": {"timestamp": str(i)}} for i in range(3)]
+        live = FakeTransport([ndjson(*events[:2]), ndjson(events[2])])
+        self.assertEqual(list(self.simulate(self.client(
+            vault_caller.RecordingTransport(self.directory, live)))), events)
+
+        replayed = list(self.simulate(self.client(vault_caller.ReplayTransport(self.directory))))
+        self.assertEqual(replayed, events)
+        self.assertEqual(os.listdir(self.directory), [live.requests[0].key + ".ndjson"])
+
+    def test_abandoned_stream_is_recorded_in_full(self):
+        events = [{"result": {"timestamp": str(i)}} for i in range(3)]
+        live = FakeTransport([ndjson(event) for event in events])
+        stream = self.simulate(self.client(vault_caller.RecordingTransport(self.directory, live)))
+        next(stream)
+        stream.close()
+
+        replayed = list(self.simulate(self.client(vault_caller.ReplayTransport(self.directory))))
+        self.assertEqual(replayed, events)
+
+    def test_failed_responses_are_not_recorded(self):
+        live = FakeTransport([b"Service Unavailable"], status_code=503)
+        recording = vault_caller.RecordingTransport(self.directory, live)
+        with self.assertRaises(ValueError):
+            list(self.simulate(self.client(recording)))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_missing_recording(self):
+        replay = self.client(vault_caller.ReplayTransport(self.directory))
+        with self.assertRaises(vault_caller.RecordingNotFound) as context:
+            list(self.simulate(replay))
+        self.assertIn("VAULT_TRANSPORT=record", str(context.exception))
+
+    def test_transport_from_environment(self):
+        for mode, transport_type in [
+            (None, vault_caller.HttpTransport),
+            ("live", vault_caller.HttpTransport),
+            ("record", vault_caller.RecordingTransport),
+            ("REPLAY", vault_caller.ReplayTransport),
+        ]:
+            environment = {} if mode is None else {vault_caller.TRANSPORT_MODE_ENV: mode}
+            with mock.patch.dict(os.environ, environment):
+                if mode is None:
+                    os.environ.pop(vault_caller.TRANSPORT_MODE_ENV, None)
+                transport = vault_caller.transport_from_environment(self.directory)
+            self.assertIsInstance(transport, transport_type, mode)
+            transport.close()
+
+    def test_unknown_transport_mode_is_rejected(self):
+        with mock.patch.dict(os.environ, {vault_caller.TRANSPORT_MODE_ENV: "replya"}):
+            with self.assertRaises(ValueError) as context:
+                vault_caller.transport_from_environment(self.directory)
+        self.assertIn("replya", str(context.exception))
+
+
+class Rfc3339Test(unittest.TestCase):
+    def test_timezone_aware_datetimes_are_sent_in_utc(self):
+        paris = timezone(timedelta(hours=1))
+        self.assertEqual(
+            vault_caller._datetime_to_rfc_3339(datetime(2019, 1, 1, 9, tzinfo=paris)),
+            "2019-01-01T08:00:00+00:00",
+        )
+        self.assertEqual(
+            vault_caller._datetime_to_rfc_3339(datetime(2019, 1, 1, 0, 30, tzinfo=paris)),
+            "2018-12-31T23:30:00+00:00",
+        )
+        self.assertEqual(vault_caller._datetime_to_rfc_3339(START), "2019-01-01T00:00:00+00:00")
+
+    def test_naive_datetimes_are_rejected(self):
+        with self.assertRaises(ValueError):
+            vault_caller._datetime_to_rfc_3339(datetime(2019, 1, 1))
+
+    def test_same_instant_gives_the_same_payload(self):
+        new_york = timezone(timedelta(hours=-5))
+        local = START.astimezone(new_york)
+        instruction = {"create_account": {"id": "main_account"}}
+        payloads = [
+            vault_caller._serialize_simulate_payload(
+                [], start, start, [vault_caller.SimulationInstruction(start, instruction)])
+            for start in [START, local]
+        ]
+        self.assertEqual(payloads[0], payloads[1])
+        self.assertEqual(
+            payloads[0],
+            json.dumps(vault_caller._simulate_payload(
+                [], START, START, [vault_caller.SimulationInstruction(START, instruction)]
+            )).encode(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()